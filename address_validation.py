@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Address Validation for New Connections
+Stateless Retry tokens and per-source Initial rate limiting
+
+Without validation the server builds a full QuicConnection (TLS state,
+crypto contexts, stream tables) for every Initial that arrives, so a flood
+of spoofed Initials costs CPU and memory before any address is proven.
+
+- RetryTokenHandler issues HMAC-SHA256 Retry tokens bound to the client
+  address and connection IDs. Secrets rotate; the previous secret stays
+  valid for one more period so tokens issued just before a rotation work.
+  (aioquic's built-in handler RSA-encrypts each token, which costs more
+  than the handshake it protects.)
+- TokenBucketTable rate-limits Initials per source address, in bounded
+  memory.
+- AddressValidation decides what to do with each new Initial. Retry can
+  be off, always on, or on only while the Initial rate is above a load
+  threshold; the per-source limiter is only enforced above that threshold.
+- MigrationRateLimiter caps how often an established connection may move
+  to a new address, per connection and per source prefix, since every new
+  path costs PATH_CHALLENGE traffic, path state and tracker bookkeeping.
+"""
+
+import hashlib
+import hmac
+import ipaddress
+import os
+import struct
+import time
+from typing import Dict, Hashable, Optional, Tuple
+
+from aioquic.quic.retry import encode_address
+
+TOKEN_HEADER = struct.Struct("<BQ")  # key id, issue time (ms)
+TOKEN_MAC_LENGTH = 16
+KEYS_HEADER = struct.Struct("<Bd")  # current key id, last rotation (unix time)
+
+RETRY_MODES = ["off", "auto", "always"]
+
+
+class RetryTokenHandler:
+    """Stateless HMAC Retry tokens with rotating secrets
+
+    Same interface as aioquic.quic.retry.QuicRetryTokenHandler.
+    """
+
+    def __init__(self, rotation_interval: float = 60.0, lifetime: float = 10.0):
+        self.rotation_interval = rotation_interval
+        self.lifetime = lifetime
+        self._keys: Dict[int, bytes] = {}
+        self._key_id = 0
+        self._rotated_at = 0.0
+        self._rotate(time.time())
+
+    def _rotate(self, now: float):
+        self._key_id = (self._key_id + 1) % 256
+        self._keys = {
+            self._key_id: os.urandom(32),
+            **{k: v for k, v in self._keys.items() if k == (self._key_id - 1) % 256},
+        }
+        self._rotated_at = now
+
+    def dump_keys(self) -> bytes:
+        """Current and previous secrets, for restoring after a restart"""
+        return KEYS_HEADER.pack(self._key_id, self._rotated_at) + b"".join(
+            bytes([key_id]) + key for key_id, key in self._keys.items())
+
+    def restore_keys(self, data: bytes):
+        if len(data) < KEYS_HEADER.size or (len(data) - KEYS_HEADER.size) % 33:
+            raise ValueError("malformed Retry key data")
+        key_id, rotated_at = KEYS_HEADER.unpack_from(data)
+        keys = {data[i]: data[i + 1:i + 33] for i in range(KEYS_HEADER.size, len(data), 33)}
+        if key_id not in keys:
+            raise ValueError("current Retry key missing")
+        self._key_id, self._rotated_at, self._keys = key_id, rotated_at, keys
+
+    def _mac(self, key: bytes, addr, body: bytes) -> bytes:
+        return hmac.new(key, encode_address(addr) + body, hashlib.sha256).digest()[:TOKEN_MAC_LENGTH]
+
+    def create_token(self, addr, original_destination_connection_id: bytes, retry_source_connection_id: bytes) -> bytes:
+        now = time.time()
+        if now - self._rotated_at >= self.rotation_interval:
+            self._rotate(now)
+        body = (
+            TOKEN_HEADER.pack(self._key_id, int(now * 1000))
+            + bytes([len(original_destination_connection_id)]) + original_destination_connection_id
+            + bytes([len(retry_source_connection_id)]) + retry_source_connection_id
+        )
+        return body + self._mac(self._keys[self._key_id], addr, body)
+
+    def validate_token(self, addr, token: bytes) -> Tuple[bytes, bytes]:
+        """Return (original DCID, retry SCID); raises ValueError if invalid"""
+        if len(token) < TOKEN_HEADER.size + 2 + TOKEN_MAC_LENGTH:
+            raise ValueError("token too short")
+        body, mac = token[:-TOKEN_MAC_LENGTH], token[-TOKEN_MAC_LENGTH:]
+        key_id, issued_ms = TOKEN_HEADER.unpack_from(body)
+        key = self._keys.get(key_id)
+        if key is None or not hmac.compare_digest(mac, self._mac(key, addr, body)):
+            raise ValueError("bad token MAC")
+        age = time.time() - issued_ms / 1000
+        if not -1.0 <= age <= self.lifetime:
+            raise ValueError("token expired")
+
+        try:
+            pos = TOKEN_HEADER.size
+            odcid = body[pos + 1:pos + 1 + body[pos]]
+            pos += 1 + len(odcid)
+            rscid = body[pos + 1:pos + 1 + body[pos]]
+        except IndexError:
+            raise ValueError("malformed token")
+        if pos + 1 + len(rscid) != len(body):
+            raise ValueError("malformed token")
+        return odcid, rscid
+
+
+class TokenBucketTable:
+    """Token buckets keyed by source, refilled at `rate` per second up to `burst`
+
+    When more than `max_entries` keys are tracked, full (idle) buckets are
+    dropped; if that is not enough, the table starts over.
+    """
+
+    def __init__(self, rate: float, burst: float, max_entries: int = 65536):
+        self.rate = rate
+        self.burst = burst
+        self.max_entries = max_entries
+        self._buckets: Dict[Hashable, list] = {}  # key -> [tokens, last refill]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def bucket(self, key: Hashable, now: float) -> list:
+        """The refilled [tokens, last refill] bucket for `key`"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_entries:
+                self._evict(now)
+            bucket = self._buckets[key] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def allow(self, key: Hashable, now: float, cost: float = 1.0) -> bool:
+        bucket = self.bucket(key, now)
+        if bucket[0] < cost:
+            return False
+        bucket[0] -= cost
+        return True
+
+    def _evict(self, now: float):
+        refill_time = self.burst / self.rate if self.rate else 0.0
+        self._buckets = {k: b for k, b in self._buckets.items() if now - b[1] < refill_time}
+        if len(self._buckets) >= self.max_entries:
+            self._buckets.clear()
+
+
+class RateMeter:
+    """Events per second over the current and previous one-second window"""
+
+    def __init__(self, window: float = 1.0):
+        self.window = window
+        self._start = 0.0
+        self._count = 0
+        self._previous = 0.0
+
+    def add(self, now: float):
+        if now - self._start >= self.window:
+            elapsed = now - self._start
+            self._previous = self._count / self.window if elapsed < 2 * self.window else 0.0
+            self._start = now
+            self._count = 0
+        self._count += 1
+
+    def rate(self, now: float) -> float:
+        elapsed = now - self._start
+        if elapsed >= 2 * self.window:
+            return 0.0
+        if elapsed >= self.window:
+            return self._count / self.window
+        return max(self._previous, self._count / self.window)
+
+
+class AddressValidation:
+    """Admission policy for Initials that would create a new connection"""
+
+    ACCEPT, RETRY, DROP, INVALID = "accept", "retry", "drop", "invalid"
+
+    def __init__(
+        self,
+        retry: str = "off",
+        load_threshold: float = 200.0,
+        source_rate: float = 20.0,
+        source_burst: float = 40.0,
+        rotation_interval: float = 60.0,
+        token_lifetime: float = 10.0,
+    ):
+        if retry not in RETRY_MODES:
+            raise ValueError(f"unknown retry mode '{retry}' (choose from: {', '.join(RETRY_MODES)})")
+        self.retry = retry
+        self.load_threshold = load_threshold
+        self.tokens = RetryTokenHandler(rotation_interval, token_lifetime) if retry != "off" else None
+        self.limiter = TokenBucketTable(source_rate, source_burst) if source_rate > 0 else None
+        self.initial_rate = RateMeter()
+        self.counters = {"initials": 0, "accepted": 0, "retries_sent": 0,
+                         "tokens_validated": 0, "invalid_tokens": 0, "rate_limited": 0}
+
+    def under_load(self, now: float) -> bool:
+        return self.initial_rate.rate(now) > self.load_threshold
+
+    def check(self, addr, token: bytes, destination_cid: bytes) -> Tuple[str, Optional[bytes], Optional[bytes]]:
+        """Return (decision, original DCID, retry SCID) for a new Initial
+
+        Only Initials without a token count towards the load. Retry is
+        stateless, so the per-source limit applies where connection state
+        would be created: after a valid token, or when no Retry is sent.
+        """
+        now = time.monotonic()
+        counters = self.counters
+        counters["initials"] += 1
+        original_cid, retry_cid = destination_cid, None
+
+        if token and self.tokens is not None:
+            try:
+                original_cid, retry_cid = self.tokens.validate_token(addr, token)
+            except ValueError:
+                counters["invalid_tokens"] += 1
+                return self.INVALID, None, None
+            counters["tokens_validated"] += 1
+            loaded = self.under_load(now)
+        else:
+            self.initial_rate.add(now)
+            loaded = self.under_load(now)
+            if self.tokens is not None and (self.retry == "always" or loaded):
+                counters["retries_sent"] += 1
+                return self.RETRY, None, None
+
+        if loaded and self.limiter is not None and not self.limiter.allow(addr[0], now):
+            counters["rate_limited"] += 1
+            return self.DROP, None, None
+
+        counters["accepted"] += 1
+        return self.ACCEPT, original_cid, retry_cid
+
+    def snapshot(self) -> Dict[str, float]:
+        now = time.monotonic()
+        return {
+            **self.counters,
+            "initial_rate": self.initial_rate.rate(now),
+            "under_load": self.under_load(now),
+            "tracked_sources": len(self.limiter) if self.limiter is not None else 0,
+        }
+
+
+def source_prefix(host: str) -> str:
+    """/24 for IPv4 (including v4-mapped), /48 for IPv6"""
+    if "." in host:
+        return host.rpartition(":")[2].rpartition(".")[0]
+    return str(ipaddress.ip_network(f"{host}/48", strict=False).network_address)
+
+
+class MigrationRateLimiter:
+    """Token buckets for new paths, per connection and per source prefix
+
+    A rate of 0 disables that bucket. A token is only taken once both
+    buckets have one, so a path refused by its prefix does not also use up
+    its connection's budget. A path that is over the limit is dropped, so it
+    is only validated once the client retries after its bucket has refilled.
+    """
+
+    def __init__(
+        self,
+        rate: float = 2.0,
+        burst: float = 5.0,
+        prefix_rate: float = 50.0,
+        prefix_burst: float = 100.0,
+    ):
+        self.per_connection = TokenBucketTable(rate, burst) if rate > 0 else None
+        self.per_prefix = TokenBucketTable(prefix_rate, prefix_burst) if prefix_rate > 0 else None
+        self.counters = {"new_paths": 0, "paths_allowed": 0,
+                         "limited_by_connection": 0, "limited_by_prefix": 0}
+
+    def allow(self, connection_key: Hashable, addr) -> bool:
+        now = time.monotonic()
+        counters = self.counters
+        counters["new_paths"] += 1
+        buckets = []
+        if self.per_connection is not None:
+            buckets.append(self.per_connection.bucket(connection_key, now))
+            if buckets[-1][0] < 1:
+                counters["limited_by_connection"] += 1
+                return False
+        if self.per_prefix is not None:
+            buckets.append(self.per_prefix.bucket(source_prefix(addr[0]), now))
+            if buckets[-1][0] < 1:
+                counters["limited_by_prefix"] += 1
+                return False
+        for bucket in buckets:
+            bucket[0] -= 1
+        counters["paths_allowed"] += 1
+        return True
+
+    def snapshot(self) -> Dict[str, float]:
+        return dict(self.counters)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Tuning Profile Benchmark Matrix
+Runs the load test against every tuning profile and picks the best per workload
+
+For each profile and workload a fresh quic_server.py is started with
+`--profile`, the workload is run from the load generator with the same
+profile, and the winner for each workload is chosen by that workload's
+target metric. A fresh server per workload keeps one workload's RSS
+high-water mark out of the next one's memory figure.
+"""
+
+import argparse
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List
+
+from load_test import ServerProcess, run_load_test
+from tuning_profiles import PROFILES
+
+
+@dataclass
+class Workload:
+    """A load-test shape and the metric it is judged by"""
+
+    name: str
+    description: str
+    params: Dict
+    metric: str
+    lower_is_better: bool
+
+
+WORKLOADS = [
+    Workload(
+        name="request-response",
+        description="20 connections x 50 small sequential requests",
+        params={"connections": 20, "messages": 50, "message_size": 64, "concurrency": 20},
+        metric="latency_p99",
+        lower_is_better=True,
+    ),
+    Workload(
+        name="burst",
+        description="100 connections x 20 ~1KB requests, all at once",
+        params={"connections": 100, "messages": 20, "message_size": 1000, "concurrency": 100},
+        metric="requests_per_second",
+        lower_is_better=False,
+    ),
+    Workload(
+        name="many-idle",
+        description="300 connections, 2 requests each with 1s idle between",
+        params={"connections": 300, "messages": 2, "message_size": 64, "concurrency": 300, "think_time": 1.0},
+        metric="server_rss_growth_mb",
+        lower_is_better=True,
+    ),
+]
+
+METRIC_FORMATS = {
+    "latency_p99": lambda v: f"{v * 1000:.1f}ms",
+    "handshake_p99": lambda v: f"{v * 1000:.1f}ms",
+    "requests_per_second": lambda v: f"{v:,.0f}/s",
+    "server_rss_growth_mb": lambda v: f"+{v:.1f}MB",
+}
+
+
+async def _watch_rss(server: ServerProcess, samples: List[int], interval: float = 0.1):
+    while True:
+        rss = server.rss_bytes()
+        if rss:
+            samples.append(rss)
+        await asyncio.sleep(interval)
+
+
+async def run_matrix(
+    profiles: List[str],
+    workloads: List[Workload],
+    base_port: int = 14433,
+) -> Dict[str, Dict[str, Dict]]:
+    """Return results[profile][workload] -> load test summary plus server RSS growth"""
+    results: Dict[str, Dict[str, Dict]] = {}
+    port = base_port
+
+    for profile in profiles:
+        results[profile] = {}
+        for workload in workloads:
+            async with ServerProcess(port=port, profile=profile) as server:
+                baseline = server.rss_bytes()
+                samples: List[int] = []
+                watcher = asyncio.create_task(_watch_rss(server, samples))
+                try:
+                    outcome = await run_load_test(port=server.port, profile=profile, **workload.params)
+                finally:
+                    watcher.cancel()
+            port += 1
+
+            summary = outcome.summary()
+            # peak RSS over the idle server just before the workload started
+            summary["server_rss_growth_mb"] = (
+                (max(samples) - baseline) / 2**20 if samples and baseline else float("nan")
+            )
+            results[profile][workload.name] = summary
+            print(f"   {profile:24} {workload.name:18} {summary['requests_per_second']:8,.0f} req/s "
+                  f"| errors {summary['errors']}")
+
+    return results
+
+
+def best_profiles(results: Dict[str, Dict[str, Dict]], workloads: List[Workload]) -> Dict[str, str]:
+    """Pick the winning profile per workload, ignoring runs that had errors"""
+    best = {}
+    for workload in workloads:
+        candidates = [
+            (summary[workload.metric], profile)
+            for profile, by_workload in results.items()
+            for name, summary in by_workload.items()
+            if name == workload.name and not summary["errors"] and workload.metric in summary
+        ]
+        if candidates:
+            pick = min(candidates) if workload.lower_is_better else max(candidates)
+            best[workload.name] = pick[1]
+    return best
+
+
+def print_matrix(results: Dict[str, Dict[str, Dict]], workloads: List[Workload]):
+    best = best_profiles(results, workloads)
+
+    print("\n" + "=" * 70)
+    print("🎛️  TUNING PROFILE BENCHMARK MATRIX")
+    print("=" * 70)
+    for workload in workloads:
+        direction = "lower" if workload.lower_is_better else "higher"
+        print(f"\n📌 {workload.name}: {workload.description}")
+        print(f"   judged by {workload.metric} ({direction} is better)")
+        for profile, by_workload in results.items():
+            summary = by_workload[workload.name]
+            value = summary.get(workload.metric)
+            shown = METRIC_FORMATS[workload.metric](value) if value is not None else "n/a"
+            marker = "🏆" if best.get(workload.name) == profile else "  "
+            print(
+                f"   {marker} {profile:24} {shown:>12} | p99 latency "
+                f"{summary.get('latency_p99', 0) * 1000:7.1f}ms | {summary['requests_per_second']:8,.0f} req/s "
+                f"| errors {summary['errors']}"
+            )
+
+    print("\n" + "-" * 70)
+    print("Recommended profiles:")
+    for workload in workloads:
+        print(f"   {workload.name:18} → {best.get(workload.name, 'no error-free run')}")
+    print("=" * 70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every tuning profile across workloads")
+    parser.add_argument("--profile", action="append", choices=list(PROFILES), help="profile to include (repeatable)")
+    parser.add_argument("--workload", action="append", choices=[w.name for w in WORKLOADS],
+                        help="workload to include (repeatable)")
+    parser.add_argument("--base-port", type=int, default=14433, help="first UDP port for server instances")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    profiles = args.profile or list(PROFILES)
+    workloads = [w for w in WORKLOADS if not args.workload or w.name in args.workload]
+
+    print(f"\n🏃 Benchmarking {len(profiles)} profile(s) x {len(workloads)} workload(s)\n")
+    results = asyncio.run(run_matrix(profiles, workloads, base_port=args.base_port))
+    print_matrix(results, workloads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Congestion Control Migration Harness
+Measures the throughput cost of resetting congestion control after migration
+
+A client uploads bulk data to quic_server.py (its SINK mode) and migrates
+between two local addresses partway through. RFC 9000 section 9.4 says the
+sender must reset its congestion controller and RTT estimate on a new path;
+aioquic keeps a single controller per connection, so the harness applies the
+reset itself. With `--cache` the controller state seen on a path is saved and
+restored when the connection returns to that path.
+
+cwnd, bytes in flight and goodput are sampled throughout, and the dip and
+recovery time after each migration are reported per algorithm.
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import math
+import os
+import statistics
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from aioquic.asyncio import connect
+from aioquic.quic.congestion.base import _factories as CONGESTION_CONTROL_ALGORITHMS
+from aioquic.quic.congestion.base import create_congestion_control
+from aioquic.quic.connection import QuicConnection
+
+from load_test import ServerProcess
+from quic_client import QuicClientProtocol, rebind
+from quic_server import SINK_PREFIX
+from tuning_profiles import PROFILES, get_profile
+
+# Migrations alternate between these local addresses so that, with caching,
+# every path after the second one has been seen before.
+PATH_ADDRESSES = ["127.0.0.1", "127.0.0.2"]
+CHUNK_SIZE = 64 * 1024
+SEND_BUFFER_TARGET = 4 * 1024 * 1024
+
+_RTT_FIELDS = ("_rtt_initialized", "_rtt_latest", "_rtt_min", "_rtt_smoothed", "_rtt_variance")
+
+
+@dataclass
+class Sample:
+    """One point of the cwnd / goodput time series"""
+
+    time: float
+    cwnd: int
+    bytes_in_flight: int
+    acked: int
+    goodput_mbps: float
+    path: str
+
+
+@dataclass
+class RunResult:
+    algorithm: str
+    cache: bool
+    samples: List[Sample] = field(default_factory=list)
+    migrations: List[Tuple[float, str, str]] = field(default_factory=list)  # (time, old, new)
+    bytes_acked: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def goodput_mbps(self) -> float:
+        return self.bytes_acked * 8 / self.elapsed / 1e6 if self.elapsed else 0.0
+
+
+class PathStateCache:
+    """Saves congestion controller and RTT state per path"""
+
+    def __init__(self):
+        self._states: Dict[str, tuple] = {}
+
+    def save(self, path: str, quic: QuicConnection):
+        loss = quic._loss
+        self._states[path] = (loss._cc, tuple(getattr(loss, name) for name in _RTT_FIELDS))
+
+    def restore(self, path: str, quic: QuicConnection) -> bool:
+        state = self._states.get(path)
+        if state is None:
+            return False
+        cc, rtt = state
+        _install_controller(quic, cc)
+        for name, value in zip(_RTT_FIELDS, rtt):
+            setattr(quic._loss, name, value)
+        return True
+
+
+def _install_controller(quic: QuicConnection, cc):
+    # Packets already in flight are still accounted against the new
+    # controller, otherwise their ACKs drive bytes_in_flight negative.
+    cc.bytes_in_flight = quic._loss._cc.bytes_in_flight
+    quic._loss._cc = cc
+
+
+def reset_congestion_state(quic: QuicConnection):
+    """Reset the congestion controller and RTT estimate as for a new path"""
+    configuration = quic._configuration
+    _install_controller(quic, create_congestion_control(
+        configuration.congestion_control_algorithm,
+        max_datagram_size=quic._max_datagram_size,
+    ))
+    loss = quic._loss
+    loss._rtt_initialized = False
+    loss._rtt_latest = 0.0
+    loss._rtt_min = math.inf
+    loss._rtt_smoothed = 0.0
+    loss._rtt_variance = 0.0
+
+
+async def run_transfer(
+    algorithm: str,
+    cache: bool,
+    port: int,
+    duration: float,
+    migrations: int,
+    profile: str,
+    sample_interval: float = 0.01,
+) -> RunResult:
+    """Upload for `duration` seconds, migrating `migrations` times at even intervals"""
+    tuning = get_profile(profile)
+    configuration = tuning.configuration(
+        is_client=True,
+        verify_mode=False,
+        congestion_control_algorithm=algorithm,
+    )
+    result = RunResult(algorithm=algorithm, cache=cache)
+    path_cache = PathStateCache()
+    migrate_at = [duration * (i + 1) / (migrations + 1) for i in range(migrations)]
+    chunk = b"\0" * CHUNK_SIZE
+    transports = []
+
+    async with connect(
+        PATH_ADDRESSES[0],
+        port,
+        configuration=configuration,
+        create_protocol=partial(QuicClientProtocol, profile=tuning),
+    ) as protocol:
+        quic = protocol._quic
+        stream_id = quic.get_next_available_stream_id()
+        quic.send_stream_data(stream_id, SINK_PREFIX)
+        sender = quic._streams[stream_id].sender
+
+        path_index = 0
+        start = time.perf_counter()
+        last_time, last_acked = start, 0
+
+        while True:
+            now = time.perf_counter()
+            elapsed = now - start
+            if elapsed >= duration:
+                break
+
+            if migrate_at and elapsed >= migrate_at[0]:
+                migrate_at.pop(0)
+                old_path = PATH_ADDRESSES[path_index]
+                path_index = (path_index + 1) % len(PATH_ADDRESSES)
+                new_path = PATH_ADDRESSES[path_index]
+
+                path_cache.save(old_path, quic)
+                if not (cache and path_cache.restore(new_path, quic)):
+                    reset_congestion_state(quic)
+                transports.append(await rebind(protocol, local_host=new_path))
+                result.migrations.append((elapsed, old_path, new_path))
+
+            # keep the send buffer topped up without buffering the whole transfer
+            while sender._buffer_stop - sender._buffer_start < SEND_BUFFER_TARGET:
+                quic.send_stream_data(stream_id, chunk)
+            protocol.transmit()
+
+            await asyncio.sleep(sample_interval)
+
+            now = time.perf_counter()
+            acked = max(sender._buffer_start - len(SINK_PREFIX), 0)
+            interval = now - last_time
+            result.samples.append(Sample(
+                time=now - start,
+                cwnd=quic._loss.congestion_window,
+                bytes_in_flight=quic._loss.bytes_in_flight,
+                acked=acked,
+                goodput_mbps=(acked - last_acked) * 8 / interval / 1e6 if interval else 0.0,
+                path=PATH_ADDRESSES[path_index],
+            ))
+            last_time, last_acked = now, acked
+
+        result.elapsed = time.perf_counter() - start
+        result.bytes_acked = last_acked
+
+        # stop feeding and drop whatever is still queued; we only measure goodput
+        protocol.close()
+
+    for transport in transports:
+        transport.close()
+    return result
+
+
+def migration_impact(result: RunResult, window: float = 0.5, recovered_fraction: float = 0.9) -> List[Dict]:
+    """Throughput dip and recovery time around each migration
+
+    The baseline is the mean goodput over `window` seconds before the
+    migration; recovery is the first time a `window`/5 moving average gets
+    back to `recovered_fraction` of that baseline.
+    """
+    impacts = []
+    samples = result.samples
+    smooth = max(int(window / 5 / max(samples[1].time - samples[0].time, 1e-3)), 1) if len(samples) > 1 else 1
+
+    for when, old, new in result.migrations:
+        before = [s.goodput_mbps for s in samples if when - window <= s.time < when]
+        after = [s for s in samples if when <= s.time < when + 4 * window]
+        if not before or not after:
+            continue
+        baseline = statistics.mean(before)
+        minimum = min(s.goodput_mbps for s in after[:max(smooth, 1) * 5])
+        cwnd_after = min(s.cwnd for s in after[:max(smooth, 1) * 5])
+
+        recovery = None
+        for i in range(len(after)):
+            avg = statistics.mean(s.goodput_mbps for s in after[i:i + smooth])
+            if avg >= recovered_fraction * baseline:
+                recovery = after[i].time - when
+                break
+
+        impacts.append({
+            "time": when,
+            "path": f"{old} -> {new}",
+            "baseline_mbps": baseline,
+            "min_mbps": minimum,
+            "dip_percent": 100 * (1 - minimum / baseline) if baseline else 0.0,
+            "min_cwnd": cwnd_after,
+            "recovery_s": recovery,
+        })
+    return impacts
+
+
+def write_csv(result: RunResult, directory: str):
+    os.makedirs(directory, exist_ok=True)
+    name = f"{result.algorithm}{'-cached' if result.cache else ''}.csv"
+    with open(os.path.join(directory, name), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["time", "cwnd", "bytes_in_flight", "acked", "goodput_mbps", "path"])
+        for s in result.samples:
+            writer.writerow([f"{s.time:.4f}", s.cwnd, s.bytes_in_flight, s.acked, f"{s.goodput_mbps:.3f}", s.path])
+
+
+def print_report(results: List[RunResult]):
+    print("\n" + "=" * 70)
+    print("📉 POST-MIGRATION CONGESTION CONTROL RECOVERY")
+    print("=" * 70)
+
+    for result in results:
+        label = f"{result.algorithm}{' + path cache' if result.cache else ''}"
+        print(f"\n📌 {label}: {result.goodput_mbps:.1f} Mbit/s average over {result.elapsed:.1f}s")
+        for impact in migration_impact(result):
+            recovery = f"{impact['recovery_s'] * 1000:7.0f}ms" if impact["recovery_s"] is not None else "   never"
+            print(
+                f"   t={impact['time']:5.2f}s {impact['path']:24} "
+                f"dip {impact['dip_percent']:5.1f}% (min {impact['min_mbps']:7.1f} of "
+                f"{impact['baseline_mbps']:7.1f} Mbit/s) | min cwnd {impact['min_cwnd']:>8} | recovery {recovery}"
+            )
+    print("\n" + "=" * 70 + "\n")
+
+
+async def run_harness(
+    algorithms: List[str],
+    cache_modes: List[bool],
+    duration: float,
+    migrations: int,
+    profile: str,
+    port: int,
+) -> List[RunResult]:
+    results = []
+    async with ServerProcess(port=port, profile=profile):
+        for algorithm in algorithms:
+            for cache in cache_modes:
+                print(f"   running {algorithm}{' (cached)' if cache else ''} for {duration:.0f}s ...")
+                results.append(await run_transfer(algorithm, cache, port, duration, migrations, profile))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare congestion controllers across forced migrations")
+    parser.add_argument("--algorithm", action="append", choices=sorted(CONGESTION_CONTROL_ALGORITHMS),
+                        help="algorithm to test (repeatable, default: all aioquic provides)")
+    parser.add_argument("--cache", choices=["off", "on", "both"], default="both",
+                        help="reuse cached controller state for previously seen paths")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per transfer")
+    parser.add_argument("--migrations", type=int, default=4)
+    parser.add_argument("--profile", default="bulk-throughput", choices=list(PROFILES))
+    parser.add_argument("--port", type=int, default=14533)
+    parser.add_argument("--csv", help="directory for per-run time series")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    algorithms = args.algorithm or sorted(CONGESTION_CONTROL_ALGORITHMS)
+    cache_modes = {"off": [False], "on": [True], "both": [False, True]}[args.cache]
+
+    results = asyncio.run(run_harness(algorithms, cache_modes, args.duration, args.migrations,
+                                      args.profile, args.port))
+    if args.csv:
+        for result in results:
+            write_csv(result, args.csv)
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Rolling Restart Benchmark
+Compares a graceful drain with a hard stop while clients are busy
+
+Two quic_server.py instances run side by side: the one being restarted and
+its successor. Clients send a steady stream of echo requests to the first.
+Halfway through, it is either sent SIGTERM (drain mode: refuse new
+connections, GOAWAY pointing at the successor, finish in-flight streams) or
+killed outright, in which case clients only notice through request timeouts
+and then fail over.
+
+Reported per mode: how many clients got through without a failed request,
+and the p99 of the longest gap each client saw between two responses.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import signal
+import statistics
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Dict, List, Tuple
+
+from aioquic.asyncio import connect
+
+from load_test import ServerProcess, percentile
+from quic_client import QuicClientProtocol, send_message
+from tuning_profiles import DEFAULT_PROFILE, PROFILES, get_profile
+
+
+@dataclass
+class ClientRecord:
+    responses: List[float] = field(default_factory=list)  # monotonic time of each response
+    failures: List[float] = field(default_factory=list)
+    goaways: int = 0
+
+
+async def _client(
+    record: ClientRecord,
+    primary: Tuple[str, int],
+    fallback: Tuple[str, int],
+    profile: str,
+    interval: float,
+    timeout: float,
+    stop: asyncio.Event,
+):
+    tuning = get_profile(profile)
+    configuration = tuning.configuration(is_client=True, verify_mode=False)
+    target = primary
+    closing = []
+
+    while not stop.is_set():
+        try:
+            async with contextlib.AsyncExitStack() as stack:
+                async with asyncio.timeout(timeout):
+                    protocol = await stack.enter_async_context(connect(
+                        *target,
+                        configuration=configuration,
+                        create_protocol=partial(QuicClientProtocol, profile=tuning),
+                    ))
+                while not stop.is_set() and not protocol.goaway_received.is_set():
+                    await asyncio.wait_for(send_message(protocol, "ping"), timeout)
+                    record.responses.append(time.monotonic())
+                    await asyncio.sleep(interval)
+
+                if protocol.goaway_received.is_set():
+                    # move on right away; the old connection closes in the background
+                    record.goaways += 1
+                    target = protocol.goaway_target or target
+                    closing.append(asyncio.ensure_future(stack.pop_all().aclose()))
+        except Exception:
+            record.failures.append(time.monotonic())
+            target = fallback
+
+    await asyncio.gather(*closing, return_exceptions=True)
+
+
+def _longest_gap(record: ClientRecord, since: float) -> float:
+    times = [t for t in record.responses if t >= since]
+    if len(times) < 2:
+        return float("inf")
+    points = [since] + times
+    return max(b - a for a, b in zip(points, points[1:]))
+
+
+async def run_restart(
+    mode: str,
+    clients: int,
+    profile: str,
+    ports: Tuple[int, int],
+    interval: float,
+    timeout: float,
+    drain_timeout: float,
+    warmup: float,
+    observe: float,
+    host: str = "127.0.0.1",
+) -> Dict:
+    """Restart the primary server under load, with `mode` "drain" or "kill" """
+    primary, successor = (host, ports[0]), (host, ports[1])
+    records = [ClientRecord() for _ in range(clients)]
+    stop = asyncio.Event()
+
+    async with ServerProcess(port=ports[1], profile=profile):
+        old = ServerProcess(port=ports[0], profile=profile, extra_args=[
+            "--drain-timeout", str(drain_timeout),
+            "--drain-to", f"{host}:{ports[1]}",
+        ])
+        await old.start()
+        tasks = [
+            asyncio.ensure_future(_client(r, primary, successor, profile, interval, timeout, stop))
+            for r in records
+        ]
+        await asyncio.sleep(warmup)
+
+        restarted = time.monotonic()
+        if mode == "drain":
+            old.process.send_signal(signal.SIGTERM)
+        else:
+            old.process.kill()
+        await asyncio.sleep(observe)
+
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(old.process.wait(), drain_timeout)
+        await old.stop()
+
+    gaps = [_longest_gap(r, restarted) for r in records]
+    survived = sum(1 for r in records if not any(t >= restarted for t in r.failures))
+    finite = [g for g in gaps if g != float("inf")]
+    return {
+        "mode": mode,
+        "clients": clients,
+        "survived": survived,
+        "moved": sum(r.goaways for r in records),
+        "failures": sum(len(r.failures) for r in records),
+        "stall_p50": statistics.median(finite) if finite else float("nan"),
+        "stall_p99": percentile(gaps, 0.99),
+    }
+
+
+def print_report(results: List[Dict]):
+    print("\n" + "=" * 70)
+    print("🚰 ROLLING RESTART: DRAIN vs HARD STOP")
+    print("=" * 70)
+    for result in results:
+        print(f"\n📌 {result['mode']}")
+        print(f"   Clients without a failed request: {result['survived']}/{result['clients']} "
+              f"| GOAWAY moves {result['moved']} | failed requests {result['failures']}")
+        print(f"   Longest gap between responses:   p50 {result['stall_p50'] * 1000:.0f}ms "
+              f"| p99 {result['stall_p99'] * 1000:.0f}ms")
+    print("\n" + "=" * 70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure client impact of draining vs killing the server")
+    parser.add_argument("--mode", action="append", choices=["drain", "kill"],
+                        help="restart style (repeatable, default: both)")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between requests per client")
+    parser.add_argument("--timeout", type=float, default=1.0, help="request / handshake timeout")
+    parser.add_argument("--drain-timeout", type=float, default=5.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--observe", type=float, default=5.0, help="seconds to keep measuring after the restart")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=list(PROFILES))
+    parser.add_argument("--port", type=int, default=14733, help="primary port (successor uses port + 1)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    results = []
+    for mode in args.mode or ["drain", "kill"]:
+        print(f"   restarting with {mode} ...")
+        results.append(asyncio.run(run_restart(
+            mode, args.clients, args.profile, (args.port, args.port + 1),
+            args.interval, args.timeout, args.drain_timeout, args.warmup, args.observe,
+        )))
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
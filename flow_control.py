@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Flow-Control-Aware Stream Writer
+Bounded send buffers for QuicServerProtocol
+
+aioquic's send_stream_data() appends to a stream's send buffer no matter how
+much is already queued or how much credit the peer has granted, so a stalled
+client makes the server buffer responses without limit. StreamWriter caps the
+queued (unacknowledged) bytes per stream and per connection, and limits how
+far a stream may run ahead of the peer's MAX_STREAM_DATA / MAX_DATA credit.
+Producers that hit a limit wait; the protocol calls resume() from transmit(),
+which runs after every received datagram, so ACKs and credit updates wake
+them up.
+
+Occupancy is aggregated server-wide by BufferMetrics.
+"""
+
+import asyncio
+import logging
+import time
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from aioquic.quic.connection import QuicConnection
+
+logger = logging.getLogger(__name__)
+
+KiB = 1024
+MiB = 1024 * KiB
+
+DEFAULT_STREAM_LIMIT = 1 * MiB
+DEFAULT_CONNECTION_LIMIT = 4 * MiB
+# Bytes queued but not yet sent, per connection. Anything past what the
+# congestion window lets out only costs memory, so keep this small.
+DEFAULT_UNSENT_LIMIT = 256 * KiB
+# How far a stream may queue beyond the credit the peer has granted
+DEFAULT_CREDIT_SLACK = 64 * KiB
+
+
+class BufferMetrics:
+    """Send-buffer occupancy across every connection of a server"""
+
+    def __init__(self):
+        self.writers = set()
+        self.peak_queued = 0
+        self.waits = 0
+        self.credit_waits = 0
+        self.wait_time = 0.0
+        self.aborted = 0
+
+    def snapshot(self) -> Dict[str, float]:
+        queued = unsent = waiting = 0
+        for writer in self.writers:
+            stream_queued, stream_unsent = writer.occupancy()
+            queued += stream_queued
+            unsent += stream_unsent
+            waiting += len(writer.waiters)
+        self.peak_queued = max(self.peak_queued, queued)
+        return {
+            "connections": len(self.writers),
+            "queued_bytes": queued,
+            "unsent_bytes": unsent,
+            "peak_queued_bytes": self.peak_queued,
+            "waiting_producers": waiting,
+            "waits": self.waits,
+            "credit_waits": self.credit_waits,
+            "wait_time": self.wait_time,
+            "aborted_writes": self.aborted,
+        }
+
+
+class StreamWriter:
+    """Per-connection write API that makes producers wait for buffer space"""
+
+    __slots__ = ("_quic", "_transmit", "metrics", "stream_limit", "connection_limit", "unsent_limit",
+                 "credit_slack", "waiters", "pending", "closed")
+
+    def __init__(
+        self,
+        quic: QuicConnection,
+        transmit,
+        metrics: Optional[BufferMetrics] = None,
+        stream_limit: int = DEFAULT_STREAM_LIMIT,
+        connection_limit: int = DEFAULT_CONNECTION_LIMIT,
+        unsent_limit: int = DEFAULT_UNSENT_LIMIT,
+        credit_slack: int = DEFAULT_CREDIT_SLACK,
+    ):
+        self._quic = quic
+        self._transmit = transmit
+        self.metrics = metrics or BufferMetrics()
+        self.stream_limit = stream_limit
+        self.connection_limit = connection_limit
+        self.unsent_limit = unsent_limit
+        self.credit_slack = credit_slack
+        # a list, not a deque: an empty deque costs ~600 bytes on every idle connection
+        self.waiters: List[Tuple[int, asyncio.Future]] = []
+        # the last queued write task per stream; later writes to the stream run after it
+        self.pending: Optional[Dict[int, asyncio.Task]] = None
+        self.closed = False
+        self.metrics.writers.add(self)
+
+    def occupancy(self) -> Tuple[int, int]:
+        """(queued, unsent) bytes over all streams of the connection"""
+        queued = unsent = 0
+        for stream in self._quic._streams.values():
+            sender = stream.sender
+            queued += sender._buffer_stop - sender._buffer_start
+            unsent += sender._buffer_stop - sender.highest_offset
+        return queued, unsent
+
+    def room(self, stream_id: int, occupancy: Optional[Tuple[int, int]] = None) -> int:
+        """Bytes that can be written to `stream_id` right now without waiting"""
+        stream = self._quic._streams.get(stream_id)
+        if stream is None or self.closed:
+            return 0
+        sender = stream.sender
+        queued, unsent = occupancy or self.occupancy()
+        quic = self._quic
+        connection_credit = quic._remote_max_data - quic._remote_max_data_used - unsent
+        return min(
+            self.stream_limit - (sender._buffer_stop - sender._buffer_start),
+            self.connection_limit - queued,
+            self.unsent_limit - unsent,
+            stream.max_stream_data_remote - sender._buffer_stop + self.credit_slack,
+            connection_credit + self.credit_slack,
+        )
+
+    def _credit_limited(self, stream_id: int) -> bool:
+        stream = self._quic._streams[stream_id]
+        quic = self._quic
+        return (
+            stream.sender._buffer_stop >= stream.max_stream_data_remote
+            or quic._remote_max_data_used >= quic._remote_max_data
+        )
+
+    def has_pending(self, stream_id: int) -> bool:
+        """Whether a queued write has not reached the stream yet"""
+        return bool(self.pending) and stream_id in self.pending
+
+    def send(self, stream_id: int, data: bytes, end_stream: bool = False) -> Optional[asyncio.Task]:
+        """Queue `data` now if it fits, otherwise in a task that waits for room
+
+        Lets synchronous event handlers respond without blocking; the task
+        (if any) is returned so callers can await or cancel it. Writes to a
+        stream reach it in the order send() was called. A task that fails
+        because the stream or connection went away has its exception
+        consumed here, so it needs no awaiting.
+        """
+        previous = self.pending.get(stream_id) if self.pending else None
+        if previous is None and len(data) <= self.room(stream_id):
+            self._quic.send_stream_data(stream_id, data, end_stream=end_stream)
+            return None
+        task = asyncio.ensure_future(self._write_after(previous, stream_id, data, end_stream))
+        if self.pending is None:
+            self.pending = {}
+        self.pending[stream_id] = task
+        task.add_done_callback(partial(self._write_done, stream_id))
+        return task
+
+    async def _write_after(self, previous: Optional[asyncio.Task], stream_id: int, data: bytes, end_stream: bool):
+        if previous is not None:
+            await asyncio.wait([previous])  # its outcome is handled by its own callback
+        await self.write(stream_id, data, end_stream)
+
+    def _write_done(self, stream_id: int, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Dropped queued write on stream {stream_id}: {task.exception()}")
+        if self.pending.get(stream_id) is task:
+            del self.pending[stream_id]
+
+    async def write(self, stream_id: int, data: bytes, end_stream: bool = False):
+        """Queue `data` on `stream_id`, waiting while limits are reached
+
+        Data larger than the available room is written in pieces. Raises
+        ConnectionError if the connection or stream goes away first.
+        """
+        view = memoryview(data)
+        while True:
+            room = self.room(stream_id)
+            if room <= 0 and view:
+                await self._wait(stream_id)
+                continue
+
+            piece = view[:max(room, 0)]
+            view = view[len(piece):]
+            self._quic.send_stream_data(stream_id, piece, end_stream=end_stream and not view)
+            self._transmit()
+            if not view:
+                return
+
+    async def _wait(self, stream_id: int):
+        if self.closed or stream_id not in self._quic._streams:
+            self.metrics.aborted += 1
+            raise ConnectionError(f"stream {stream_id} closed while writing")
+
+        self.metrics.waits += 1
+        if self._credit_limited(stream_id):
+            self.metrics.credit_waits += 1
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((stream_id, future))
+        started = time.monotonic()
+        try:
+            await future
+        finally:
+            self.metrics.wait_time += time.monotonic() - started
+
+    def resume(self):
+        """Wake producers whose stream has room again (call after ACK processing)"""
+        if not self.waiters:
+            return
+        occupancy = self.occupancy()
+        waiters, self.waiters = self.waiters, []
+        for stream_id, future in waiters:
+            if future.done():
+                continue
+            if stream_id not in self._quic._streams or self.room(stream_id, occupancy) > 0:
+                future.set_result(None)
+            else:
+                self.waiters.append((stream_id, future))
+
+    def close(self):
+        """Fail all waiting producers and stop accounting this connection"""
+        self.closed = True
+        waiters, self.waiters = self.waiters, []
+        for _, future in waiters:
+            if not future.done():
+                future.set_result(None)
+        self.metrics.writers.discard(self)
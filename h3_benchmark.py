@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+HTTP/3 Benchmark
+Requests/s, QPACK cost and tail latency of the HTTP/3 endpoints
+
+Starts quic_server.py with `--h3` and runs the HTTP/3 load mode of
+load_test.py against each endpoint (small JSON, streamed body, server
+push), once on stable paths and once with every connection rebinding to
+a new source port at a fixed interval. Server CPU per request and the
+server's QPACK counters come from /proc and the /stats endpoint.
+"""
+
+import argparse
+import asyncio
+import logging
+from typing import Dict, List
+
+from load_test import ServerProcess, run_load_test, server_stats
+from tuning_profiles import DEFAULT_PROFILE, PROFILES
+
+ENDPOINTS = {
+    "json": ("/json", 200),
+    "stream 256 KiB": ("/stream?bytes=262144", 10),
+    "push 3 assets": ("/push?count=3", 100),
+}
+
+
+async def run_benchmark(
+    connections: int,
+    migrate_every: float,
+    port: int,
+    profile: str,
+    host: str = "127.0.0.1",
+) -> List[Dict]:
+    results = []
+    for label, (path, messages) in ENDPOINTS.items():
+        for migrate in (None, migrate_every):
+            async with ServerProcess(port=port, profile=profile, extra_args=["--h3"]) as server:
+                cpu_before = server.cpu_seconds() or 0.0
+                result = await run_load_test(host, port, connections=connections, messages=messages,
+                                             concurrency=connections, profile=profile, h3_path=path,
+                                             migrate_every=migrate)
+                cpu = (server.cpu_seconds() or 0.0) - cpu_before
+                stats = await server_stats(host, port, profile, h3=True)
+            summary = result.summary()
+            results.append({
+                "label": label,
+                "migrate_every": migrate,
+                **{key: summary.get(key, float("nan")) for key in (
+                    "requests", "errors", "requests_per_second", "goodput_mbps",
+                    "latency_p50", "latency_p99", "migrations")},
+                "server_cpu_per_request_ms": 1000 * cpu / result.requests if result.requests else float("nan"),
+                "server_qpack_encode_us": stats.get("qpack_encode_us", 0.0),
+                "server_qpack_decode_us": stats.get("qpack_decode_us", 0.0),
+                "qpack_ratio": stats.get("qpack_ratio", 0.0),
+                "pushes": stats.get("h3_pushes", 0),
+            })
+    return results
+
+
+def print_report(results: List[Dict]):
+    print("\n" + "=" * 70)
+    print("🌐 HTTP/3 ENDPOINTS")
+    print("=" * 70)
+    for r in results:
+        paths = f"migrating every {r['migrate_every']:g}s" if r["migrate_every"] else "stable paths"
+        print(f"\n📌 {r['label']}, {paths}")
+        print(f"   Throughput: {r['requests_per_second']:,.0f} req/s | {r['goodput_mbps']:.1f} Mbit/s "
+              f"| {r['requests']} requests, {r['errors']} errors, {r['migrations']} migrations")
+        print(f"   Latency:    p50 {r['latency_p50'] * 1000:.1f}ms | p99 {r['latency_p99'] * 1000:.1f}ms")
+        print(f"   Server:     {r['server_cpu_per_request_ms']:.2f}ms CPU per request | QPACK encode "
+              f"{r['server_qpack_encode_us']:.1f}us, decode {r['server_qpack_decode_us']:.1f}us per block "
+              f"| headers at {r['qpack_ratio']:.0%} of raw size | {r['pushes']} pushes")
+    print("\n" + "=" * 70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the HTTP/3 endpoints, with and without migrations")
+    parser.add_argument("--connections", type=int, default=20)
+    parser.add_argument("--migrate-every", type=float, default=0.5,
+                        help="seconds between rebinds in the migrating runs")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=list(PROFILES))
+    parser.add_argument("--port", type=int, default=15133)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    results = asyncio.run(run_benchmark(args.connections, args.migrate_every, args.port, args.profile))
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
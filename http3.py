@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+HTTP/3 Mode
+Synthetic HTTP/3 endpoints on top of aioquic's H3Connection
+
+The text echo protocol is handy for watching migrations, but real traffic
+is HTTP/3: QPACK-compressed headers, framed bodies and server push. With
+`--h3` the server also offers the "h3" ALPN, and connections that pick it
+are served by H3Endpoints:
+
+- GET /json             small JSON document (includes the migration count)
+- GET /stream?bytes=N   N bytes of streamed body (default 1 MiB), written
+                        only as fast as the StreamWriter limits allow
+- GET /push?count=N     small JSON page plus N pushed /asset/<i> responses
+- GET /asset/<i>        the same asset, without push
+- GET /stats            the server STATS JSON
+- GET /profile?seconds=N  start a profiler capture (server run with --capture-dir)
+
+H3ClientProtocol is the matching client. Both sides count QPACK work in an
+H3Metrics instance, so header-compression cost can be reported next to
+requests/s and latency.
+"""
+
+import asyncio
+import json
+import time
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from aioquic.buffer import encode_uint_var
+from aioquic.h3.connection import H3_ALPN, FrameType, H3Connection, encode_frame
+from aioquic.h3.events import DataReceived, H3Event, HeadersReceived, PushPromiseReceived
+from aioquic.h3.exceptions import NoAvailablePushIDError
+from aioquic.quic.connection import QuicConnection
+from aioquic.quic.events import ConnectionTerminated, HandshakeCompleted, QuicEvent, StreamReset
+
+from flow_control import KiB, MiB, StreamWriter
+from profiling import MAX_CAPTURE_SECONDS
+from quic_client import QuicClientProtocol
+
+SERVER_NAME = b"quic-migration-demo"
+USER_AGENT = b"quic-migration-demo-client"
+
+DEFAULT_STREAM_BYTES = 1 * MiB
+MAX_STREAM_BYTES = 1024 * MiB
+DEFAULT_PUSH_COUNT = 3
+MAX_PUSH_COUNT = 16
+ASSET = b"/* pushed asset */\n" * 108  # ~2 KiB
+
+# Largest DATA frame queued at once, and the room kept for its frame header
+BODY_CHUNK = 64 * KiB
+FRAME_OVERHEAD = 16
+BODY_BLOCK = bytes(range(256)) * (BODY_CHUNK // 256)
+
+# The client raises MAX_PUSH_ID by this much whenever half of it is used
+PUSH_WINDOW = 16
+
+
+class H3Metrics:
+    """HTTP/3 request and QPACK counters across connections"""
+
+    def __init__(self):
+        self.requests = 0
+        self.pushes = 0
+        self.pushes_refused = 0
+        self.body_bytes = 0
+        self.encoded_blocks = 0
+        self.encode_seconds = 0.0
+        self.header_bytes = 0   # uncompressed name + value bytes of encoded blocks
+        self.encoded_bytes = 0  # header block + encoder stream bytes
+        self.decoded_blocks = 0
+        self.decode_seconds = 0.0
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "h3_requests": self.requests,
+            "h3_pushes": self.pushes,
+            "h3_pushes_refused": self.pushes_refused,
+            "h3_body_bytes": self.body_bytes,
+            "qpack_encoded_blocks": self.encoded_blocks,
+            "qpack_decoded_blocks": self.decoded_blocks,
+            "qpack_encode_us": 1e6 * self.encode_seconds / self.encoded_blocks if self.encoded_blocks else 0.0,
+            "qpack_decode_us": 1e6 * self.decode_seconds / self.decoded_blocks if self.decoded_blocks else 0.0,
+            "qpack_ratio": self.encoded_bytes / self.header_bytes if self.header_bytes else 0.0,
+        }
+
+
+class TimedH3Connection(H3Connection):
+    """H3Connection that times QPACK encoding and decoding"""
+
+    def __init__(self, quic: QuicConnection, metrics: H3Metrics):
+        self.metrics = metrics
+        super().__init__(quic)
+
+    def _encode_headers(self, stream_id: int, headers) -> bytes:
+        metrics = self.metrics
+        encoder_bytes = self._encoder_bytes_sent
+        started = time.perf_counter()
+        frame_data = super()._encode_headers(stream_id, headers)
+        metrics.encode_seconds += time.perf_counter() - started
+        metrics.encoded_blocks += 1
+        metrics.header_bytes += sum(len(name) + len(value) for name, value in headers)
+        metrics.encoded_bytes += len(frame_data) + self._encoder_bytes_sent - encoder_bytes
+        return frame_data
+
+    def _decode_headers(self, stream_id: int, frame_data: Optional[bytes]):
+        started = time.perf_counter()
+        headers = super()._decode_headers(stream_id, frame_data)
+        self.metrics.decode_seconds += time.perf_counter() - started
+        self.metrics.decoded_blocks += 1
+        return headers
+
+    def send_goaway(self, stream_id: int):
+        """GOAWAY on the control stream: requests from `stream_id` on are not processed"""
+        self._quic.send_stream_data(
+            self._local_control_stream_id, encode_frame(FrameType.GOAWAY, encode_uint_var(stream_id)))
+
+
+def _response_headers(status: int, content_type: bytes, length: int) -> List:
+    return [
+        (b":status", str(status).encode()),
+        (b"server", SERVER_NAME),
+        (b"content-type", content_type),
+        (b"content-length", str(length).encode()),
+        (b"cache-control", b"no-store"),
+    ]
+
+
+def _query_int(query: Dict[str, List[str]], name: str, default: int, maximum: int) -> int:
+    try:
+        return max(0, min(int(query[name][0]), maximum))
+    except (KeyError, ValueError):
+        return default
+
+
+class H3Endpoints:
+    """Serves the synthetic endpoints on one server connection"""
+
+    def __init__(
+        self,
+        quic: QuicConnection,
+        writer: StreamWriter,
+        metrics: H3Metrics,
+        stats: Callable[[], Dict],
+        migrations: Callable[[], int],
+        start_profile: Optional[Callable[[Optional[float]], Dict]] = None,
+    ):
+        self._quic = quic
+        self.writer = writer
+        self.metrics = metrics
+        self.stats = stats
+        self.migrations = migrations
+        self.start_profile = start_profile
+        self.h3 = TimedH3Connection(quic, metrics)
+        self.bodies: Dict[int, int] = {}  # stream id -> streamed body bytes still to send
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.bodies)
+
+    def handle_event(self, event: QuicEvent):
+        if isinstance(event, StreamReset):
+            self.bodies.pop(event.stream_id, None)
+        for h3_event in self.h3.handle_event(event):
+            if isinstance(h3_event, HeadersReceived):
+                self._dispatch(h3_event)
+
+    def _dispatch(self, event: HeadersReceived):
+        headers = dict(event.headers)
+        stream_id = event.stream_id
+        url = urlsplit(headers.get(b":path", b"/").decode("utf-8", "replace"))
+        query = parse_qs(url.query)
+        self.metrics.requests += 1
+
+        if headers.get(b":method") != b"GET":
+            self._send(stream_id, 405, b"text/plain", b"method not allowed\n")
+        elif url.path == "/json":
+            self._send_json(stream_id, {"stream": stream_id, "migrations": self.migrations(),
+                                        "items": [{"id": i, "name": f"item-{i}"} for i in range(4)]})
+        elif url.path == "/stream":
+            size = _query_int(query, "bytes", DEFAULT_STREAM_BYTES, MAX_STREAM_BYTES)
+            self.h3.send_headers(stream_id, _response_headers(200, b"application/octet-stream", size),
+                                 end_stream=not size)
+            if size:
+                self.bodies[stream_id] = size
+                self.pump()
+        elif url.path == "/push":
+            count = _query_int(query, "count", DEFAULT_PUSH_COUNT, MAX_PUSH_COUNT)
+            pushed = [path for path in (f"/asset/{i}" for i in range(count))
+                      if self._push(stream_id, headers, path)]
+            self._send_json(stream_id, {"assets": [f"/asset/{i}" for i in range(count)], "pushed": pushed})
+        elif url.path.startswith("/asset/"):
+            self._send(stream_id, 200, b"text/css", ASSET)
+        elif url.path == "/stats":
+            self._send_json(stream_id, self.stats())
+        elif url.path == "/profile" and self.start_profile is not None:
+            seconds = _query_int(query, "seconds", 0, MAX_CAPTURE_SECONDS)
+            self._send_json(stream_id, self.start_profile(seconds or None))
+        else:
+            self._send(stream_id, 404, b"text/plain", b"not found\n")
+
+    def _send(self, stream_id: int, status: int, content_type: bytes, body: bytes):
+        self.h3.send_headers(stream_id, _response_headers(status, content_type, len(body)))
+        self.h3.send_data(stream_id, body, end_stream=True)
+        self.metrics.body_bytes += len(body)
+
+    def _send_json(self, stream_id: int, document):
+        self._send(stream_id, 200, b"application/json", json.dumps(document).encode("utf-8"))
+
+    def _push(self, stream_id: int, request_headers: Dict[bytes, bytes], path: str) -> bool:
+        try:
+            push_stream_id = self.h3.send_push_promise(stream_id, [
+                (b":method", b"GET"),
+                (b":scheme", b"https"),
+                (b":authority", request_headers.get(b":authority", b"localhost")),
+                (b":path", path.encode("utf-8")),
+            ])
+        except NoAvailablePushIDError:
+            self.metrics.pushes_refused += 1
+            return False
+        self._send(push_stream_id, 200, b"text/css", ASSET)
+        self.metrics.pushes += 1
+        return True
+
+    def pump(self):
+        """Top up streamed bodies as far as the writer's limits allow"""
+        queued, unsent = self.writer.occupancy()
+        for stream_id, remaining in list(self.bodies.items()):
+            if stream_id not in self._quic._streams:
+                del self.bodies[stream_id]
+                continue
+            size = min(self.writer.room(stream_id, (queued, unsent)) - FRAME_OVERHEAD, remaining, BODY_CHUNK)
+            if size <= 0:
+                continue
+            remaining -= size
+            self.h3.send_data(stream_id, BODY_BLOCK[:size], end_stream=not remaining)
+            queued += size + FRAME_OVERHEAD
+            unsent += size + FRAME_OVERHEAD
+            self.metrics.body_bytes += size
+            if remaining:
+                self.bodies[stream_id] = remaining
+            else:
+                del self.bodies[stream_id]
+
+    def goaway(self):
+        """Tell the client that no further requests will be processed"""
+        last = max((stream_id for stream_id in self._quic._streams if stream_id % 4 == 0), default=-4)
+        self.h3.send_goaway(last + 4)
+
+    def close(self):
+        self.bodies.clear()
+
+
+class H3Response:
+    """A response (or pushed response) as received by the client"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, keep_body: bool = True):
+        self.keep_body = keep_body
+        self.status: Optional[int] = None
+        self.headers: List = []
+        self.size = 0
+        self.pushes: List["H3Response"] = []
+        self.done = loop.create_future()
+        self._chunks: List[bytes] = []
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(self._chunks)
+
+    def feed(self, event: H3Event):
+        if isinstance(event, HeadersReceived):
+            self.headers = event.headers
+            self.status = int(dict(event.headers).get(b":status", b"0"))
+        elif isinstance(event, DataReceived) and event.data:
+            self.size += len(event.data)
+            if self.keep_body:
+                self._chunks.append(event.data)
+        if event.stream_ended and not self.done.done():
+            self.done.set_result(self)
+
+
+class H3ClientProtocol(QuicClientProtocol):
+    """HTTP/3 client: GET requests, with server push accepted"""
+
+    def __init__(self, *args, metrics: Optional[H3Metrics] = None, keep_bodies: bool = True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics or H3Metrics()
+        self.keep_bodies = keep_bodies
+        self.h3 = TimedH3Connection(self._quic, self.metrics)
+        self._requests: Dict[int, H3Response] = {}
+        self._pushes: Dict[int, H3Response] = {}
+
+    def quic_event_received(self, event: QuicEvent):
+        if isinstance(event, (HandshakeCompleted, ConnectionTerminated)):
+            super().quic_event_received(event)
+        if isinstance(event, ConnectionTerminated):
+            for response in [*self._requests.values(), *self._pushes.values()]:
+                if not response.done.done():
+                    response.done.set_exception(ConnectionError(event.reason_phrase))
+            return
+
+        for h3_event in self.h3.handle_event(event):
+            if isinstance(h3_event, PushPromiseReceived):
+                self._pushes.setdefault(h3_event.push_id, H3Response(self._loop, self.keep_bodies))
+                request = self._requests.get(h3_event.stream_id)
+                if request is not None:
+                    request.pushes.append(self._pushes[h3_event.push_id])
+                self._allow_pushes(h3_event.push_id)
+            elif isinstance(h3_event, (HeadersReceived, DataReceived)):
+                if h3_event.push_id is not None:
+                    response = self._pushes.setdefault(h3_event.push_id, H3Response(self._loop, self.keep_bodies))
+                    if h3_event.stream_ended:
+                        self.metrics.pushes += 1
+                        del self._pushes[h3_event.push_id]
+                else:
+                    response = self._requests.get(h3_event.stream_id)
+                if response is not None:
+                    response.feed(h3_event)
+
+    def _allow_pushes(self, push_id: int):
+        """Keep MAX_PUSH_ID ahead of the pushes the server has used"""
+        h3 = self.h3
+        if push_id + PUSH_WINDOW // 2 >= h3._max_push_id:
+            h3._max_push_id += PUSH_WINDOW
+            self._quic.send_stream_data(h3._local_control_stream_id, encode_frame(
+                FrameType.MAX_PUSH_ID, encode_uint_var(h3._max_push_id)))
+
+    async def get(self, path: str, authority: str = "localhost") -> H3Response:
+        """GET `path`; returns once the response and everything it pushed have arrived"""
+        stream_id = self._quic.get_next_available_stream_id()
+        response = self._requests[stream_id] = H3Response(self._loop, self.keep_bodies)
+        self.h3.send_headers(stream_id, [
+            (b":method", b"GET"),
+            (b":scheme", b"https"),
+            (b":authority", authority.encode("utf-8")),
+            (b":path", path.encode("utf-8")),
+            (b"user-agent", USER_AGENT),
+            (b"accept", b"*/*"),
+        ], end_stream=True)
+        self.transmit()
+        self.metrics.requests += 1
+        try:
+            await response.done
+            if response.pushes:
+                await asyncio.gather(*(push.done for push in response.pushes))
+        finally:
+            del self._requests[stream_id]
+        return response
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Idle Connection Memory Benchmark
+How much server memory does one idle connection cost?
+
+Starts quic_server.py, records its resident set size, then opens N
+connections from client worker processes. Each connection completes its
+handshake and one echo request and then sits idle. Once they are all open
+the server is measured again, and the difference divided by N is the
+per-connection cost. A second run with `--tracemalloc` measures the
+Python allocations the same way and lists the sites that grew the most.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import time
+from functools import partial
+from typing import Dict, List
+
+from aioquic.asyncio import connect
+
+from load_test import ServerProcess, server_stats
+from quic_client import QuicClientProtocol, send_message
+from tuning_profiles import PROFILES, get_profile
+
+# Server-side budget for one idle, established connection (see README)
+RSS_BUDGET_BYTES = 64 * 1024
+TRACED_BUDGET_BYTES = 48 * 1024
+
+
+def _client_configuration(profile: str):
+    tuning = get_profile(profile)
+    return tuning.configuration(is_client=True, verify_mode=False), partial(QuicClientProtocol, profile=tuning)
+
+
+async def _idle_connection(host: str, port: int, profile: str, handshakes: asyncio.Semaphore, opened, release):
+    configuration, create_protocol = _client_configuration(profile)
+    async with handshakes:
+        client = connect(host, port, configuration=configuration, create_protocol=create_protocol)
+        protocol = await client.__aenter__()
+        await asyncio.wait_for(send_message(protocol, "hello"), 10.0)
+    with opened.get_lock():
+        opened.value += 1
+    try:
+        while not release.is_set():
+            await asyncio.sleep(0.2)
+    finally:
+        await client.__aexit__(None, None, None)
+
+
+def _client_process(host: str, port: int, profile: str, connections: int, opened, release):
+    """Open `connections` idle connections and hold them until `release` is set"""
+    logging.getLogger().setLevel(logging.ERROR)
+
+    async def hold():
+        # A few handshakes at a time so they don't time out on a small machine
+        handshakes = asyncio.Semaphore(20)
+        await asyncio.gather(*(
+            _idle_connection(host, port, profile, handshakes, opened, release) for _ in range(connections)
+        ), return_exceptions=True)
+
+    asyncio.run(hold())
+
+
+def _top_growth(before: List, after: List, limit: int = 12) -> List:
+    """Allocation sites whose traced size grew the most"""
+    sizes = {site: size for site, size, _ in before}
+    growth = [(site, size - sizes.get(site, 0)) for site, size, _ in after]
+    return sorted((g for g in growth if g[1] > 0), key=lambda g: -g[1])[:limit]
+
+
+async def _measure(connections: int, processes: int, port: int, profile: str, settle: float,
+                   traced: bool, host: str = "127.0.0.1") -> Dict:
+    """Server memory before and after opening `connections` idle connections"""
+    extra_args = ["--tracemalloc"] if traced else []
+    async with ServerProcess(port=port, profile=profile, extra_args=extra_args, ready_timeout=60.0) as server:
+        await asyncio.sleep(settle)
+        stats_before = await server_stats(host, port, profile, timeout=10.0) if traced else {}
+        rss_before = server.rss_bytes() or 0
+
+        opened = multiprocessing.Value("i", 0)
+        release = multiprocessing.Event()
+        workers = [
+            multiprocessing.Process(target=_client_process, daemon=True, args=(
+                host, port, profile, connections // processes, opened, release))
+            for _ in range(processes)
+        ]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        target = (connections // processes) * processes
+        while opened.value < target and time.monotonic() - started < 30 + connections / 10:
+            await asyncio.sleep(0.2)
+        open_seconds = time.monotonic() - started
+        await asyncio.sleep(settle)
+
+        stats_after = await server_stats(host, port, profile, timeout=10.0) if traced else {}
+        rss_after = server.rss_bytes() or 0
+        release.set()
+        for worker in workers:
+            await asyncio.get_running_loop().run_in_executor(None, worker.join, 10)
+
+    count = max(opened.value, 1)
+    traced_before = stats_before.get("tracemalloc_bytes", 0)
+    traced_after = stats_after.get("tracemalloc_bytes", 0)
+    return {
+        "connections": opened.value,
+        "open_seconds": open_seconds,
+        "rss_before": rss_before,
+        "rss_after": rss_after,
+        "rss_per_connection": (rss_after - rss_before) / count,
+        "traced_before": traced_before,
+        "traced_after": traced_after,
+        "traced_per_connection": (traced_after - traced_before) / count,
+        "top_growth": [(site, size / count) for site, size in _top_growth(
+            stats_before.get("tracemalloc_top", []), stats_after.get("tracemalloc_top", []))],
+    }
+
+
+async def run_benchmark(connections: int, processes: int, port: int, profile: str, settle: float) -> Dict:
+    """RSS from a plain server, Python allocations from one run with --tracemalloc
+
+    tracemalloc keeps a trace per allocated block, which inflates RSS, so
+    the two are measured in separate runs.
+    """
+    plain = await _measure(connections, processes, port, profile, settle, traced=False)
+    traced = await _measure(connections, processes, port, profile, settle, traced=True)
+    return {
+        "profile": profile,
+        **{key: plain[key] for key in ("connections", "open_seconds", "rss_before", "rss_after",
+                                       "rss_per_connection")},
+        "traced_connections": traced["connections"],
+        **{key: traced[key] for key in ("traced_before", "traced_after", "traced_per_connection",
+                                        "top_growth")},
+    }
+
+
+def print_report(r: Dict):
+    print("\n" + "=" * 70)
+    print("🧠 IDLE CONNECTION MEMORY")
+    print("=" * 70)
+    print(f"\n📌 {r['connections']} idle connections ({r['profile']}), opened in {r['open_seconds']:.1f}s")
+    print(f"   Server RSS:     {r['rss_before'] / 2**20:.1f} MiB -> {r['rss_after'] / 2**20:.1f} MiB "
+          f"| {r['rss_per_connection'] / 1024:.1f} KiB per connection")
+    print(f"   Python traced:  {r['traced_before'] / 2**20:.1f} MiB -> {r['traced_after'] / 2**20:.1f} MiB "
+          f"| {r['traced_per_connection'] / 1024:.1f} KiB per connection ({r['traced_connections']} connections, "
+          f"separate run with --tracemalloc)")
+    for label, value, budget in (("RSS", r["rss_per_connection"], RSS_BUDGET_BYTES),
+                                 ("Python objects", r["traced_per_connection"], TRACED_BUDGET_BYTES)):
+        verdict = "✅ within" if value <= budget else "❌ over"
+        print(f"   Budget:         {verdict} {budget // 1024} KiB of {label} per connection")
+    if r["top_growth"]:
+        print("\n   Largest allocation sites, per connection:")
+        for site, size in r["top_growth"]:
+            print(f"      {size:>9,.0f} B  {site}")
+    print("\n" + "=" * 70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the server memory cost of idle connections")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--processes", type=int, default=4, help="client worker processes")
+    parser.add_argument("--profile", default="many-idle-connections", choices=list(PROFILES))
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds to wait before each measurement")
+    parser.add_argument("--port", type=int, default=15333)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print_report(asyncio.run(run_benchmark(args.connections, args.processes, args.port, args.profile,
+                                           args.settle)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Initial Flood Benchmark
+Handshake throughput and server memory while the server is flooded with Initials
+
+A separate process sends client Initial packets with fresh connection IDs
+from many loopback source addresses (127.x.y.z) and never answers, like a
+spoofed flood. Meanwhile the load generator runs genuine handshakes from
+127.0.0.1. The server is run without address validation and with stateless
+Retry + per-source limiting under load (`--retry auto`), and the legitimate
+handshake rate, handshake p99, server RSS and live server connections are
+compared.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import time
+from typing import Dict, List, Optional
+
+from aioquic import tls
+from aioquic.quic.connection import QuicConnection
+from aioquic.quic.crypto import CryptoPair
+from aioquic.quic.packet import QuicFrameType, QuicPacketType
+from aioquic.quic.packet_builder import QuicPacketBuilder
+
+from load_test import ServerProcess, percentile, run_load_test, server_stats
+from tuning_profiles import DEFAULT_PROFILE, PROFILES, get_profile
+
+CONFIGURATIONS = {
+    "no validation": ["--retry", "off", "--initial-rate-per-source", "0"],
+    "retry under load": ["--retry", "auto", "--initial-load-threshold", "200", "--initial-rate-per-source", "200"],
+}
+
+
+def _client_hello(profile: str) -> bytes:
+    """A real ClientHello, reused in every flood packet"""
+    configuration = get_profile(profile).configuration(is_client=True, verify_mode=False)
+    connection = QuicConnection(configuration=configuration)
+    connection.connect(("127.0.0.1", 443), now=time.time())
+    return bytes(connection._crypto_streams[tls.Epoch.INITIAL].sender._buffer)
+
+
+def build_initial(client_hello: bytes, version: int) -> bytes:
+    """An Initial datagram carrying `client_hello`, with fresh connection IDs
+
+    Re-protecting a fixed ClientHello costs ~0.1ms, against ~1ms for a new
+    QuicConnection, so one process can flood at several thousand packets/s.
+    """
+    destination_cid, source_cid = os.urandom(8), os.urandom(8)
+    crypto = CryptoPair()
+    crypto.setup_initial(cid=destination_cid, is_client=True, version=version)
+    builder = QuicPacketBuilder(
+        host_cid=source_cid,
+        peer_cid=destination_cid,
+        version=version,
+        is_client=True,
+        max_datagram_size=1200,
+    )
+    builder.start_packet(QuicPacketType.INITIAL, crypto)
+    buf = builder.start_frame(QuicFrameType.CRYPTO, capacity=len(client_hello) + 16)
+    buf.push_uint_var(0)
+    buf.push_uint_var(len(client_hello))
+    buf.push_bytes(client_hello)
+    datagrams, _ = builder.flush()
+    return datagrams[0]
+
+
+def _flood(host: str, port: int, rate: float, sources: int, profile: str, stop, sent):
+    """Send Initials at `rate` per second from `sources` loopback addresses"""
+    client_hello = _client_hello(profile)
+    version = get_profile(profile).configuration(is_client=True).supported_versions[0]
+    sockets = []
+    for i in range(sources):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((f"127.{1 + i // 65536 % 254}.{i // 256 % 256}.{1 + i % 254}", 0))
+        sock.setblocking(False)
+        sockets.append(sock)
+
+    started = time.monotonic()
+    count = 0
+    while not stop.is_set():
+        due = int((time.monotonic() - started) * rate)
+        if count >= due:
+            time.sleep(0.001)
+            continue
+        try:
+            random.choice(sockets).sendto(build_initial(client_hello, version), (host, port))
+        except BlockingIOError:
+            pass
+        count += 1
+        sent.value = count
+
+
+async def run_flood(
+    label: str,
+    server_args: List[str],
+    flood_rate: float,
+    sources: int,
+    connections: int,
+    concurrency: int,
+    duration: float,
+    port: int,
+    profile: str,
+    host: str = "127.0.0.1",
+) -> Dict:
+    stop = multiprocessing.Event()
+    sent = multiprocessing.Value("L", 0)
+    flooder: Optional[multiprocessing.Process] = None
+
+    async with ServerProcess(port=port, profile=profile, extra_args=server_args) as server:
+        baseline_rss = server.rss_bytes() or 0
+        if flood_rate:
+            flooder = multiprocessing.Process(
+                target=_flood, args=(host, port, flood_rate, sources, profile, stop, sent), daemon=True)
+            flooder.start()
+            await asyncio.sleep(1.0)  # let the flood build up state
+
+        peak_rss = [baseline_rss]
+
+        async def watch_rss():
+            while True:
+                peak_rss.append(server.rss_bytes() or 0)
+                await asyncio.sleep(0.1)
+
+        watcher = asyncio.ensure_future(watch_rss())
+        started = time.monotonic()
+        deadline = started + duration
+        handshakes = errors = 0
+        handshake_times: List[float] = []
+        while time.monotonic() < deadline:
+            result = await run_load_test(host, port, connections=connections, messages=1,
+                                         concurrency=concurrency, profile=profile, timeout=2.0)
+            handshakes += len(result.handshake_times)
+            handshake_times += result.handshake_times
+            errors += result.errors
+        elapsed = time.monotonic() - started
+        watcher.cancel()
+
+        # flood connections stay until they time out, so they still show up here
+        stop.set()
+        if flooder is not None:
+            flooder.join(5)
+        stats = await server_stats(host, port, profile)
+
+    return {
+        "label": label,
+        "flood_rate": flood_rate,
+        "flood_sent": sent.value,
+        "handshakes_per_second": handshakes / elapsed if elapsed else 0.0,
+        "handshake_p99": percentile(handshake_times, 0.99),
+        "errors": errors,
+        "rss_growth_mb": (max(peak_rss) - baseline_rss) / 2**20,
+        **stats,
+    }
+
+
+def print_report(results: List[Dict]):
+    print("\n" + "=" * 70)
+    print("🌊 INITIAL FLOOD")
+    print("=" * 70)
+    for r in results:
+        flood = f"{r['flood_sent']:,} Initials at {r['flood_rate']:,.0f}/s" if r["flood_rate"] else "no flood"
+        print(f"\n📌 {r['label']} ({flood})")
+        print(f"   Legitimate handshakes: {r['handshakes_per_second']:6.1f}/s | p99 {r['handshake_p99'] * 1000:.0f}ms "
+              f"| errors {r['errors']}")
+        print(f"   Server: RSS +{r['rss_growth_mb']:.1f}MB | {r['server_connections']} live connections "
+              f"| {r['accepted']:,} accepted, {r['retries_sent']:,} retries, {r['rate_limited']:,} rate-limited")
+    print("\n" + "=" * 70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the server under a local Initial flood")
+    parser.add_argument("--flood-rate", type=float, default=3000, help="flood Initials per second")
+    parser.add_argument("--sources", type=int, default=1024, help="distinct loopback source addresses")
+    parser.add_argument("--connections", type=int, default=50, help="legitimate connections per round")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=list(PROFILES))
+    parser.add_argument("--port", type=int, default=14833)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    runs = [("no validation, no flood", CONFIGURATIONS["no validation"], 0)]
+    runs += [(label, server_args, args.flood_rate) for label, server_args in CONFIGURATIONS.items()]
+    results = []
+    for label, server_args, rate in runs:
+        print(f"   running: {label} ...")
+        results.append(asyncio.run(run_flood(
+            label, server_args, rate, args.sources, args.connections, args.concurrency,
+            args.duration, args.port, args.profile,
+        )))
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
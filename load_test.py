@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+QUIC Load Generator
+Opens many concurrent client connections against quic_server.py
+
+Each connection completes a handshake, sends a number of echo requests
+(one per stream) and closes. Handshake time, per-request latency and
+overall request rate are reported.
+
+With `--h3 PATH` the requests are HTTP/3 GETs against a server started
+with `--h3` instead, and `--migrate-every` rebinds every connection to a
+new source port while it runs.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Dict, List, Optional, Sequence
+
+from aioquic.asyncio import connect
+
+from http3 import H3ClientProtocol, H3Metrics
+from quic_client import QuicClientProtocol, rebind, send_message
+from quic_server import STATS_REQUEST
+from tuning_profiles import DEFAULT_PROFILE, PROFILES, get_profile
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(PROJECT_DIR, "quic_server.py")
+
+
+@dataclass
+class LoadTestResult:
+    """Raw measurements from one load test run"""
+
+    connections: int
+    handshake_times: List[float] = field(default_factory=list)
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0  # HTTP/3 response bodies (echo responses are not counted)
+    migrations: int = 0
+    h3: Optional[H3Metrics] = None
+    elapsed: float = 0.0
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def goodput_mbps(self) -> float:
+        return (self.bytes_sent + self.bytes_received) * 8 / self.elapsed / 1e6 if self.elapsed else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        result = {
+            "connections": self.connections,
+            "requests": self.requests,
+            "errors": self.errors,
+            "elapsed": self.elapsed,
+            "requests_per_second": self.requests_per_second,
+            "goodput_mbps": self.goodput_mbps,
+            "migrations": self.migrations,
+        }
+        if self.h3 is not None:
+            result.update(self.h3.snapshot())
+        for name, values in (("handshake", self.handshake_times), ("latency", self.latencies)):
+            if values:
+                result[f"{name}_p50"] = statistics.median(values)
+                result[f"{name}_p99"] = percentile(values, 0.99)
+        return result
+
+
+async def _run_connection(
+    result: LoadTestResult,
+    host: str,
+    port: int,
+    profile_name: str,
+    messages: int,
+    message_size: int,
+    think_time: float,
+    timeout: float,
+    h3_path: Optional[str] = None,
+    migrate_every: Optional[float] = None,
+):
+    profile = get_profile(profile_name)
+    configuration = profile.configuration(is_client=True, verify_mode=False)
+    payload = "x" * message_size
+    if h3_path:
+        configuration.alpn_protocols = ["h3"]
+        create_protocol = partial(H3ClientProtocol, profile=profile, metrics=result.h3, keep_bodies=False)
+    else:
+        create_protocol = partial(QuicClientProtocol, profile=profile)
+
+    start = time.perf_counter()
+    transports = []
+    try:
+        async with connect(host, port, configuration=configuration, create_protocol=create_protocol) as protocol:
+            result.handshake_times.append(time.perf_counter() - start)
+            migrator = asyncio.ensure_future(_migrate(protocol, migrate_every, transports)) if migrate_every else None
+            try:
+                for _ in range(messages):
+                    sent = time.perf_counter()
+                    if h3_path:
+                        response = await asyncio.wait_for(protocol.get(h3_path), timeout)
+                        if response.status != 200:
+                            raise ConnectionError(f"HTTP {response.status} for {h3_path}")
+                        result.bytes_received += response.size + sum(push.size for push in response.pushes)
+                    else:
+                        await asyncio.wait_for(send_message(protocol, payload), timeout)
+                        result.bytes_sent += message_size
+                    result.latencies.append(time.perf_counter() - sent)
+                    if think_time:
+                        await asyncio.sleep(think_time)
+            finally:
+                if migrator:
+                    migrator.cancel()
+                result.migrations += len(transports)
+    except Exception:
+        result.errors += 1
+    finally:
+        for transport in transports:
+            transport.close()
+
+
+async def _migrate(protocol, interval: float, transports: list):
+    """Rebind to a new source port every `interval` seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        transports.append(await rebind(protocol))
+
+
+async def run_load_test(
+    host: str = "127.0.0.1",
+    port: int = 4433,
+    connections: int = 100,
+    messages: int = 10,
+    message_size: int = 64,
+    concurrency: int = 100,
+    think_time: float = 0.0,
+    profile: str = DEFAULT_PROFILE,
+    timeout: float = 10.0,
+    h3_path: Optional[str] = None,
+    migrate_every: Optional[float] = None,
+) -> LoadTestResult:
+    """Run `connections` client sessions, at most `concurrency` at a time"""
+    result = LoadTestResult(connections=connections, h3=H3Metrics() if h3_path else None)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded():
+        async with semaphore:
+            await asyncio.wait_for(
+                _run_connection(result, host, port, profile, messages, message_size, think_time, timeout,
+                                h3_path, migrate_every),
+                timeout * (messages + 2),
+            )
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(bounded() for _ in range(connections)), return_exceptions=True)
+    result.errors += sum(isinstance(o, Exception) for o in outcomes)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def percentile(values: Sequence[float], q: float, default: float = float("nan")) -> float:
+    """Nearest-rank percentile of `values` (q in [0, 1]), `default` when empty"""
+    if not values:
+        return default
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def server_stats(host: str, port: int, profile: str = DEFAULT_PROFILE, h3: bool = False,
+                       timeout: float = 5.0) -> Dict:
+    """Fetch a running server's STATS (or /stats over HTTP/3) as a dict"""
+    tuning = get_profile(profile)
+    configuration = tuning.configuration(is_client=True, verify_mode=False)
+    if h3:
+        configuration.alpn_protocols = ["h3"]
+        create_protocol = partial(H3ClientProtocol, profile=tuning)
+    else:
+        create_protocol = partial(QuicClientProtocol, profile=tuning)
+    async with connect(host, port, configuration=configuration, create_protocol=create_protocol) as protocol:
+        if h3:
+            response = await asyncio.wait_for(protocol.get("/stats"), timeout)
+            return json.loads(response.body)
+        return json.loads(await asyncio.wait_for(send_message(protocol, STATS_REQUEST.decode()), timeout))
+
+
+class ServerProcess:
+    """Run quic_server.py in a subprocess for the duration of a benchmark"""
+
+    def __init__(
+        self,
+        port: int,
+        profile: str = DEFAULT_PROFILE,
+        extra_args: Sequence[str] = (),
+        host: str = "127.0.0.1",
+        ready_timeout: float = 15.0,
+        probe_timeout: float = 0.5,
+    ):
+        self.host = host
+        self.port = port
+        self.profile = profile
+        self.extra_args = list(extra_args)
+        self.ready_timeout = ready_timeout
+        self.probe_timeout = probe_timeout
+        self.process: Optional[asyncio.subprocess.Process] = None
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, SERVER_SCRIPT,
+            "--host", self.host,
+            "--port", str(self.port),
+            "--profile", self.profile,
+            "--event-log-dir", "",
+            "--state-dir", "",
+            "--log-level", "WARNING",
+            *self.extra_args,
+            cwd=PROJECT_DIR,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        await self.wait_ready()
+
+    async def wait_ready(self):
+        """Poll with single-request connections until the server answers"""
+        deadline = time.monotonic() + self.ready_timeout
+        while time.monotonic() < deadline:
+            if self.process.returncode is not None:
+                raise RuntimeError(f"quic_server.py exited with code {self.process.returncode}")
+            probe = await run_load_test(self.host, self.port, connections=1, messages=1,
+                                        profile=self.profile, timeout=self.probe_timeout)
+            if not probe.errors:
+                return
+        raise RuntimeError(f"quic_server.py not ready on port {self.port} after {self.ready_timeout}s")
+
+    async def stop(self):
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), 5.0)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+
+    def rss_bytes(self) -> Optional[int]:
+        """Resident set size of the server process (Linux only)"""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, AttributeError):
+            pass
+        return None
+
+    def cpu_seconds(self) -> Optional[float]:
+        """User + system CPU time used by the server process (Linux only)"""
+        try:
+            with open(f"/proc/{self.process.pid}/stat") as f:
+                fields = f.read().rpartition(")")[2].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, AttributeError):
+            return None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+
+def print_result(result: LoadTestResult, title: str = "LOAD TEST RESULTS"):
+    summary = result.summary()
+    print("\n" + "=" * 70)
+    print(f"📈 {title}")
+    print("=" * 70)
+    print(f"Connections: {result.connections} | Requests: {result.requests} | Errors: {result.errors}")
+    print(f"Elapsed:     {result.elapsed:.2f}s | {result.requests_per_second:,.0f} req/s "
+          f"| {result.goodput_mbps:.2f} Mbit/s")
+    if "handshake_p50" in summary:
+        print(f"Handshake:   p50 {summary['handshake_p50'] * 1000:.1f}ms | p99 {summary['handshake_p99'] * 1000:.1f}ms")
+    if "latency_p50" in summary:
+        print(f"Latency:     p50 {summary['latency_p50'] * 1000:.1f}ms | p99 {summary['latency_p99'] * 1000:.1f}ms")
+    if result.migrations:
+        print(f"Migrations:  {result.migrations}")
+    if result.h3 is not None:
+        print(f"QPACK:       encode {summary['qpack_encode_us']:.1f}us | decode {summary['qpack_decode_us']:.1f}us "
+              f"per header block | {summary['qpack_ratio']:.0%} of raw header size | {summary['h3_pushes']} pushes")
+    print("=" * 70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a running quic_server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4433)
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=10, help="echo requests per connection")
+    parser.add_argument("--message-size", type=int, default=64, help="bytes per request (keep under ~1000)")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--think-time", type=float, default=0.0, help="idle seconds between requests")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=list(PROFILES))
+    parser.add_argument("--h3", metavar="PATH",
+                        help="send HTTP/3 GETs for PATH (e.g. /json) to a server run with --h3")
+    parser.add_argument("--migrate-every", type=float, help="rebind each connection to a new port every N seconds")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    result = asyncio.run(run_load_test(
+        host=args.host,
+        port=args.port,
+        connections=args.connections,
+        messages=args.messages,
+        message_size=args.message_size,
+        concurrency=args.concurrency,
+        think_time=args.think_time,
+        profile=args.profile,
+        h3_path=args.h3,
+        migrate_every=args.migrate_every,
+    ))
+    print_result(result)
+
+
+if __name__ == "__main__":
+    main()
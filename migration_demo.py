@@ -6,6 +6,7 @@ Demonstrates different connection migration scenarios
 
 import asyncio
 import logging
+import time
 from typing import List, Dict
 import colorlog
 
@@ -22,7 +23,8 @@ handler.setFormatter(colorlog.ColoredFormatter(
     }
 ))
 logger = colorlog.getLogger()
-logger.addHandler(handler)
+if not logger.handlers:  # another demo module may already have configured logging
+    logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
 
@@ -294,6 +296,25 @@ def print_migration_benefits():
     print("="*70 + "\n")
 
 
+def run_live_scenarios():
+    """Run every scenario once against a local quic_server.py"""
+    print("\n🏃 Running all scenarios against 127.0.0.1:4433")
+    print("   (start the server first with: python quic_server.py)\n")
+
+    try:
+        from scenario_runner import run_scenarios, print_results
+    except ImportError as e:
+        print(f"❌ Live demo unavailable: {e}")
+        print("   Install with: pip install -r requirements.txt\n")
+        return
+
+    start = time.perf_counter()
+    results = asyncio.run(run_scenarios(step_timeout=3.0))
+    print_results(results, time.perf_counter() - start)
+
+    print("For more load: python scenario_runner.py --instances 100\n")
+
+
 def interactive_menu():
     """Display interactive menu for exploring scenarios"""
     print("\n" + "="*70)
@@ -334,10 +355,7 @@ def interactive_menu():
             except:
                 print("❌ Invalid input")
         elif choice == "4":
-            print("\n🏃 To run the live demo:")
-            print("   1. In terminal 1: python quic_server.py")
-            print("   2. In terminal 2: python quic_client.py")
-            print("   3. Watch the migration events in both terminals!\n")
+            run_live_scenarios()
         else:
             print("❌ Invalid choice. Please try again.")
 
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Migration Flood Benchmark
+Attack-style test of the per-connection migration rate limiter
+
+Attacker connections rebind to a fresh local port every few milliseconds
+and send a request from each new port, so the server has to set up and
+validate a new path and record a migration each time. A well-behaved
+client measures echo latency at the same time. The server's CPU time and
+the victim's latency are compared with the limiter disabled and enabled.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import statistics
+import time
+from functools import partial
+from typing import Dict, List
+
+from aioquic.asyncio import connect
+
+from load_test import ServerProcess, percentile, server_stats
+from quic_client import QuicClientProtocol, rebind, send_message
+from tuning_profiles import DEFAULT_PROFILE, PROFILES, get_profile
+
+CONFIGURATIONS = {
+    "no limiter": ["--migration-rate", "0", "--prefix-migration-rate", "0"],
+    "rate limited": ["--migration-rate", "2", "--migration-burst", "5",
+                     "--prefix-migration-rate", "50", "--prefix-migration-burst", "100"],
+}
+
+
+def _client_configuration(profile: str):
+    tuning = get_profile(profile)
+    return tuning.configuration(is_client=True, verify_mode=False), partial(QuicClientProtocol, profile=tuning)
+
+
+async def _attacker(host: str, port: int, profile: str, interval: float, stop: asyncio.Event, rotations: List[int]):
+    configuration, create_protocol = _client_configuration(profile)
+    async with connect(host, port, configuration=configuration, create_protocol=create_protocol) as protocol:
+        quic = protocol._quic
+        transport = protocol._transport
+        while not stop.is_set():
+            transport = await rebind(protocol)
+            stream_id = quic.get_next_available_stream_id()
+            quic.send_stream_data(stream_id, b"x", end_stream=True)
+            protocol.transmit()
+            rotations[0] += 1
+            await asyncio.sleep(interval)
+        transport.close()
+
+
+def _attack_process(host: str, port: int, profile: str, attackers: int, interval: float,
+                    duration: float, rotations):
+    """Run `attackers` rotating connections in their own process and event loop"""
+    logging.getLogger().setLevel(logging.ERROR)
+
+    async def attack():
+        stop = asyncio.Event()
+        counter = [0]
+        tasks = [
+            asyncio.ensure_future(_attacker(host, port, profile, interval, stop, counter))
+            for _ in range(attackers)
+        ]
+        await asyncio.sleep(duration)
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        with rotations.get_lock():
+            rotations.value += counter[0]
+
+    asyncio.run(attack())
+
+
+async def _victim(host: str, port: int, profile: str, stop: asyncio.Event, latencies: List[float], errors: List[int]):
+    configuration, create_protocol = _client_configuration(profile)
+    async with connect(host, port, configuration=configuration, create_protocol=create_protocol) as protocol:
+        while not stop.is_set():
+            sent = time.perf_counter()
+            try:
+                await asyncio.wait_for(send_message(protocol, "hello"), 2.0)
+                latencies.append(time.perf_counter() - sent)
+            except asyncio.TimeoutError:
+                errors[0] += 1
+            await asyncio.sleep(0.01)
+
+
+async def run_attack(
+    label: str,
+    server_args: List[str],
+    attackers: int,
+    processes: int,
+    interval: float,
+    duration: float,
+    port: int,
+    profile: str,
+    host: str = "127.0.0.1",
+) -> Dict:
+    stop = asyncio.Event()
+    rotations = multiprocessing.Value("L", 0)
+    latencies: List[float] = []
+    victim_errors = [0]
+
+    async with ServerProcess(port=port, profile=profile, extra_args=server_args) as server:
+        cpu_before = server.cpu_seconds() or 0.0
+        started = time.monotonic()
+        victim = asyncio.ensure_future(_victim(host, port, profile, stop, latencies, victim_errors))
+        workers = [
+            multiprocessing.Process(target=_attack_process, daemon=True, args=(
+                host, port, profile, attackers // processes, interval, duration, rotations))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        await asyncio.sleep(duration)
+        stop.set()
+        await asyncio.gather(victim, return_exceptions=True)
+        for worker in workers:
+            await asyncio.get_running_loop().run_in_executor(None, worker.join, 10)
+        elapsed = time.monotonic() - started
+        cpu = (server.cpu_seconds() or 0.0) - cpu_before
+        stats = await server_stats(host, port, profile)
+
+    return {
+        "label": label,
+        "rotations_per_second": rotations.value / elapsed,
+        "server_cpu_percent": 100 * cpu / elapsed,
+        "cpu_per_new_path_ms": 1000 * cpu / stats["new_paths"] if stats.get("new_paths") else float("nan"),
+        "victim_requests": len(latencies),
+        "victim_errors": victim_errors[0],
+        "victim_p50": statistics.median(latencies) if latencies else float("nan"),
+        "victim_p99": percentile(latencies, 0.99),
+        **{key: stats.get(key, 0) for key in ("new_paths", "paths_allowed", "limited_by_connection",
+                                              "limited_by_prefix")},
+    }
+
+
+def print_report(results: List[Dict]):
+    print("\n" + "=" * 70)
+    print("🧨 MIGRATION FLOOD")
+    print("=" * 70)
+    for r in results:
+        print(f"\n📌 {r['label']}: attackers rotated {r['rotations_per_second']:,.0f} paths/s")
+        print(f"   Server CPU:  {r['server_cpu_percent']:.0f}% of one core "
+              f"({r['cpu_per_new_path_ms']:.2f}ms per new-path packet)")
+        print(f"   New paths:   {r['new_paths']:,} seen | {r['paths_allowed']:,} allowed "
+              f"| {r['limited_by_connection']:,} limited per connection | {r['limited_by_prefix']:,} per prefix")
+        print(f"   Victim:      {r['victim_requests']} requests | p50 {r['victim_p50'] * 1000:.1f}ms "
+              f"| p99 {r['victim_p99'] * 1000:.1f}ms | timeouts {r['victim_errors']}")
+    print("\n" + "=" * 70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rotate client ports rapidly and measure server cost")
+    parser.add_argument("--attackers", type=int, default=10, help="connections rotating ports")
+    parser.add_argument("--processes", type=int, default=1, help="attacker processes")
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between rotations per attacker")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=list(PROFILES))
+    parser.add_argument("--port", type=int, default=14933)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    results = []
+    for label, server_args in CONFIGURATIONS.items():
+        print(f"   running: {label} ...")
+        results.append(asyncio.run(run_attack(
+            label, server_args, args.attackers, args.processes, args.interval, args.duration, args.port, args.profile,
+        )))
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
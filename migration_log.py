@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Persistent Migration Event Log
+Append-only binary log of migration events with a memory-mapped reader
+
+Records are fixed-width so the reader can index straight into a segment
+and binary-search by timestamp without loading whole files into memory.
+"""
+
+import argparse
+import ipaddress
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from hashlib import blake2b
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Segment header: magic, record size, reserved
+SEGMENT_MAGIC = b"QMIGLOG1"
+HEADER_FORMAT = struct.Struct("<8sII")
+HEADER_SIZE = HEADER_FORMAT.size
+
+# Record: timestamp, connection key, old ip/port, new ip/port, migration number
+RECORD_FORMAT = struct.Struct("<dQ16sH16sHI8x")
+RECORD_SIZE = RECORD_FORMAT.size
+
+SEGMENT_SUFFIX = ".mlog"
+# "<key> <connection ID>" per line, written the first time a key is logged
+CONNECTIONS_FILE = "connections.txt"
+DEFAULT_SEGMENT_RECORDS = 1 << 20  # 64 MiB per segment
+
+_TIMESTAMP = struct.Struct("<d")
+_EMPTY_IP = bytes(16)
+
+
+class MigrationRecord(NamedTuple):
+    """A single decoded migration event"""
+
+    timestamp: float
+    connection_key: int
+    old_address: Optional[Tuple[str, int]]
+    new_address: Optional[Tuple[str, int]]
+    migration_number: int
+
+
+def connection_key(conn_id: str) -> int:
+    """Map a tracker connection ID to the 64-bit key stored on disk"""
+    return int.from_bytes(blake2b(conn_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _pack_address(addr) -> Tuple[bytes, int]:
+    if not addr:
+        return _EMPTY_IP, 0
+    ip = ipaddress.ip_address(addr[0])
+    if ip.version == 4:
+        ip = ipaddress.IPv6Address(b"\x00" * 10 + b"\xff\xff" + ip.packed)
+    return ip.packed, addr[1]
+
+
+def _unpack_address(packed: bytes, port: int) -> Optional[Tuple[str, int]]:
+    if packed == _EMPTY_IP and port == 0:
+        return None
+    ip = ipaddress.IPv6Address(packed)
+    host = str(ip.ipv4_mapped) if ip.ipv4_mapped else str(ip)
+    return host, port
+
+
+def encode_record(timestamp: float, conn_id: str, old_addr, new_addr, migration_number: int) -> bytes:
+    """Encode one migration event as a fixed-width record"""
+    old_ip, old_port = _pack_address(old_addr)
+    new_ip, new_port = _pack_address(new_addr)
+    return RECORD_FORMAT.pack(
+        timestamp, connection_key(conn_id), old_ip, old_port, new_ip, new_port, migration_number
+    )
+
+
+def decode_record(buf, offset: int = 0) -> MigrationRecord:
+    """Decode the record starting at `offset` in `buf`"""
+    timestamp, key, old_ip, old_port, new_ip, new_port, number = RECORD_FORMAT.unpack_from(buf, offset)
+    return MigrationRecord(
+        timestamp, key, _unpack_address(old_ip, old_port), _unpack_address(new_ip, new_port), number
+    )
+
+
+def load_connection_ids(directory: str) -> Dict[int, str]:
+    """Read the key -> connection ID table of a log directory"""
+    ids = {}
+    try:
+        with open(os.path.join(directory, CONNECTIONS_FILE), encoding="utf-8") as f:
+            for line in f:
+                key, _, conn_id = line.rstrip("\n").partition(" ")
+                if key.isdigit() and conn_id:
+                    ids[int(key)] = conn_id
+    except FileNotFoundError:
+        pass
+    return ids
+
+
+def _segment_paths(directory: str) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(n for n in os.listdir(directory) if n.endswith(SEGMENT_SUFFIX))
+    return [os.path.join(directory, n) for n in names]
+
+
+class MigrationEventLog:
+    """Batched background writer for the migration event log
+
+    `append()` only enqueues; a single writer thread packs queued events
+    into one buffer per batch and rotates to a new segment file once the
+    current one holds `segment_records` records.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        directory: str,
+        segment_records: int = DEFAULT_SEGMENT_RECORDS,
+        batch_size: int = 512,
+        flush_interval: float = 0.5,
+    ):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.records_written = 0
+        self.records_dropped = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._file = None
+        self._segment_index = 0
+        self._segment_count = 0
+        self._open_tail_segment()
+        self._known_keys = set(load_connection_ids(directory))
+        self._connections = open(os.path.join(directory, CONNECTIONS_FILE), "a", encoding="utf-8")
+
+        self._thread = threading.Thread(target=self._run, name="migration-log-writer", daemon=True)
+        self._thread.start()
+
+    def append(self, conn_id: str, old_addr, new_addr, migration_number: int, timestamp: Optional[float] = None):
+        """Queue a migration event for writing"""
+        if timestamp is None:
+            timestamp = time.time()
+        self._queue.put((timestamp, conn_id, old_addr, new_addr, migration_number))
+
+    def close(self):
+        """Flush pending events and stop the writer thread"""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open_tail_segment(self):
+        paths = _segment_paths(self.directory)
+        if paths:
+            last = paths[-1]
+            self._segment_index = int(os.path.basename(last)[: -len(SEGMENT_SUFFIX)])
+            size = os.path.getsize(last)
+            count = max(size - HEADER_SIZE, 0) // RECORD_SIZE
+            if size >= HEADER_SIZE and count < self.segment_records:
+                # Resume the last segment, dropping any torn trailing record
+                self._file = open(last, "r+b")
+                self._file.truncate(HEADER_SIZE + count * RECORD_SIZE)
+                self._file.seek(0, os.SEEK_END)
+                self._segment_count = count
+                return
+            self._segment_index += 1
+        self._open_segment()
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, f"{self._segment_index:08d}{SEGMENT_SUFFIX}")
+        self._file = open(path, "wb")
+        self._file.write(HEADER_FORMAT.pack(SEGMENT_MAGIC, RECORD_SIZE, 0))
+        self._segment_count = 0
+        logger.debug(f"Opened migration log segment {path}")
+
+    def _rotate(self):
+        self._file.close()
+        self._segment_index += 1
+        self._open_segment()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = []
+            while True:
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    # keep the thread alive: a dead writer would let the queue grow forever
+                    logger.error(f"❌ Failed to write migration log batch of {len(batch)} events: {e}")
+
+        self._file.close()
+        self._connections.close()
+
+    def _write_batch(self, batch):
+        start = 0
+        while start < len(batch):
+            room = self.segment_records - self._segment_count
+            if room <= 0:
+                self._rotate()
+                continue
+            chunk = batch[start:start + room]
+            start += len(chunk)
+            records = []
+            new_ids = []
+            for event in chunk:
+                try:
+                    records.append(encode_record(*event))
+                except (ValueError, TypeError, struct.error) as e:
+                    self.records_dropped += 1
+                    logger.error(f"❌ Dropped unencodable migration event {event!r}: {e}")
+                    continue
+                key = connection_key(event[1])
+                if key not in self._known_keys:
+                    self._known_keys.add(key)
+                    new_ids.append(f"{key} {event[1]}\n")
+            if new_ids:
+                # before the records, so a reader never sees a key it can't name
+                self._connections.write("".join(new_ids))
+                self._connections.flush()
+            self._file.write(b"".join(records))
+            self._segment_count += len(records)
+            self.records_written += len(records)
+        self._file.flush()
+
+
+class _Segment:
+    """Read-only memory-mapped view of one segment file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fp = open(path, "rb")
+        size = os.fstat(self._fp.fileno()).st_size
+        self.count = max(size - HEADER_SIZE, 0) // RECORD_SIZE
+        self._mm = None
+        if self.count:
+            self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, record_size, _ = HEADER_FORMAT.unpack_from(self._mm, 0)
+            if magic != SEGMENT_MAGIC or record_size != RECORD_SIZE:
+                raise ValueError(f"{path} is not a migration log segment")
+
+    def timestamp(self, index: int) -> float:
+        return _TIMESTAMP.unpack_from(self._mm, HEADER_SIZE + index * RECORD_SIZE)[0]
+
+    def record(self, index: int) -> MigrationRecord:
+        return decode_record(self._mm, HEADER_SIZE + index * RECORD_SIZE)
+
+    def bisect(self, timestamp: float) -> int:
+        """Index of the first record at or after `timestamp`"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._fp.close()
+
+
+class MigrationLogReader:
+    """Memory-mapped reader over all segments in a log directory
+
+    Records are assumed to be appended in timestamp order, which holds for
+    a single writer; `scan()` with a time range uses binary search.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.connection_ids = load_connection_ids(directory)
+        self._segments: List[_Segment] = []
+        for path in _segment_paths(directory):
+            segment = _Segment(path)
+            if segment.count:
+                self._segments.append(segment)
+            else:
+                segment.close()
+
+    def __len__(self) -> int:
+        return sum(s.count for s in self._segments)
+
+    def __iter__(self) -> Iterator[MigrationRecord]:
+        return self.scan()
+
+    def close(self):
+        for segment in self._segments:
+            segment.close()
+        self._segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def connection_id(self, key: int) -> str:
+        """The logged connection ID for `key`, or the key itself if unknown"""
+        return self.connection_ids.get(key, str(key))
+
+    def scan(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        connection_key: Optional[int] = None,
+    ) -> Iterator[MigrationRecord]:
+        """Yield records with `start <= timestamp < end`, optionally for one connection"""
+        seg_idx, rec_idx = self._locate(start) if start is not None else (0, 0)
+
+        for segment in self._segments[seg_idx:]:
+            for i in range(rec_idx, segment.count):
+                if end is not None and segment.timestamp(i) >= end:
+                    return
+                record = segment.record(i)
+                if connection_key is None or record.connection_key == connection_key:
+                    yield record
+            rec_idx = 0
+
+    def first_after(self, timestamp: float) -> Optional[MigrationRecord]:
+        """Return the first record at or after `timestamp`"""
+        return next(self.scan(start=timestamp), None)
+
+    def _locate(self, timestamp: float) -> Tuple[int, int]:
+        # Pick the last segment whose first record is not after `timestamp`
+        lo, hi = 0, len(self._segments)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._segments[mid].timestamp(0) <= timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        seg_idx = max(lo - 1, 0)
+        if seg_idx >= len(self._segments):
+            return seg_idx, 0
+        rec_idx = self._segments[seg_idx].bisect(timestamp)
+        if rec_idx == self._segments[seg_idx].count:
+            return seg_idx + 1, 0
+        return seg_idx, rec_idx
+
+
+def _format_address(addr) -> str:
+    return f"{addr[0]}:{addr[1]}" if addr else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query a QUIC migration event log")
+    parser.add_argument("directory", help="log directory written by quic_server.py")
+    parser.add_argument("--since", type=float, help="unix timestamp to start from")
+    parser.add_argument("--until", type=float, help="unix timestamp to stop before")
+    parser.add_argument("--connection", help="only show this connection (ID or numeric key)")
+    parser.add_argument("--count", action="store_true", help="only print the number of matching records")
+    args = parser.parse_args()
+
+    key = None
+    if args.connection:
+        # server IDs always contain a '-', so an all-digit value is a key
+        key = int(args.connection) if args.connection.isdigit() else connection_key(args.connection)
+
+    with MigrationLogReader(args.directory) as reader:
+        records = reader.scan(start=args.since, end=args.until, connection_key=key)
+        if args.count:
+            print(sum(1 for _ in records))
+            return
+        for record in records:
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.timestamp))
+            print(
+                f"{when}.{int(record.timestamp * 1000) % 1000:03d} | conn {reader.connection_id(record.connection_key)} "
+                f"| #{record.migration_number} | {_format_address(record.old_address)} -> "
+                f"{_format_address(record.new_address)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Monte Carlo Simulator for Path Validation and Migration Outcomes
+Vectorized NumPy version of the notebook models for capacity and timeout planning
+
+The timeout model follows `calculate_validation_timeout` from
+path_validation_deep_dive.ipynb (3 x PTO), but every function here works on
+whole arrays of trials at once.
+"""
+
+import argparse
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAX_ACK_DELAY = 0.025  # 25ms, as in the notebook
+VALIDATION_PTO_MULTIPLIER = 3
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+
+def calculate_validation_timeout(rtt, rtt_var, max_ack_delay: float = MAX_ACK_DELAY):
+    """Calculate validation timeout based on RTT (scalars or arrays)"""
+    pto = calculate_pto(rtt, rtt_var, max_ack_delay)
+    return VALIDATION_PTO_MULTIPLIER * pto
+
+
+def calculate_pto(rtt, rtt_var, max_ack_delay: float = MAX_ACK_DELAY):
+    """Probe timeout: rtt + 4 * rtt_var + max_ack_delay"""
+    return rtt + 4 * rtt_var + max_ack_delay
+
+
+class Distribution:
+    """A named sampler for one simulation input
+
+    `support` is the (lowest, highest) value the sampler can return.
+    """
+
+    def __init__(self, name: str, sampler, description: str, support: Tuple[float, float]):
+        self.name = name
+        self._sampler = sampler
+        self.description = description
+        self.support = support
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        return np.broadcast_to(np.asarray(self._sampler(rng, size), dtype=np.float64), (size,))
+
+    def __repr__(self):
+        return f"Distribution({self.description})"
+
+    @classmethod
+    def constant(cls, value: float) -> "Distribution":
+        if not np.isfinite(value):
+            raise ValueError(f"const value must be finite, got {value}")
+        return cls("const", lambda rng, n: np.full(n, value), f"const {value}", (value, value))
+
+    @classmethod
+    def uniform(cls, low: float, high: float) -> "Distribution":
+        if not (np.isfinite(low) and np.isfinite(high) and low <= high):
+            raise ValueError(f"uniform needs finite LO <= HI, got [{low}, {high})")
+        return cls("uniform", lambda rng, n: rng.uniform(low, high, n), f"uniform [{low}, {high})", (low, high))
+
+    @classmethod
+    def lognormal(cls, median: float, sigma: float) -> "Distribution":
+        """Log-normal with the given median, a common fit for RTTs"""
+        if not (0 < median < np.inf and 0 <= sigma < np.inf):
+            raise ValueError(f"lognormal needs MEDIAN > 0 and SIGMA >= 0, got {median}, {sigma}")
+        return cls(
+            "lognormal",
+            lambda rng, n: rng.lognormal(np.log(median), sigma, n),
+            f"lognormal median={median} sigma={sigma}",
+            (0.0, np.inf),
+        )
+
+    @classmethod
+    def beta(cls, mean: float, concentration: float = 20.0) -> "Distribution":
+        """Beta distribution on [0, 1] with the given mean, for loss rates"""
+        # both shape parameters must be positive
+        if not (0 < mean < 1 and 0 < concentration < np.inf):
+            raise ValueError(f"beta needs 0 < MEAN < 1 and K > 0, got {mean}, {concentration}")
+        a, b = mean * concentration, (1 - mean) * concentration
+        return cls("beta", lambda rng, n: rng.beta(a, b, n), f"beta mean={mean} k={concentration}", (0.0, 1.0))
+
+    @classmethod
+    def empirical(cls, values: Sequence[float]) -> "Distribution":
+        """Resample from measured values (e.g. RTTs pulled from a capture)"""
+        data = np.asarray(values, dtype=np.float64)
+        if not data.size:
+            raise ValueError("empirical needs at least one value")
+        return cls(
+            "empirical", lambda rng, n: rng.choice(data, n), f"empirical n={len(data)}",
+            (float(data.min()), float(data.max())),
+        )
+
+    @classmethod
+    def parse(cls, spec: str) -> "Distribution":
+        """Parse 'const:V', 'uniform:LO,HI', 'lognormal:MEDIAN,SIGMA' or 'beta:MEAN[,K]'"""
+        kind, _, args = spec.partition(":")
+        params = [float(x) for x in args.split(",") if x]
+        factories = {
+            "const": cls.constant,
+            "uniform": cls.uniform,
+            "lognormal": cls.lognormal,
+            "beta": cls.beta,
+        }
+        if kind not in factories:
+            raise ValueError(f"unknown distribution '{kind}' (expected one of {', '.join(factories)})")
+        try:
+            return factories[kind](*params)
+        except TypeError:
+            raise ValueError(f"wrong number of parameters for '{kind}' in '{spec}'") from None
+
+
+@dataclass
+class SimulationConfig:
+    """Inputs to one Monte Carlo run"""
+
+    rtt: Distribution
+    loss: Distribution
+    rebinding_rate: Distribution  # migrations per connection-hour
+    rtt_var_ratio: float = 0.25  # rtt_var as a fraction of RTT
+    max_ack_delay: float = MAX_ACK_DELAY
+    pto_backoff: float = 2.0  # PATH_CHALLENGE retransmits back off like PTO
+    detection_delay: Distribution = Distribution.constant(0.0)  # time until client's next packet on the new path
+    fallback_rtts: float = 2.0  # RTTs to reconnect when validation fails (handshake + first request)
+    session_hours: float = 1.0
+    trials: int = DEFAULT_CHUNK_SIZE
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    seed: Optional[int] = None
+
+
+@dataclass
+class SimulationResult:
+    """Per-trial outcomes from `simulate()`"""
+
+    success: np.ndarray  # bool, path validated before timeout
+    attempts: np.ndarray  # PATH_CHALLENGEs sent
+    validation_time: np.ndarray  # seconds, NaN when validation failed
+    stall_time: np.ndarray  # seconds the application saw no progress
+    timeout: np.ndarray  # validation timeout used for each trial
+    stall_per_session: np.ndarray  # total stall per simulated connection session
+
+    @property
+    def success_rate(self) -> float:
+        return float(self.success.mean())
+
+    def summary(self) -> Dict[str, float]:
+        """Success rate and percentiles of the main outcome distributions"""
+        validated = self.validation_time[self.success]
+        result = {
+            "trials": int(self.success.size),
+            "success_rate": self.success_rate,
+            "mean_attempts": float(self.attempts.mean()),
+        }
+        for name, values in (
+            ("validation_time", validated),
+            ("stall_time", self.stall_time),
+            ("stall_per_session", self.stall_per_session),
+        ):
+            if values.size:
+                p50, p90, p99, p999 = np.percentile(values, [50, 90, 99, 99.9])
+                result.update({
+                    f"{name}_mean": float(values.mean()),
+                    f"{name}_p50": float(p50),
+                    f"{name}_p90": float(p90),
+                    f"{name}_p99": float(p99),
+                    f"{name}_p999": float(p999),
+                })
+        return result
+
+
+def _simulate_chunk(config: SimulationConfig, rng: np.random.Generator, n: int):
+    rtt = config.rtt.sample(rng, n)
+    rtt_var = rtt * config.rtt_var_ratio
+    loss = np.clip(config.loss.sample(rng, n), 0.0, 1.0)
+
+    pto = calculate_pto(rtt, rtt_var, config.max_ack_delay)
+    timeout = calculate_validation_timeout(rtt, rtt_var, config.max_ack_delay)
+
+    # Challenge k is sent at pto * (1 + b + ... + b^(k-1)); the response
+    # must be back before the validation timeout for the attempt to count.
+    b = config.pto_backoff
+    max_attempts = 1
+    while True:
+        geometric = max_attempts if b == 1 else (b ** max_attempts - 1) / (b - 1)
+        if geometric >= VALIDATION_PTO_MULTIPLIER:
+            break
+        max_attempts += 1
+    k = np.arange(max_attempts)
+    offsets = k.astype(np.float64) if b == 1 else (b ** k - 1) / (b - 1)
+    send_times = pto[:, None] * offsets[None, :]
+    in_time = send_times + rtt[:, None] <= timeout[:, None]
+
+    # Both PATH_CHALLENGE and PATH_RESPONSE must survive
+    delivered = rng.random((n, max_attempts)) >= loss[:, None]
+    delivered &= rng.random((n, max_attempts)) >= loss[:, None]
+    delivered &= in_time
+
+    success = delivered.any(axis=1)
+    first = delivered.argmax(axis=1)
+    attempts = np.where(success, first + 1, in_time.sum(axis=1))
+    validation_time = np.where(success, send_times[np.arange(n), first] + rtt, np.nan)
+
+    detection = config.detection_delay.sample(rng, n)
+    stall = detection + np.where(success, validation_time, timeout + config.fallback_rtts * rtt)
+    return success, attempts, validation_time, stall, timeout
+
+
+def simulate(config: SimulationConfig) -> SimulationResult:
+    """Run `config.trials` vectorized path-validation trials in chunks"""
+    rng = np.random.default_rng(config.seed)
+    parts = []
+    remaining = config.trials
+    while remaining > 0:
+        n = min(remaining, config.chunk_size)
+        parts.append(_simulate_chunk(config, rng, n))
+        remaining -= n
+
+    success, attempts, validation_time, stall, timeout = (np.concatenate(p) for p in zip(*parts))
+
+    # Sessions: each trial stands for one migration; sessions draw a Poisson
+    # number of migrations at their own rate and sum those stalls.
+    sessions = max(config.trials // 10, 1)
+    rates = np.maximum(config.rebinding_rate.sample(rng, sessions), 0.0)
+    counts = rng.poisson(rates * config.session_hours)
+    picks = rng.integers(0, stall.size, counts.sum())
+    stall_per_session = np.bincount(
+        np.repeat(np.arange(sessions), counts), weights=stall[picks], minlength=sessions
+    )
+
+    return SimulationResult(
+        success=success,
+        attempts=attempts,
+        validation_time=validation_time,
+        stall_time=stall,
+        timeout=timeout,
+        stall_per_session=stall_per_session,
+    )
+
+
+def print_summary(config: SimulationConfig, result: SimulationResult):
+    summary = result.summary()
+
+    print("\n" + "=" * 70)
+    print("🎲 PATH VALIDATION MONTE CARLO")
+    print("=" * 70)
+    print(f"RTT:             {config.rtt.description}")
+    print(f"Loss:            {config.loss.description}")
+    print(f"Rebinding rate:  {config.rebinding_rate.description} per connection-hour")
+    print(f"Trials:          {summary['trials']:,}")
+    print("-" * 70)
+    print(f"Validation success rate:  {summary['success_rate'] * 100:.3f}%")
+    print(f"Mean PATH_CHALLENGEs:     {summary['mean_attempts']:.2f}")
+
+    def row(label, key):
+        if f"{key}_p50" in summary:
+            print(
+                f"{label:26}p50 {summary[key + '_p50'] * 1000:8.1f}ms | "
+                f"p90 {summary[key + '_p90'] * 1000:8.1f}ms | "
+                f"p99 {summary[key + '_p99'] * 1000:8.1f}ms"
+            )
+
+    row("Validation time:", "validation_time")
+    row("Migration stall:", "stall_time")
+    row(f"Stall per {config.session_hours:g}h session:", "stall_per_session")
+    print("=" * 70 + "\n")
+
+
+def _positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected an integer, got '{value}'") from None
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo estimates for QUIC path validation and migration")
+    parser.add_argument("--rtt", default="lognormal:0.05,0.6", help="RTT distribution in seconds")
+    parser.add_argument("--loss", default="beta:0.02", help="per-packet loss probability distribution")
+    parser.add_argument("--rebinding-rate", default="uniform:0,6", help="migrations per connection-hour")
+    parser.add_argument("--detection-delay", default="const:0", help="delay before the server sees the new path")
+    parser.add_argument("--rtt-var-ratio", type=float, default=0.25)
+    parser.add_argument("--session-hours", type=float, default=1.0)
+    parser.add_argument("--trials", type=_positive_int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    try:
+        rtt, loss, rebinding_rate, detection_delay = (
+            Distribution.parse(spec) for spec in (args.rtt, args.loss, args.rebinding_rate, args.detection_delay)
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    if not 0 <= loss.support[0] <= loss.support[1] <= 1:
+        parser.error(f"--loss must stay within [0, 1], got {loss.description}")
+
+    config = SimulationConfig(
+        rtt=rtt,
+        loss=loss,
+        rebinding_rate=rebinding_rate,
+        detection_delay=detection_delay,
+        rtt_var_ratio=args.rtt_var_ratio,
+        session_hours=args.session_hours,
+        trials=args.trials,
+        seed=args.seed,
+    )
+    print_summary(config, simulate(config))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Offline QUIC Migration Analyzer
+Streams pcap/pcapng captures and reconstructs connection migrations
+
+Packets are parsed with plain struct offsets straight out of a memory-mapped
+capture (no per-packet scapy objects), grouped by QUIC Destination Connection
+ID, and every change of the UDP 4-tuple within a group is reported as a
+migration.
+"""
+
+import argparse
+import ipaddress
+import mmap
+import struct
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# pcap magic numbers (microsecond / nanosecond resolution)
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+# Link-layer types we know how to strip
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = (0x8100, 0x88A8)
+
+# LINKTYPE_NULL address families; IPv6's value differs between BSDs
+NULL_FAMILY_IPV4 = 2
+NULL_FAMILY_IPV6 = (24, 28, 30)
+
+IPPROTO_UDP = 17
+IPV6_EXTENSION_HEADERS = (0, 43, 60)
+IPV6_FRAGMENT_HEADER = 44
+
+DEFAULT_CID_LENGTH = 8
+
+# (src ip bytes, src port, dst ip bytes, dst port)
+FourTuple = Tuple[bytes, int, bytes, int]
+
+_U16 = struct.Struct("!H")
+
+
+def _iter_pcap(buf, endian: str, ts_scale: float) -> Iterator[Tuple[float, int, memoryview]]:
+    header = struct.Struct(endian + "IIII")
+    linktype = struct.unpack_from(endian + "I", buf, 20)[0] & 0xFFFF
+    view = memoryview(buf)
+    offset, end = 24, len(buf)
+    while offset + 16 <= end:
+        ts_sec, ts_frac, caplen, _ = header.unpack_from(buf, offset)
+        offset += 16
+        if offset + caplen > end:
+            break
+        yield ts_sec + ts_frac * ts_scale, linktype, view[offset:offset + caplen]
+        offset += caplen
+
+
+def _iter_pcapng(buf) -> Iterator[Tuple[float, int, memoryview]]:
+    view = memoryview(buf)
+    offset, end = 0, len(buf)
+    endian = "<"
+    interfaces: List[Tuple[int, float]] = []  # (linktype, seconds per tick)
+
+    while offset + 12 <= end:
+        block_type = struct.unpack_from(endian + "I", buf, offset)[0]
+        if block_type == PCAPNG_SHB:
+            bom = struct.unpack_from("<I", buf, offset + 8)[0]
+            endian = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+            interfaces = []
+        block_len = struct.unpack_from(endian + "I", buf, offset + 4)[0]
+        if block_len < 12 or offset + block_len > end:
+            break
+        body = offset + 8
+
+        if block_type == 1:  # Interface Description Block
+            linktype = struct.unpack_from(endian + "H", buf, body)[0]
+            interfaces.append((linktype, _pcapng_ts_resolution(buf, body + 8, offset + block_len - 4, endian)))
+        elif block_type == 6:  # Enhanced Packet Block
+            if_id, ts_high, ts_low, caplen = struct.unpack_from(endian + "IIII", buf, body)
+            if if_id < len(interfaces):
+                linktype, tick = interfaces[if_id]
+                start = body + 20
+                yield ((ts_high << 32) | ts_low) * tick, linktype, view[start:start + caplen]
+        elif block_type == 3 and interfaces:  # Simple Packet Block (no timestamp)
+            orig_len = struct.unpack_from(endian + "I", buf, body)[0]
+            caplen = min(orig_len, block_len - 16)
+            yield 0.0, interfaces[0][0], view[body + 4:body + 4 + caplen]
+
+        offset += block_len
+
+
+def _pcapng_ts_resolution(buf, offset: int, end: int, endian: str) -> float:
+    while offset + 4 <= end:
+        code, length = struct.unpack_from(endian + "HH", buf, offset)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:  # if_tsresol
+            value = buf[offset + 4]
+            return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+        offset += 4 + ((length + 3) & ~3)
+    return 1e-6
+
+
+def iter_capture(buf) -> Iterator[Tuple[float, int, memoryview]]:
+    """Yield (timestamp, linktype, frame) for every packet in a pcap/pcapng buffer"""
+    if len(buf) < 24:
+        raise ValueError("capture too short")
+    magic = struct.unpack_from("<I", buf, 0)[0]
+    if magic == PCAPNG_SHB:
+        return _iter_pcapng(buf)
+    if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+        return _iter_pcap(buf, "<", 1e-6 if magic == PCAP_MAGIC_US else 1e-9)
+    magic = struct.unpack_from(">I", buf, 0)[0]
+    if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+        return _iter_pcap(buf, ">", 1e-6 if magic == PCAP_MAGIC_US else 1e-9)
+    raise ValueError("not a pcap or pcapng capture")
+
+
+def parse_udp(frame, linktype: int) -> Optional[Tuple[FourTuple, memoryview]]:
+    """Strip link, IP and UDP headers; return the 4-tuple and UDP payload"""
+    n = len(frame)
+
+    if linktype == LINKTYPE_ETHERNET:
+        if n < 14:
+            return None
+        ethertype = _U16.unpack_from(frame, 12)[0]
+        offset = 14
+        while ethertype in ETHERTYPE_VLAN and n >= offset + 4:
+            ethertype = _U16.unpack_from(frame, offset + 2)[0]
+            offset += 4
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if n < 16:
+            return None
+        ethertype, offset = _U16.unpack_from(frame, 14)[0], 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        if n < 20:
+            return None
+        ethertype, offset = _U16.unpack_from(frame, 0)[0], 20
+    elif linktype == LINKTYPE_NULL:
+        if n < 4:
+            return None
+        family = frame[0] or frame[3]  # host byte order
+        if family == NULL_FAMILY_IPV4:
+            ethertype = ETHERTYPE_IPV4
+        elif family in NULL_FAMILY_IPV6:
+            ethertype = ETHERTYPE_IPV6
+        else:
+            return None
+        offset = 4
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        if n < 1:
+            return None
+        ethertype = ETHERTYPE_IPV4 if frame[0] >> 4 == 4 else ETHERTYPE_IPV6
+        offset = 0
+    else:
+        return None
+
+    if ethertype == ETHERTYPE_IPV4:
+        if n < offset + 20 or frame[offset + 9] != IPPROTO_UDP:
+            return None
+        header_length = (frame[offset] & 0x0F) * 4
+        total_length = _U16.unpack_from(frame, offset + 2)[0]
+        if header_length < 20 or total_length < header_length:
+            return None
+        if _U16.unpack_from(frame, offset + 6)[0] & 0x1FFF:
+            return None  # non-first fragment
+        src = bytes(frame[offset + 12:offset + 16])
+        dst = bytes(frame[offset + 16:offset + 20])
+        # stop at the IP packet's end: Ethernet pads short frames
+        n = min(n, offset + total_length)
+        offset += header_length
+    elif ethertype == ETHERTYPE_IPV6:
+        if n < offset + 40:
+            return None
+        next_header = frame[offset + 6]
+        payload_length = _U16.unpack_from(frame, offset + 4)[0]
+        src = bytes(frame[offset + 8:offset + 24])
+        dst = bytes(frame[offset + 24:offset + 40])
+        offset += 40
+        if payload_length:  # 0 means a jumbogram; keep the whole frame
+            n = min(n, offset + payload_length)
+        while next_header != IPPROTO_UDP:
+            if n < offset + 8:
+                return None
+            if next_header in IPV6_EXTENSION_HEADERS:
+                next_header, length = frame[offset], (frame[offset + 1] + 1) * 8
+            elif next_header == IPV6_FRAGMENT_HEADER:
+                if _U16.unpack_from(frame, offset + 2)[0] & 0xFFF8:
+                    return None
+                next_header, length = frame[offset], 8
+            else:
+                return None
+            offset += length
+    else:
+        return None
+
+    if n < offset + 8:
+        return None
+    sport, dport = struct.unpack_from("!HH", frame, offset)
+    return (src, sport, dst, dport), frame[offset + 8:n]
+
+
+def parse_quic_dcid(payload, cid_length: int = DEFAULT_CID_LENGTH) -> Optional[bytes]:
+    """Return the Destination Connection ID of a QUIC packet, or None if not QUIC"""
+    if len(payload) < 1 + cid_length:
+        return None
+    first = payload[0]
+    if first & 0x80:
+        # Long header: flags, version (4), DCID length, DCID
+        if len(payload) < 7:
+            return None
+        dcid_len = payload[5]
+        if dcid_len > 20 or len(payload) < 6 + dcid_len:
+            return None
+        return bytes(payload[6:6 + dcid_len])
+    if not first & 0x40:
+        return None  # fixed bit must be set on short headers
+    return bytes(payload[1:1 + cid_length])
+
+
+def format_endpoint(ip: bytes, port: int) -> str:
+    host = ipaddress.ip_address(ip)
+    return f"[{host}]:{port}" if host.version == 6 else f"{host}:{port}"
+
+
+def format_tuple(four_tuple: FourTuple) -> str:
+    src, sport, dst, dport = four_tuple
+    return f"{format_endpoint(src, sport)} -> {format_endpoint(dst, dport)}"
+
+
+class ConnectionTrace:
+    """Per-DCID packet history reduced to the 4-tuple changes"""
+
+    __slots__ = ("dcid", "first_seen", "last_seen", "packets", "four_tuple", "tuple_last_seen", "changes")
+
+    def __init__(self, dcid: bytes, timestamp: float, four_tuple: FourTuple):
+        self.dcid = dcid
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.packets = 0
+        self.four_tuple = four_tuple
+        self.tuple_last_seen = timestamp
+        # (timestamp, old tuple, new tuple, gap since last packet on old tuple)
+        self.changes: List[Tuple[float, FourTuple, FourTuple, float]] = []
+
+    def add(self, timestamp: float, four_tuple: FourTuple):
+        self.packets += 1
+        self.last_seen = timestamp
+        if four_tuple != self.four_tuple:
+            self.changes.append((timestamp, self.four_tuple, four_tuple, timestamp - self.tuple_last_seen))
+            self.four_tuple = four_tuple
+        self.tuple_last_seen = timestamp
+
+
+class CaptureStats:
+    """Counters for one analyzer run"""
+
+    def __init__(self):
+        self.frames = 0
+        self.udp_packets = 0
+        self.quic_packets = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+
+    @property
+    def packets_per_second(self) -> float:
+        return self.frames / self.elapsed if self.elapsed else 0.0
+
+
+def _collect(buf, traces: Dict[bytes, ConnectionTrace], stats: CaptureStats, cid_length: int, port: Optional[int]):
+    # Kept separate from analyze() so every memoryview slice of the mmap is
+    # released when this frame returns and the mmap can be closed.
+    for timestamp, linktype, frame in iter_capture(buf):
+        stats.frames += 1
+        parsed = parse_udp(frame, linktype)
+        if parsed is None:
+            continue
+        four_tuple, payload = parsed
+        stats.udp_packets += 1
+        if port is not None and four_tuple[1] != port and four_tuple[3] != port:
+            continue
+        dcid = parse_quic_dcid(payload, cid_length)
+        if not dcid:
+            continue  # zero-length CIDs cannot be attributed to a connection
+        stats.quic_packets += 1
+
+        trace = traces.get(dcid)
+        if trace is None:
+            trace = traces[dcid] = ConnectionTrace(dcid, timestamp, four_tuple)
+        trace.add(timestamp, four_tuple)
+
+
+def analyze(
+    path: str,
+    cid_length: int = DEFAULT_CID_LENGTH,
+    port: Optional[int] = None,
+) -> Tuple[Dict[bytes, ConnectionTrace], CaptureStats]:
+    """Stream a capture and group QUIC packets by Destination Connection ID"""
+    traces: Dict[bytes, ConnectionTrace] = {}
+    stats = CaptureStats()
+    start = time.perf_counter()
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            buf.madvise(mmap.MADV_SEQUENTIAL)
+        stats.bytes = len(buf)
+        _collect(buf, traces, stats, cid_length, port)
+
+    stats.elapsed = time.perf_counter() - start
+    return traces, stats
+
+
+def print_report(traces: Dict[bytes, ConnectionTrace], stats: CaptureStats, show_all: bool = False):
+    """Print every 4-tuple change per connection plus parse throughput"""
+    migrated = [t for t in traces.values() if t.changes]
+
+    print("\n" + "=" * 70)
+    print("🔍 QUIC MIGRATION ANALYSIS")
+    print("=" * 70 + "\n")
+
+    for trace in sorted(traces.values() if show_all else migrated, key=lambda t: t.first_seen):
+        duration = trace.last_seen - trace.first_seen
+        print(
+            f"📌 DCID {trace.dcid.hex()} | {trace.packets} packets | "
+            f"{duration:.3f}s | {len(trace.changes)} migration(s)"
+        )
+        for timestamp, old, new, gap in trace.changes:
+            print(f"   +{timestamp - trace.first_seen:9.3f}s  {format_tuple(old)}")
+            print(f"   {'':11} → {format_tuple(new)}  (gap {gap * 1000:.1f} ms)")
+        print()
+
+    print("=" * 70)
+    print(f"Frames parsed:      {stats.frames}")
+    print(f"UDP packets:        {stats.udp_packets}")
+    print(f"QUIC packets:       {stats.quic_packets}")
+    print(f"Connection IDs:     {len(traces)}")
+    print(f"Migrated CIDs:      {len(migrated)}")
+    print(f"Migrations:         {sum(len(t.changes) for t in migrated)}")
+    print(
+        f"Parse throughput:   {stats.packets_per_second:,.0f} packets/sec "
+        f"({stats.bytes / stats.elapsed / 1e6 if stats.elapsed else 0:,.1f} MB/s, {stats.elapsed:.2f}s)"
+    )
+    print("=" * 70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruct QUIC migrations from a pcap/pcapng capture")
+    parser.add_argument("capture", help="pcap or pcapng file (e.g. from tcpdump -w)")
+    parser.add_argument("--cid-length", type=int, default=DEFAULT_CID_LENGTH,
+                        help="short-header DCID length in bytes (default: %(default)s, aioquic's default)")
+    parser.add_argument("--port", type=int, help="only consider UDP packets to/from this port")
+    parser.add_argument("--all", action="store_true", help="also list connections that never migrated")
+    args = parser.parse_args()
+
+    try:
+        traces, stats = analyze(args.capture, cid_length=args.cid_length, port=args.port)
+    except (OSError, ValueError) as e:
+        print(f"❌ {args.capture}: {e}")
+        sys.exit(1)
+
+    print_report(traces, stats, show_all=args.all)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Server Profiling Hooks
+Where does the server's time go?
+
+- EventTimings keeps a latency histogram per category: aioquic's datagram
+  processing (split into handshake packets, which includes TLS, and
+  established packets), transmit() (file and body pumps, packet building
+  and encryption), our quic_event_received handler per event type, and
+  log record formatting and output.
+- LoopLagMonitor measures how late the event loop wakes a sleeping task,
+  which is how long any callback kept it busy.
+- ProfileCapture runs cProfile, or a sampling profiler that records
+  collapsed stacks for flame graphs, for a fixed time and writes the
+  result to a file. It is started by SIGUSR1 or a PROFILE request.
+- memory_snapshot() reports tracemalloc's traced bytes and the largest
+  allocation sites, when the server runs with --tracemalloc.
+
+Everything is off unless enabled on the command line. When event timing is
+off the server uses QuicServerProtocol unchanged; instrument_protocol()
+returns a timed subclass only when it is on.
+"""
+
+import asyncio
+import cProfile
+import io
+import logging
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets are powers of two in microseconds: bucket i holds
+# durations below 2**i us, the last one everything from ~34s up
+BUCKETS = 26
+
+PROFILERS = ["cprofile", "sample"]
+DEFAULT_SAMPLE_INTERVAL = 0.001
+MAX_CAPTURE_SECONDS = 3600
+MAX_STACK_DEPTH = 64
+
+
+class EventTimings:
+    """Per-category latency histograms with power-of-two microsecond buckets"""
+
+    def __init__(self):
+        self._stats: Dict[str, list] = {}  # name -> [count, total seconds, max seconds, buckets]
+
+    def record(self, name: str, seconds: float):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = [0, 0.0, 0.0, [0] * BUCKETS]
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]:
+            stats[2] = seconds
+        stats[3][min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+    @staticmethod
+    def _percentile(buckets, count: int, q: float) -> float:
+        """Upper bound (seconds) of the bucket holding the q-th quantile"""
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(buckets):
+            seen += n
+            if seen >= rank:
+                return (1 << i) / 1e6
+        return (1 << (BUCKETS - 1)) / 1e6
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {
+                "count": count,
+                "total_ms": 1000 * total,
+                "mean_us": 1e6 * total / count,
+                "p50_us": 1e6 * min(self._percentile(buckets, count, 0.5), longest),
+                "p99_us": 1e6 * min(self._percentile(buckets, count, 0.99), longest),
+                "max_us": 1e6 * longest,
+            }
+            for name, (count, total, longest, buckets) in self._stats.items()
+        }
+
+    def report(self) -> str:
+        """Table of categories, most total time first"""
+        rows = sorted(self.snapshot().items(), key=lambda item: -item[1]["total_ms"])
+        lines = [f"{'category':<32} {'count':>9} {'total ms':>10} {'mean us':>9} {'p50 us':>8} {'p99 us':>8} {'max us':>9}"]
+        for name, s in rows:
+            lines.append(f"{name:<32} {s['count']:>9} {s['total_ms']:>10.1f} {s['mean_us']:>9.1f} "
+                         f"{s['p50_us']:>8.0f} {s['p99_us']:>8.0f} {s['max_us']:>9.0f}")
+        return "\n".join(lines)
+
+
+def instrument_protocol(protocol_class, timings: EventTimings):
+    """Subclass of `protocol_class` that records where each datagram's time goes"""
+
+    class TimedProtocol(protocol_class):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            receive_datagram = self._quic.receive_datagram
+            quic = self._quic
+
+            def timed_receive(data, addr, now):
+                started = time.perf_counter()
+                receive_datagram(data, addr, now)
+                timings.record("aioquic: receive" if quic._handshake_complete else "aioquic: receive (handshake)",
+                               time.perf_counter() - started)
+
+            quic.receive_datagram = timed_receive
+
+        def quic_event_received(self, event):
+            started = time.perf_counter()
+            super().quic_event_received(event)
+            timings.record(f"handler: {type(event).__name__}", time.perf_counter() - started)
+
+        def transmit(self):
+            started = time.perf_counter()
+            super().transmit()
+            timings.record("transmit", time.perf_counter() - started)
+
+    TimedProtocol.__name__ = TimedProtocol.__qualname__ = f"Timed{protocol_class.__name__}"
+    return TimedProtocol
+
+
+def instrument_logging(timings: EventTimings, log: Optional[logging.Logger] = None):
+    """Time every record emitted by the handlers of `log` (default: root)"""
+    for log_handler in (log or logging.getLogger()).handlers:
+        emit = log_handler.emit
+
+        def timed_emit(record, emit=emit):
+            started = time.perf_counter()
+            emit(record)
+            timings.record("logging", time.perf_counter() - started)
+
+        log_handler.emit = timed_emit
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a task that sleeps `interval`"""
+
+    def __init__(self, interval: float = 0.1, warn_threshold: float = 0.1):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.timings = EventTimings()
+        self.warnings = 0
+        self._last_warning = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self.timings.record("loop lag", lag)
+            if lag >= self.warn_threshold:
+                self.warnings += 1
+                if expected - self._last_warning >= 1.0:
+                    self._last_warning = expected
+                    logger.warning(f"🐢 Event loop lagged {lag * 1000:.0f}ms")
+
+    def snapshot(self) -> Dict[str, float]:
+        lag = self.timings.snapshot().get("loop lag", {})
+        return {
+            "loop_lag_p50_ms": lag.get("p50_us", 0.0) / 1000,
+            "loop_lag_p99_ms": lag.get("p99_us", 0.0) / 1000,
+            "loop_lag_max_ms": lag.get("max_us", 0.0) / 1000,
+            "loop_lag_warnings": self.warnings,
+        }
+
+
+class StackSampler:
+    """Samples one thread's stack from a background thread (collapsed-stack output)"""
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def enable(self):
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfileCapture:
+    """One profiler capture at a time, written to `directory`
+
+    "cprofile" writes a pstats file (`.prof`) plus a text summary of the top
+    functions by cumulative time. "sample" writes collapsed stacks
+    (`.folded`), the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, directory: str, profiler: str = "cprofile",
+                 sample_interval: float = DEFAULT_SAMPLE_INTERVAL):
+        if profiler not in PROFILERS:
+            raise ValueError(f"unknown profiler '{profiler}' (choose from: {', '.join(PROFILERS)})")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.profiler = profiler
+        self.sample_interval = sample_interval
+        self.captures = 0
+        self.started = 0  # numbers the files, so captures in the same second don't collide
+        self._active = None
+        self._path: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._active is not None
+
+    def start(self, seconds: float) -> Optional[str]:
+        """Capture for `seconds`; returns the output path, or None if a capture is running"""
+        if self._active is not None:
+            return None
+        self.started += 1
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.started}"
+        if self.profiler == "cprofile":
+            self._active = cProfile.Profile()
+            self._path = os.path.join(self.directory, f"cprofile-{stamp}.prof")
+        else:
+            self._active = StackSampler(threading.get_ident(), self.sample_interval)
+            self._path = os.path.join(self.directory, f"samples-{stamp}.folded")
+        self._active.enable()
+        asyncio.get_running_loop().call_later(seconds, self.stop)
+        logger.warning(f"🔬 Profiling ({self.profiler}) for {seconds:g}s -> {self._path}")
+        return self._path
+
+    def stop(self):
+        profiler, path = self._active, self._path
+        if profiler is None:
+            return
+        profiler.disable()
+        self._active = None
+        if isinstance(profiler, cProfile.Profile):
+            profiler.dump_stats(path)
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(30)
+            with open(path[:-len(".prof")] + ".txt", "w") as f:
+                f.write(summary.getvalue())
+        else:
+            profiler.dump(path)
+        self.captures += 1
+        logger.warning(f"🔬 Profile written to {path}")
+
+
+def memory_snapshot(limit: int = 20) -> Dict:
+    """Traced Python memory and its largest allocation sites (file:line, bytes, blocks)"""
+    current, peak = tracemalloc.get_traced_memory()
+    top = tracemalloc.take_snapshot().statistics("lineno")[:limit]
+    return {
+        "tracemalloc_bytes": current,
+        "tracemalloc_peak_bytes": peak,
+        "tracemalloc_top": [[f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                             stat.size, stat.count] for stat in top],
+    }
+
+
+class Profiling:
+    """The profiling hooks a server was started with (any of them may be None)"""
+
+    def __init__(
+        self,
+        timings: Optional[EventTimings] = None,
+        lag_monitor: Optional[LoopLagMonitor] = None,
+        capture: Optional[ProfileCapture] = None,
+        capture_seconds: float = 10.0,
+    ):
+        self.timings = timings
+        self.lag_monitor = lag_monitor
+        self.capture = capture
+        self.capture_seconds = capture_seconds
+
+    def start_capture(self, seconds: Optional[float] = None) -> Dict:
+        """Start a capture and describe it (for the PROFILE request and SIGUSR1)
+
+        Clients choose `seconds`, so it must be positive and is capped at
+        MAX_CAPTURE_SECONDS.
+        """
+        if self.capture is None:
+            return {"error": "profiling captures are disabled (start the server with --capture-dir)"}
+        if seconds is not None and not (math.isfinite(seconds) and seconds > 0):
+            return {"error": "seconds must be a positive number"}
+        seconds = min(seconds or self.capture_seconds, MAX_CAPTURE_SECONDS)
+        path = self.capture.start(seconds)
+        if path is None:
+            return {"error": "a capture is already running"}
+        return {"capture": path, "seconds": seconds}
+
+    def snapshot(self) -> Dict:
+        stats = {}
+        if self.timings is not None:
+            stats["event_timings"] = self.timings.snapshot()
+        if self.lag_monitor is not None:
+            stats.update(self.lag_monitor.snapshot())
+        if self.capture is not None:
+            stats["profile_captures"] = self.capture.captures
+            stats["profile_running"] = self.capture.running
+        if tracemalloc.is_tracing():
+            stats.update(memory_snapshot())
+        return stats
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Profiling Overhead Benchmark
+What the profiling hooks cost the server
+
+Runs the same echo load against quic_server.py with the hooks off, with
+event timing, with event timing plus loop-lag monitoring, and while a
+cProfile or sampling capture is running. Each configuration is run
+`--repeat` times and the median is reported, since a single run on a
+shared machine is noisy.
+"""
+
+import argparse
+import asyncio
+import logging
+import shutil
+import signal
+import statistics
+import tempfile
+from typing import Dict, List
+
+from load_test import ServerProcess, run_load_test
+from tuning_profiles import DEFAULT_PROFILE, PROFILES
+
+# label -> (server arguments, start a capture with SIGUSR1)
+CONFIGURATIONS = {
+    "hooks off": ([], False),
+    "event timing": (["--event-timing"], False),
+    "event timing + loop lag": (["--event-timing", "--loop-lag-interval", "0.05"], False),
+    "cProfile capture": (["--profiler", "cprofile"], True),
+    "sampling capture": (["--profiler", "sample"], True),
+}
+
+
+async def run_configuration(
+    server_args: List[str],
+    capture: bool,
+    connections: int,
+    messages: int,
+    port: int,
+    profile: str,
+) -> Dict:
+    capture_dir = tempfile.mkdtemp(prefix="quic-profile-")
+    args = [*server_args, "--capture-dir", capture_dir, "--capture-seconds", "3600"] if capture else server_args
+    try:
+        async with ServerProcess(port=port, profile=profile, extra_args=args) as server:
+            if capture:
+                server.process.send_signal(signal.SIGUSR1)
+            cpu_before = server.cpu_seconds() or 0.0
+            result = await run_load_test(port=port, connections=connections, messages=messages,
+                                         concurrency=connections, profile=profile)
+            cpu = (server.cpu_seconds() or 0.0) - cpu_before
+    finally:
+        shutil.rmtree(capture_dir, ignore_errors=True)
+    summary = result.summary()
+    return {
+        "requests_per_second": summary["requests_per_second"],
+        "latency_p99": summary.get("latency_p99", float("nan")),
+        "cpu_per_request_us": 1e6 * cpu / result.requests if result.requests else float("nan"),
+        "errors": result.errors,
+    }
+
+
+def print_report(results: Dict[str, Dict]):
+    baseline = results.get("hooks off", {}).get("cpu_per_request_us")
+    print("\n" + "=" * 70)
+    print("⏱️  PROFILING HOOK OVERHEAD")
+    print("=" * 70)
+    print(f"{'configuration':<26} {'req/s':>8} {'p99 ms':>8} {'server CPU/req':>15} {'overhead':>9}")
+    for label, r in results.items():
+        overhead = f"{100 * (r['cpu_per_request_us'] / baseline - 1):+.0f}%" if baseline else "-"
+        print(f"{label:<26} {r['requests_per_second']:>8,.0f} {r['latency_p99'] * 1000:>8.1f} "
+              f"{r['cpu_per_request_us']:>13.0f}us {overhead:>9}")
+    print("=" * 70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the server cost of the profiling hooks")
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=40, help="echo requests per connection")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per configuration (median reported)")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=list(PROFILES))
+    parser.add_argument("--port", type=int, default=15233)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    results = {}
+    for label, (server_args, capture) in CONFIGURATIONS.items():
+        print(f"   running: {label} ...")
+        runs = [asyncio.run(run_configuration(server_args, capture, args.connections, args.messages,
+                                              args.port, args.profile)) for _ in range(args.repeat)]
+        results[label] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,21 @@ QUIC Client with Connection Migration Support
 Demonstrates client-initiated connection migration
 """
 
+import argparse
 import asyncio
 import logging
-from typing import Optional
+import os
+import socket
+from typing import Dict, Optional
 from aioquic.asyncio import connect
 from aioquic.quic.configuration import QuicConfiguration
 from aioquic.quic.events import QuicEvent, StreamDataReceived, HandshakeCompleted
 from aioquic.asyncio.protocol import QuicConnectionProtocol
 import colorlog
 import time
+from functools import partial
+
+from tuning_profiles import DEFAULT_PROFILE, PROFILES, TuningProfile, get_profile
 
 # Setup colored logging
 handler = colorlog.StreamHandler()
@@ -27,17 +33,23 @@ handler.setFormatter(colorlog.ColoredFormatter(
     }
 ))
 logger = colorlog.getLogger()
-logger.addHandler(handler)
+if not logger.handlers:  # another demo module may already have configured logging
+    logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
 
 class QuicClientProtocol(QuicConnectionProtocol):
     """QUIC client protocol"""
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, profile: Optional[TuningProfile] = None, **kwargs):
         super().__init__(*args, **kwargs)
+        if profile is not None:
+            profile.apply_stream_limits(self._quic)
         self.response_received = asyncio.Event()
         self.response_data = None
+        self._partial: Dict[int, bytes] = {}  # responses split over several packets
+        self.goaway_received = asyncio.Event()
+        self.goaway_target = None  # (host, port) the server asked us to move to
 
     def quic_event_received(self, event: QuicEvent):
         """Handle QUIC events"""
@@ -45,8 +57,21 @@ class QuicClientProtocol(QuicConnectionProtocol):
         if isinstance(event, HandshakeCompleted):
             logger.info("✅ Handshake completed with server")
 
+        elif isinstance(event, StreamDataReceived) and event.stream_id % 4 == 3:
+            # server-initiated unidirectional stream: GOAWAY from a draining server
+            fields = event.data.decode('utf-8').split()
+            if fields and fields[0] == "GOAWAY":
+                if len(fields) == 3:
+                    self.goaway_target = (fields[1], int(fields[2]))
+                logger.warning(f"🚰 Server is draining, reconnect to {self.goaway_target or 'the same address'}")
+                self.goaway_received.set()
+
         elif isinstance(event, StreamDataReceived):
-            self.response_data = event.data.decode('utf-8')
+            if not event.end_stream:
+                self._partial[event.stream_id] = self._partial.get(event.stream_id, b"") + event.data
+                return
+            data = self._partial.pop(event.stream_id, b"") + event.data
+            self.response_data = data.decode('utf-8')
             logger.info(f"📨 Received response: {self.response_data}")
             self.response_received.set()
 
@@ -69,6 +94,265 @@ async def send_message(protocol: QuicClientProtocol, message: str) -> str:
     return protocol.response_data
 
 
+class FileDownload:
+    """Writes a (possibly resumed) file download into a preallocated file
+
+    Progress is checkpointed to `<output>.progress` after the data is
+    flushed, so a reconnect or a restarted client resumes from the last
+    offset known to be on disk.
+    """
+
+    CHECKPOINT_BYTES = 8 * 1024 * 1024
+
+    def __init__(self, output: str, offset: int, stream_id: int):
+        self.output = output
+        self.progress_path = output + ".progress"
+        self.offset = offset
+        self.stream_id = stream_id
+        self.size: Optional[int] = None
+        self.error: Optional[str] = None
+        self.finished = asyncio.Event()
+        self._header = b""
+        self._fd: Optional[int] = None
+        self._checkpointed = offset
+
+    def feed(self, data: bytes, end_stream: bool):
+        """Handle stream data: response header first, then file bytes"""
+        if self.size is None:
+            self._header += data
+            if b"\n" not in self._header:
+                return
+            line, data = self._header.split(b"\n", 1)
+            status, _, value = line.decode('utf-8').partition(" ")
+            if status != "OK":
+                self.error = value or status
+                self.finished.set()
+                return
+            self.size = int(value)
+            self._open()
+
+        if data:
+            os.pwrite(self._fd, data, self.offset)
+            self.offset += len(data)
+            if self.offset - self._checkpointed >= self.CHECKPOINT_BYTES:
+                self.checkpoint()
+
+        if end_stream:
+            self.checkpoint()
+            self.finished.set()
+
+    def _open(self):
+        self._fd = os.open(self.output, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size != self.size:
+            os.ftruncate(self._fd, self.size)
+            if hasattr(os, "posix_fallocate") and self.size:
+                try:
+                    os.posix_fallocate(self._fd, 0, self.size)
+                except OSError:
+                    pass  # not supported by this filesystem; the sparse file still works
+
+    def checkpoint(self):
+        """Flush written data and record the resume offset"""
+        if self._fd is None:
+            return
+        os.fdatasync(self._fd) if hasattr(os, "fdatasync") else os.fsync(self._fd)
+        with open(self.progress_path, "w") as f:
+            f.write(f"{self.offset} {self.size}\n")
+        self._checkpointed = self.offset
+
+    def close(self):
+        if self._fd is not None:
+            self.checkpoint()
+            os.close(self._fd)
+            self._fd = None
+        if self.size is not None and self.offset >= self.size and os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+
+    @staticmethod
+    def resume_offset(output: str) -> int:
+        """Offset recorded by an earlier, interrupted download (0 if none)"""
+        try:
+            with open(output + ".progress") as f:
+                return int(f.read().split()[0])
+        except (OSError, ValueError, IndexError):
+            return 0
+
+
+class FileDownloadProtocol(QuicClientProtocol):
+    """Client protocol that streams a download straight to disk"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.download: Optional[FileDownload] = None
+
+    def start_download(self, name: str, output: str, offset: int) -> FileDownload:
+        stream_id = self._quic.get_next_available_stream_id()
+        self.download = FileDownload(output, offset, stream_id)
+        self._quic.send_stream_data(stream_id, f"GET {name} {offset}\n".encode('utf-8'), end_stream=True)
+        self.transmit()
+        return self.download
+
+    def quic_event_received(self, event: QuicEvent):
+        if (
+            self.download is not None
+            and isinstance(event, StreamDataReceived)
+            and event.stream_id == self.download.stream_id
+        ):
+            self.download.feed(event.data, event.end_stream)
+        else:
+            super().quic_event_received(event)
+
+
+async def _wait_for_download(download: FileDownload, stall_timeout: float):
+    """Wait for completion, failing only if no bytes arrive for `stall_timeout`"""
+    last_offset = -1
+    while not download.finished.is_set():
+        if download.offset == last_offset:
+            raise asyncio.TimeoutError(f"download stalled at offset {download.offset}")
+        last_offset = download.offset
+        try:
+            await asyncio.wait_for(download.finished.wait(), stall_timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _migrate_periodically(protocol: QuicConnectionProtocol, interval: float, transports: list):
+    while True:
+        await asyncio.sleep(interval)
+        transports.append(await rebind(protocol))
+
+
+async def download_file(
+    name: str,
+    output: str,
+    host: str = "127.0.0.1",
+    port: int = 4433,
+    profile: str = "bulk-throughput",
+    migrate_every: Optional[float] = None,
+    stall_timeout: float = 5.0,
+    max_reconnects: int = 10,
+) -> dict:
+    """Download `name` from a server started with --serve-dir
+
+    Resumes from `<output>.progress` if present, and reconnects from the
+    last written offset when the connection stalls or drops.
+    """
+    tuning = get_profile(profile)
+    offset = FileDownload.resume_offset(output)
+    start_offset = offset
+    reconnects = 0
+    migrations = 0
+    start = time.perf_counter()
+
+    if offset:
+        logger.info(f"⏩ Resuming {name} from offset {offset}")
+
+    while True:
+        configuration = tuning.configuration(is_client=True, verify_mode=False)
+        download = None
+        transports = []
+        try:
+            async with connect(
+                host,
+                port,
+                configuration=configuration,
+                create_protocol=partial(FileDownloadProtocol, profile=tuning),
+            ) as protocol:
+                download = protocol.start_download(name, output, offset)
+                migrator = None
+                if migrate_every:
+                    migrator = asyncio.create_task(_migrate_periodically(protocol, migrate_every, transports))
+                try:
+                    await _wait_for_download(download, stall_timeout)
+                finally:
+                    if migrator:
+                        migrator.cancel()
+                    migrations += len(transports)
+            if download.error:
+                raise FileNotFoundError(f"server refused {name}: {download.error}")
+            break
+        except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+            if isinstance(e, FileNotFoundError) or reconnects >= max_reconnects:
+                raise
+            reconnects += 1
+            if download is not None:
+                offset = download.offset
+            logger.warning(f"🔁 Reconnecting ({reconnects}/{max_reconnects}) from offset {offset}: {e}")
+        finally:
+            if download is not None:
+                download.close()
+            for transport in transports:
+                transport.close()
+
+    elapsed = time.perf_counter() - start
+    transferred = download.offset - start_offset
+    stats = {
+        "size": download.size,
+        "transferred": transferred,
+        "elapsed": elapsed,
+        "throughput_mbps": transferred * 8 / elapsed / 1e6 if elapsed else 0.0,
+        "migrations": migrations,
+        "reconnects": reconnects,
+    }
+    logger.info(
+        f"✅ Downloaded {name} -> {output}: {transferred} bytes in {elapsed:.2f}s "
+        f"({stats['throughput_mbps']:.1f} Mbit/s, {migrations} migrations, {reconnects} reconnects)"
+    )
+    return stats
+
+
+async def open_path(
+    protocol: QuicConnectionProtocol,
+    local_host: str = "::",
+    local_port: int = 0,
+) -> asyncio.DatagramTransport:
+    """Bind a new UDP socket that feeds the same QUIC connection
+
+    The new transport becomes the protocol's active transport, so the next
+    packets leave from the new local address. Keep the old transport open
+    to probe or fail back to it, or close it to complete the migration.
+    """
+    loop = asyncio.get_running_loop()
+
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+        if ":" not in local_host:
+            local_host = "::ffff:" + local_host
+        sock.bind((local_host, local_port, 0, 0))
+    except OSError:
+        sock.close()
+        raise
+
+    transport, _ = await loop.create_datagram_endpoint(lambda: protocol, sock=sock)
+    return transport
+
+
+def use_path(protocol: QuicConnectionProtocol, transport: asyncio.DatagramTransport):
+    """Send subsequent packets through an already open transport"""
+    protocol._transport = transport
+
+
+async def rebind(
+    protocol: QuicConnectionProtocol,
+    local_host: str = "::",
+    local_port: int = 0,
+) -> asyncio.DatagramTransport:
+    """Migrate to a new local address/port and close the old socket
+
+    A PING goes out from the new address right away. A client that is only
+    receiving would otherwise stay silent, while the server keeps sending
+    to the closed socket until its loss timers give up.
+    """
+    old_transport = protocol._transport
+    transport = await open_path(protocol, local_host, local_port)
+    old_transport.close()
+    protocol._quic.send_ping(0)
+    protocol.transmit()
+    logger.info(f"📍 Rebound to {transport.get_extra_info('sockname')[:2]}")
+    return transport
+
+
 async def simulate_migration(protocol: QuicClientProtocol, migration_type: str):
     """Simulate connection migration"""
 
@@ -97,14 +381,15 @@ async def simulate_migration(protocol: QuicClientProtocol, migration_type: str):
 async def run_client(
     host: str = "127.0.0.1",
     port: int = 4433,
-    simulate_migrations: bool = True
+    simulate_migrations: bool = True,
+    profile: str = DEFAULT_PROFILE,
 ):
     """Run the QUIC client"""
 
     # Configure QUIC
-    configuration = QuicConfiguration(
+    tuning = get_profile(profile)
+    configuration = tuning.configuration(
         is_client=True,
-        alpn_protocols=["quic-migration-demo"],
         verify_mode=False,  # Skip cert verification for self-signed cert
     )
 
@@ -114,7 +399,7 @@ async def run_client(
         host,
         port,
         configuration=configuration,
-        create_protocol=QuicClientProtocol,
+        create_protocol=partial(QuicClientProtocol, profile=tuning),
     ) as client:
         protocol = client
 
@@ -149,8 +434,34 @@ async def run_client(
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="QUIC client with connection migration simulation")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4433)
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=list(PROFILES),
+                        help="QUIC tuning profile (default: %(default)s)")
+    parser.add_argument("--no-migrations", action="store_true", help="skip the simulated migrations")
+    parser.add_argument("--download", metavar="NAME", help="download a file from a server run with --serve-dir")
+    parser.add_argument("--output", help="where to write the download (default: NAME in the current directory)")
+    parser.add_argument("--migrate-every", type=float, help="rebind to a new source port every N seconds while downloading")
+    args = parser.parse_args()
+
     try:
-        asyncio.run(run_client(simulate_migrations=True))
+        if args.download:
+            asyncio.run(download_file(
+                args.download,
+                args.output or os.path.basename(args.download),
+                host=args.host,
+                port=args.port,
+                profile=args.profile,
+                migrate_every=args.migrate_every,
+            ))
+        else:
+            asyncio.run(run_client(
+                host=args.host,
+                port=args.port,
+                simulate_migrations=not args.no_migrations,
+                profile=args.profile,
+            ))
     except KeyboardInterrupt:
         logger.info("🛑 Client stopped by user")
     except Exception as e:
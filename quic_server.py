@@ -4,21 +4,66 @@ QUIC Server with Connection Migration Support
 Demonstrates server-side handling of client migration events
 """
 
+import argparse
 import asyncio
+import json
 import logging
-from typing import Dict, Optional
-from aioquic.asyncio import QuicConnectionProtocol, serve
-from aioquic.quic.configuration import QuicConfiguration
-from aioquic.quic.connection import QuicConnection
+import mmap
+import os
+import signal
+import statistics
+import tracemalloc
+from functools import partial
+from typing import Dict, Optional, Tuple
+from aioquic import tls
+from aioquic.asyncio import QuicConnectionProtocol
+from aioquic.asyncio.server import QuicServer
+from aioquic.buffer import Buffer
+from aioquic.quic.configuration import SMALLEST_MAX_DATAGRAM_SIZE, QuicConfiguration
+from aioquic.quic.connection import TRANSPORT_CLOSE_FRAME_CAPACITY, QuicConnection
+from aioquic.quic.crypto import CryptoPair
+from aioquic.quic.packet import (
+    QuicErrorCode,
+    QuicFrameType,
+    QuicPacketType,
+    encode_quic_retry,
+    pull_quic_header,
+)
+from aioquic.quic.packet_builder import QuicPacketBuilder
 from aioquic.quic.events import (
     QuicEvent,
     StreamDataReceived,
     ConnectionTerminated,
     HandshakeCompleted,
+    ProtocolNegotiated,
+    StreamReset,
 )
 import colorlog
 import time
 
+from address_validation import RETRY_MODES, AddressValidation, MigrationRateLimiter
+from flow_control import (
+    DEFAULT_CONNECTION_LIMIT,
+    DEFAULT_STREAM_LIMIT,
+    DEFAULT_UNSENT_LIMIT,
+    BufferMetrics,
+    StreamWriter,
+)
+from http3 import H3_ALPN, H3Endpoints, H3Metrics
+from migration_detector import MigrationAnomalyDetector
+from migration_log import MigrationEventLog
+from profiling import (
+    PROFILERS,
+    EventTimings,
+    LoopLagMonitor,
+    ProfileCapture,
+    Profiling,
+    instrument_logging,
+    instrument_protocol,
+)
+from session_state import ServerState, TicketStore
+from tuning_profiles import DEFAULT_PROFILE, PROFILES, TuningProfile, get_profile
+
 # Setup colored logging
 handler = colorlog.StreamHandler()
 handler.setFormatter(colorlog.ColoredFormatter(
@@ -32,20 +77,92 @@ handler.setFormatter(colorlog.ColoredFormatter(
     }
 ))
 logger = colorlog.getLogger()
-logger.addHandler(handler)
+if not logger.handlers:  # another demo module may already have configured logging
+    logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+# Streams starting with this prefix are bulk uploads: the server discards the
+# payload and only reports the byte count (used by cc_harness.py)
+SINK_PREFIX = b"SINK\n"
+
+# File download requests: "GET <name> <offset>\n". The response starts with
+# "OK <size>\n" (or "ERR <reason>\n") followed by the file from <offset>.
+# Only as much of the file as the stream writer has room for is queued; the
+# rest stays in the page cache until ACKs open the window again.
+GET_PREFIX = b"GET "
+
+# "STATS" returns the server-wide send-buffer occupancy as JSON
+STATS_REQUEST = b"STATS"
+
+# "PROFILE [seconds]" starts a profiler capture on a server run with
+# --capture-dir and returns the file it will be written to, as JSON
+PROFILE_REQUEST = b"PROFILE"
+
+# Sent on a server-initiated unidirectional stream when the server drains:
+# "GOAWAY [<host> <port>]\n". The client finishes its in-flight requests and
+# reconnects, to <host> <port> if given.
+GOAWAY_PREFIX = b"GOAWAY"
+
+# Connections that stay idle this long after GOAWAY are closed by the server
+DRAIN_IDLE_GRACE = 1.0
+
+# Appended to connection IDs, which are otherwise object ids that the next run
+# reuses; tracker, event-log and ticket sessions from different runs stay apart
+RUN_ID = os.urandom(4).hex()
+
+# Below this much anti-amplification budget not even an ACK fits (RFC 9000 section 8.1)
+AMPLIFICATION_FACTOR = 3
+MIN_ACK_BUDGET = 64
+
+
+class FileTransfer:
+    """A file being streamed from an mmap in window-sized chunks"""
+
+    def __init__(self, path: str, offset: int):
+        self.file = open(path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.offset = min(offset, self.size)
+        self.mmap = None
+        self.view = memoryview(b"")
+        if self.size:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mmap)
+
+    @property
+    def done(self) -> bool:
+        return self.offset >= self.size
+
+    def next_chunk(self, limit: int) -> memoryview:
+        """Return up to `limit` bytes from the current offset, without copying"""
+        end = min(self.offset + limit, self.size)
+        chunk = self.view[self.offset:end]
+        self.offset = end
+        return chunk
+
+    def close(self):
+        self.view.release()
+        if self.mmap is not None:
+            self.mmap.close()
+        self.file.close()
+
 
 class MigrationTracker:
     """Tracks connection migration events"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        event_log: Optional[MigrationEventLog] = None,
+        detector: Optional[MigrationAnomalyDetector] = None,
+    ):
         self.migrations: Dict[str, list] = {}
+        self.saved: Dict[str, list] = {}  # history of sessions from before a restart
+        self.event_log = event_log
+        self.detector = detector
 
     def record_migration(self, conn_id: str, old_addr, new_addr):
         """Record a migration event"""
         if conn_id not in self.migrations:
-            self.migrations[conn_id] = []
+            self.migrations[conn_id] = self.saved.pop(conn_id, [])
 
         migration_event = {
             'timestamp': time.time(),
@@ -55,33 +172,152 @@ class MigrationTracker:
         }
         self.migrations[conn_id].append(migration_event)
 
+        if self.event_log is not None:
+            self.event_log.append(
+                conn_id, old_addr, new_addr,
+                migration_event['migration_number'],
+                timestamp=migration_event['timestamp'],
+            )
+
         logger.warning(
             f"🔄 MIGRATION #{migration_event['migration_number']} detected for {conn_id[:8]}... "
             f"| {old_addr} -> {new_addr}"
         )
 
+        if self.detector is not None:
+            for flag in self.detector.observe(conn_id, old_addr, new_addr, migration_event['timestamp']):
+                logger.error(
+                    f"🚨 Anomalous migration pattern on {conn_id[:8]}... ({'+'.join(flag['reasons'])}) "
+                    f"| {flag['rate']:.1f} migrations/s | ~{flag['addresses']:.0f} addresses "
+                    f"| {flag['migrations']} migrations"
+                )
+
     def get_migration_count(self, conn_id: str) -> int:
         """Get total migrations for a connection"""
-        return len(self.migrations.get(conn_id, []))
+        return len(self.migrations.get(conn_id) or self.saved.get(conn_id, []))
+
+
+# One shared frozenset per distinct set of epochs (see share_frame_handler_epochs)
+_EPOCH_SETS: Dict[frozenset, frozenset] = {}
+
+
+def release_handshake_state(quic: QuicConnection):
+    """Drop the parts of a server connection that only the handshake uses
+
+    aioquic keeps a 16 KiB output buffer per handshake epoch and the TLS key
+    schedules for the life of the connection. Once the server has completed
+    the handshake (its session ticket is already written) TLS rejects any
+    further CRYPTO data before writing anything, so neither is used again.
+    This relies on aioquic 1.6 internals (see requirements.txt); when they
+    are not there it does nothing.
+    """
+    if isinstance(getattr(quic, "_crypto_buffers", None), dict):
+        quic._crypto_buffers = {}
+    context = getattr(quic, "tls", None)
+    for name in ("key_schedule", "_key_schedule_psk", "_key_schedule_proxy"):
+        if hasattr(context, name):
+            setattr(context, name, None)
+
+
+def share_frame_handler_epochs(quic: QuicConnection):
+    """Make every connection's frame-handler table use the same epoch sets
+
+    aioquic builds a table of ~30 (handler, frozenset of epochs) entries per
+    connection; the frozensets are identical across connections. Does
+    nothing if the table is missing or shaped differently (another aioquic).
+    """
+    handlers = getattr(quic, "_QuicConnection__frame_handlers", None)
+    if not isinstance(handlers, dict):
+        return
+    for frame_type, entry in handlers.items():
+        if isinstance(entry, tuple) and len(entry) == 2 and isinstance(entry[1], frozenset):
+            handlers[frame_type] = (entry[0], _EPOCH_SETS.setdefault(entry[1], entry[1]))
 
 
 class QuicServerProtocol(QuicConnectionProtocol):
     """QUIC server protocol with migration tracking"""
 
-    def __init__(self, *args, **kwargs):
+    # aioquic's base class still has a __dict__; these keep our own
+    # per-connection attributes out of it (see README: Idle Connection Memory)
+    __slots__ = ("migration_tracker", "session_id", "last_client_addr", "uploads", "serve_dir",
+                 "file_transfers", "writer", "draining", "server", "migration_limiter", "limiter_key",
+                 "h3_metrics", "h3", "profiling")
+
+    def __init__(
+        self,
+        *args,
+        migration_tracker: Optional[MigrationTracker] = None,
+        profile: Optional[TuningProfile] = None,
+        serve_dir: Optional[str] = None,
+        buffer_metrics: Optional[BufferMetrics] = None,
+        write_limits: Optional[Dict[str, int]] = None,
+        migration_limiter: Optional[MigrationRateLimiter] = None,
+        h3_metrics: Optional[H3Metrics] = None,
+        profiling: Optional[Profiling] = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
-        self.migration_tracker = kwargs.get('migration_tracker', MigrationTracker())
-        self.connection_id = None
-        self.last_client_addr = None
-        self.stream_data = {}
+        if profile is not None:
+            profile.apply_stream_limits(self._quic)
+        share_frame_handler_epochs(self._quic)
+        self.migration_tracker = migration_tracker or MigrationTracker()
+        self.session_id: Optional[str] = None  # set when resuming an earlier session's ticket
+        self.last_client_addr = None  # the tuple aioquic's current path holds, not a copy
+        self.uploads: Optional[Dict[int, int]] = None  # SINK bytes received per stream, once used
+        self.serve_dir = serve_dir
+        self.file_transfers: Optional[Dict[int, FileTransfer]] = None  # created by the first GET
+        self.writer = StreamWriter(self._quic, self._transmit_soon, metrics=buffer_metrics, **(write_limits or {}))
+        self.draining = False
+        self.server: Optional["MigrationServer"] = None
+        self.migration_limiter = migration_limiter
+        # the server's first connection ID: chosen by us and never reused, unlike id(self)
+        self.limiter_key = self._quic.host_cid
+        self.h3_metrics = h3_metrics  # set when the server offers HTTP/3
+        self.h3: Optional[H3Endpoints] = None
+        self.profiling = profiling
+
+    @property
+    def connection_id(self) -> str:
+        """Migration tracker key: the resumed session's ID, else this connection's"""
+        return self.session_id or f"{id(self._quic):x}-{RUN_ID}"
+
+    def datagram_received(self, data, addr):
+        """Drop new client paths once the migration budget is spent
+
+        Tokens are only taken for a path aioquic has added, which it does after
+        decrypting the packet, so spoofed packets cannot spend a connection's
+        (or a prefix's) budget. An over-budget path is removed again before
+        anything is sent on it.
+        """
+        limiter = self.migration_limiter
+        quic = self._quic
+        if limiter is None or not quic._handshake_complete:
+            super().datagram_received(data, addr)
+            return
+        paths = list(quic._network_paths)
+        quic.receive_datagram(data, addr, now=self._loop.time())
+        if any(path not in paths for path in quic._network_paths) and not limiter.allow(self.limiter_key, addr):
+            quic._network_paths[:] = paths  # as before, including any path the new one evicted
+        self._process_events()
+        self.transmit()
 
     def quic_event_received(self, event: QuicEvent):
         """Handle QUIC events"""
 
-        if isinstance(event, HandshakeCompleted):
-            self.connection_id = str(id(self._quic))
+        if isinstance(event, ProtocolNegotiated):
+            if event.alpn_protocol in H3_ALPN and self.h3_metrics is not None:
+                self.h3 = H3Endpoints(
+                    self._quic, self.writer, self.h3_metrics, self.stats,
+                    lambda: self.migration_tracker.get_migration_count(self.connection_id),
+                    start_profile=self.profiling.start_capture if self.profiling is not None else None,
+                )
+
+        elif isinstance(event, HandshakeCompleted):
+            release_handshake_state(self._quic)
             self.last_client_addr = self._quic._network_paths[0].addr if self._quic._network_paths else None
-            logger.info(f"✅ Handshake completed | Connection ID: {self.connection_id[:8]}... | Client: {self.last_client_addr}")
+            resumed = " | resumed (0-RTT)" if event.early_data_accepted else " | resumed" if event.session_resumed else ""
+            logger.info(f"✅ Handshake completed | Connection ID: {self.connection_id} "
+                        f"| Client: {self.last_client_addr}{resumed}")
 
         elif isinstance(event, StreamDataReceived):
             # Check for migration (address change)
@@ -95,6 +331,27 @@ class QuicServerProtocol(QuicConnectionProtocol):
                 )
                 self.last_client_addr = current_addr
 
+            if self.h3 is not None:
+                self.h3.handle_event(event)
+                return
+
+            if (self.uploads and event.stream_id in self.uploads) or event.data.startswith(SINK_PREFIX):
+                self._handle_sink_data(event)
+                return
+
+            if self.serve_dir and event.data.startswith(GET_PREFIX):
+                self._handle_file_request(event)
+                return
+
+            if event.data == STATS_REQUEST:
+                stats = json.dumps(self.stats())
+                self.writer.send(event.stream_id, stats.encode('utf-8'), end_stream=True)
+                return
+
+            if self.profiling is not None and event.data.split()[:1] == [PROFILE_REQUEST]:
+                self._handle_profile_request(event)
+                return
+
             # Handle received data
             data = event.data.decode('utf-8')
             logger.info(f"📨 Received on stream {event.stream_id}: {data}")
@@ -103,21 +360,427 @@ class QuicServerProtocol(QuicConnectionProtocol):
             migration_count = self.migration_tracker.get_migration_count(self.connection_id)
             response = f"Echo: {data} | Migrations: {migration_count}"
 
-            self._quic.send_stream_data(event.stream_id, response.encode('utf-8'), end_stream=True)
+            self.writer.send(event.stream_id, response.encode('utf-8'), end_stream=True)
             logger.info(f"📤 Sent response: {response}")
 
+        elif isinstance(event, StreamReset):
+            if self.h3 is not None:
+                self.h3.handle_event(event)
+            transfer = self.file_transfers.pop(event.stream_id, None) if self.file_transfers else None
+            if transfer:
+                transfer.close()
+
         elif isinstance(event, ConnectionTerminated):
             logger.info(f"🔌 Connection terminated | Error: {event.error_code} | Reason: {event.reason_phrase}")
+            for transfer in (self.file_transfers or {}).values():
+                transfer.close()
+            self.file_transfers = None
+            self.writer.close()
+            if self.h3 is not None:
+                self.h3.close()
 
+    def stats(self) -> Dict:
+        """Server-wide counters, as returned for STATS"""
+        stats = self.writer.metrics.snapshot()
+        if self.server is not None:
+            stats.update(self.server.stats())
+        if self.migration_limiter is not None:
+            stats.update(self.migration_limiter.snapshot())
+        if self.migration_tracker.detector is not None:
+            stats.update(self.migration_tracker.detector.snapshot())
+        if self.h3_metrics is not None:
+            stats.update(self.h3_metrics.snapshot())
+        if self.profiling is not None:
+            stats.update(self.profiling.snapshot())
+        return stats
 
-async def run_server(host: str = "127.0.0.1", port: int = 4433):
-    """Run the QUIC server"""
+    def _handle_profile_request(self, event: StreamDataReceived):
+        fields = event.data.split()
+        try:
+            seconds = float(fields[1]) if len(fields) > 1 else None
+        except ValueError:
+            self._send_error(event.stream_id, "bad request")
+            return
+        response = json.dumps(self.profiling.start_capture(seconds))
+        self.writer.send(event.stream_id, response.encode('utf-8'), end_stream=True)
 
-    # Configure QUIC with self-signed certificate
-    configuration = QuicConfiguration(
+    def transmit(self) -> None:
+        """Top up file streams and wake waiting writers, so ACKs pull the next window"""
+        if self.file_transfers:
+            self._pump_file_transfers()
+        if self.h3 is not None and self.h3.bodies:
+            self.h3.pump()
+        self.writer.resume()
+        super().transmit()
+        if self._timer_at is not None and self._timer_at <= self._loop.time():
+            self._defer_blocked_ack()
+
+    def _defer_blocked_ack(self):
+        """Stop aioquic's timer from spinning on an ACK it cannot send yet
+
+        aioquic arms its timer for every ACK that is due, but it only writes
+        1-RTT ACKs once the handshake is complete, and nothing at all once the
+        3x anti-amplification budget of an unvalidated address is used up.
+        0-RTT packets that arrive before the client's Finished (or a client
+        that sends 0-RTT data and disappears) leave an ACK due in the past,
+        and the timer fires back to back until the handshake completes or the
+        connection idles out. Sleep until the next real deadline instead; the
+        next packet from the client re-arms the timer anyway.
+
+        This reads aioquic 1.6 internals (see requirements.txt); if they are
+        not there the timer is left alone.
+        """
+        quic = self._quic
+        now = self._loop.time()
+        try:
+            due = [space for space in quic._loss.spaces if space.ack_at is not None and space.ack_at <= now]
+            if not due or not quic._network_paths:
+                return
+            path = quic._network_paths[0]
+            starved = (not path.is_validated
+                       and AMPLIFICATION_FACTOR * path.bytes_received - path.bytes_sent < MIN_ACK_BUDGET)
+            early = not quic._handshake_complete and all(space is quic._spaces[tls.Epoch.ONE_RTT] for space in due)
+            if not (starved or early):
+                return
+            deadlines = [t for t in (quic._loss_at, quic._close_at, quic._pacing_at) if t is not None]
+        except AttributeError:
+            return
+        if not deadlines or min(deadlines) <= now:
+            return
+        self._timer.cancel()
+        self._timer_at = min(deadlines)
+        self._timer = self._loop.call_at(self._timer_at, self._handle_timer)
+
+    def begin_drain(self, alternate: Optional[Tuple[str, int]] = None):
+        """Send GOAWAY; streams already in flight keep being served"""
+        self.draining = True
+        if self.h3 is not None:
+            self.h3.goaway()  # HTTP/3 has its own GOAWAY frame (no alternate server)
+        else:
+            stream_id = self._quic.get_next_available_stream_id(is_unidirectional=True)
+            target = f" {alternate[0]} {alternate[1]}" if alternate else ""
+            self._quic.send_stream_data(stream_id, GOAWAY_PREFIX + target.encode('utf-8') + b"\n", end_stream=True)
+        self.transmit()
+
+    @property
+    def idle(self) -> bool:
+        """No transfers, waiting writers, uploads or unacknowledged responses"""
+        writer = self.writer
+        if self.file_transfers or writer.pending or writer.waiters or (self.h3 is not None and self.h3.busy):
+            return False
+        for stream_id, stream in self._quic._streams.items():
+            sender = stream.sender
+            if sender._buffer_start != sender._buffer_stop:
+                return False
+            # HTTP/3 control and QPACK streams stay open for the whole connection
+            if not stream.receiver.is_finished and not (self.h3 is not None and stream_id & 2):
+                return False
+        return True
+
+    def _handle_file_request(self, event: StreamDataReceived):
+        """Start streaming a file from serve_dir"""
+        try:
+            _, name, offset = event.data.decode('utf-8').split()
+            offset = int(offset)
+        except ValueError:
+            self._send_error(event.stream_id, "bad request")
+            return
+        if offset < 0:
+            self._send_error(event.stream_id, "bad offset")
+            return
+
+        root = os.path.realpath(self.serve_dir)
+        path = os.path.realpath(os.path.join(root, name))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            self._send_error(event.stream_id, "not found")
+            return
+
+        transfer = FileTransfer(path, offset)
+        self.writer.send(event.stream_id, f"OK {transfer.size}\n".encode('utf-8'))
+        if self.file_transfers is None:
+            self.file_transfers = {}
+        self.file_transfers[event.stream_id] = transfer
+        logger.info(f"📦 Serving {name} on stream {event.stream_id} from offset {transfer.offset}/{transfer.size}")
+        self._pump_file_transfers()
+
+    def _pump_file_transfers(self):
+        queued, unsent = self.writer.occupancy()
+        for stream_id, transfer in list(self.file_transfers.items()):
+            stream = self._quic._streams.get(stream_id)
+            if stream is None:
+                transfer.close()
+                del self.file_transfers[stream_id]
+                continue
+            if self.writer.has_pending(stream_id):
+                continue  # the "OK <size>" header is still waiting for room
+
+            room = self.writer.room(stream_id, (queued, unsent))
+            if room <= 0 and not transfer.done:
+                continue
+
+            chunk = transfer.next_chunk(max(room, 0))
+            self._quic.send_stream_data(stream_id, chunk, end_stream=transfer.done)
+            queued += len(chunk)
+            unsent += len(chunk)
+            chunk.release()
+            if transfer.done:
+                logger.info(f"📦 File transfer on stream {stream_id} fully queued ({transfer.size} bytes)")
+                transfer.close()
+                del self.file_transfers[stream_id]
+
+    def _send_error(self, stream_id: int, reason: str):
+        self.writer.send(stream_id, f"ERR {reason}\n".encode('utf-8'), end_stream=True)
+        logger.warning(f"⚠️  Rejected request on stream {stream_id}: {reason}")
+
+    def _handle_sink_data(self, event: StreamDataReceived):
+        """Count and discard bulk upload data, reply with the total at end of stream"""
+        if self.uploads is None:
+            self.uploads = {}
+        received = self.uploads.get(event.stream_id, -len(SINK_PREFIX)) + len(event.data)
+
+        if event.end_stream:
+            self.uploads.pop(event.stream_id, None)
+            response = f"Received {received} bytes"
+            self.writer.send(event.stream_id, response.encode('utf-8'), end_stream=True)
+            logger.info(f"📥 Bulk upload on stream {event.stream_id} complete: {received} bytes")
+        else:
+            self.uploads[event.stream_id] = received
+
+
+def encode_initial_close(version: int, source_cid: bytes, destination_cid: bytes, error_code: int) -> bytes:
+    """Build a server Initial packet that closes a connection attempt statelessly"""
+    crypto = CryptoPair()
+    crypto.setup_initial(cid=source_cid, is_client=False, version=version)
+    builder = QuicPacketBuilder(
+        host_cid=source_cid,
         is_client=False,
-        alpn_protocols=["quic-migration-demo"],
+        max_datagram_size=SMALLEST_MAX_DATAGRAM_SIZE,
+        peer_cid=destination_cid,
+        version=version,
     )
+    builder.start_packet(QuicPacketType.INITIAL, crypto)
+    buf = builder.start_frame(QuicFrameType.TRANSPORT_CLOSE, capacity=TRANSPORT_CLOSE_FRAME_CAPACITY)
+    buf.push_uint_var(error_code)
+    buf.push_uint_var(QuicFrameType.PADDING)
+    buf.push_uint_var(0)
+    datagrams, _ = builder.flush()
+    return datagrams[0]
+
+
+class MigrationServer(QuicServer):
+    """aioquic's QuicServer plus address validation and a drain mode
+
+    New connections are created here rather than in QuicServer, so that
+    every Initial first goes through the AddressValidation policy.
+    """
+
+    def __init__(
+        self,
+        *,
+        address_validation: Optional[AddressValidation] = None,
+        ticket_store: Optional[TicketStore] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.address_validation = address_validation or AddressValidation()
+        self.ticket_store = ticket_store or TicketStore()
+        self.draining = False
+        self.refused = 0
+
+    def datagram_received(self, data, addr):
+        # only long-header packets can open a connection
+        if data[:1] and data[0] & 0x80:
+            try:
+                header = pull_quic_header(Buffer(data=data), host_cid_length=self._configuration.connection_id_length)
+            except ValueError:
+                return
+            if (
+                header.packet_type == QuicPacketType.INITIAL
+                and header.version in self._configuration.supported_versions
+                and len(data) >= SMALLEST_MAX_DATAGRAM_SIZE
+                and header.destination_cid not in self._protocols
+                and not self._admit(header, addr)
+            ):
+                return
+        super().datagram_received(data, addr)
+
+    def _admit(self, header, addr) -> bool:
+        """Apply drain mode and address validation to a connection-opening Initial"""
+        if self.draining:
+            self.refused += 1
+            self._transport.sendto(encode_initial_close(
+                header.version, header.destination_cid, header.source_cid,
+                QuicErrorCode.CONNECTION_REFUSED,
+            ), addr)
+            return False
+
+        validation = self.address_validation
+        decision, original_cid, retry_cid = validation.check(addr, header.token, header.destination_cid)
+        if decision == AddressValidation.RETRY:
+            source_cid = os.urandom(8)
+            self._transport.sendto(encode_quic_retry(
+                version=header.version,
+                source_cid=source_cid,
+                destination_cid=header.source_cid,
+                original_destination_cid=header.destination_cid,
+                retry_token=validation.tokens.create_token(addr, header.destination_cid, source_cid),
+            ), addr)
+            return False
+        if decision == AddressValidation.INVALID:
+            # RFC 9000 section 8.1.3
+            self._transport.sendto(encode_initial_close(
+                header.version, header.destination_cid, header.source_cid,
+                QuicErrorCode.INVALID_TOKEN,
+            ), addr)
+            return False
+        if decision == AddressValidation.DROP:
+            return False
+
+        self._create_connection(header.destination_cid, original_cid, retry_cid)
+        return True
+
+    def _create_connection(self, destination_cid: bytes, original_cid: bytes, retry_cid: Optional[bytes]):
+        # mirrors the connection setup in aioquic's QuicServer.datagram_received
+        connection = QuicConnection(
+            configuration=self._configuration,
+            original_destination_connection_id=original_cid,
+            retry_source_connection_id=retry_cid,
+            session_ticket_fetcher=lambda ticket_id: self._resume(protocol, ticket_id),
+            session_ticket_handler=lambda ticket: self.ticket_store.add(
+                ticket, protocol.connection_id),
+        )
+        protocol = self._create_protocol(connection, stream_handler=self._stream_handler)
+        protocol.connection_made(self._transport)
+        protocol._connection_id_issued_handler = partial(self._connection_id_issued, protocol=protocol)
+        protocol._connection_id_retired_handler = partial(self._connection_id_retired, protocol=protocol)
+        protocol._connection_terminated_handler = partial(self._connection_terminated, protocol=protocol)
+        if isinstance(protocol, QuicServerProtocol):
+            protocol.server = self
+
+        self._protocols[destination_cid] = protocol
+        self._protocols[connection.host_cid] = protocol
+
+    def _resume(self, protocol: QuicServerProtocol, ticket_id: bytes):
+        found = self.ticket_store.fetch(ticket_id)
+        if found is None:
+            return None
+        ticket, protocol.session_id = found
+        return ticket
+
+    @property
+    def connections(self) -> set:
+        return set(self._protocols.values())
+
+    def stats(self) -> Dict:
+        return {
+            "server_connections": len(self.connections),
+            "draining": self.draining,
+            **self.address_validation.snapshot(),
+            **self.ticket_store.snapshot(),
+        }
+
+
+async def start_server(host: str, port: int, **kwargs) -> MigrationServer:
+    """Like aioquic's serve(), but returns a MigrationServer"""
+    loop = asyncio.get_running_loop()
+    _, server = await loop.create_datagram_endpoint(
+        lambda: MigrationServer(**kwargs),
+        local_addr=(host, port),
+    )
+    return server
+
+
+async def drain_server(
+    server: MigrationServer,
+    deadline: float,
+    alternate: Optional[Tuple[str, int]] = None,
+    idle_grace: float = DRAIN_IDLE_GRACE,
+    poll_interval: float = 0.05,
+) -> Dict:
+    """Refuse new connections, send GOAWAY and wait for in-flight streams
+
+    A connection has drained once the client closes it or it has been idle
+    for `idle_grace` seconds; whatever is left at `deadline` is closed.
+    """
+    from load_test import percentile  # imported here: load_test imports this module
+
+    server.draining = True
+    started = time.monotonic()
+    pending = server.connections
+    total = len(pending)
+    logger.warning(f"🚰 Draining {total} connections (deadline {deadline:.0f}s, "
+                   f"successor: {'%s:%d' % alternate if alternate else 'none'})")
+
+    for protocol in pending:
+        protocol.begin_drain(alternate)
+
+    drain_times = []
+    idle_since: Dict[QuicServerProtocol, float] = {}
+    while pending and time.monotonic() - started < deadline:
+        await asyncio.sleep(poll_interval)
+        now = time.monotonic()
+        for protocol in list(pending):
+            if protocol._closed.is_set():
+                pass
+            elif protocol.idle:
+                if now - idle_since.setdefault(protocol, now) < idle_grace:
+                    continue
+                protocol.close(reason_phrase="server draining")
+            else:
+                idle_since.pop(protocol, None)
+                continue
+            pending.discard(protocol)
+            drain_times.append(now - started)
+
+    for protocol in pending:
+        protocol.close(error_code=QuicErrorCode.APPLICATION_ERROR, reason_phrase="drain deadline")
+
+    return {
+        "connections": total,
+        "drained": len(drain_times),
+        "forced": len(pending),
+        "refused": server.refused,
+        "elapsed": time.monotonic() - started,
+        "drain_p50": statistics.median(drain_times) if drain_times else 0.0,
+        "drain_p99": percentile(drain_times, 0.99, default=0.0),
+    }
+
+
+def log_buffer_metrics(metrics: BufferMetrics):
+    stats = metrics.snapshot()
+    logger.info(
+        f"📊 Send buffers: {stats['queued_bytes'] / 1024:.0f} KiB queued "
+        f"({stats['unsent_bytes'] / 1024:.0f} KiB unsent) over {stats['connections']} connections "
+        f"| peak {stats['peak_queued_bytes'] / 1024:.0f} KiB | {stats['waiting_producers']} waiting "
+        f"| {stats['waits']} waits ({stats['credit_waits']} on peer credit)"
+    )
+
+
+async def run_server(
+    host: str = "127.0.0.1",
+    port: int = 4433,
+    event_log_dir: Optional[str] = "migration_log",
+    profile: str = DEFAULT_PROFILE,
+    serve_dir: Optional[str] = None,
+    metrics_interval: Optional[float] = None,
+    write_limits: Optional[Dict[str, int]] = None,
+    drain_timeout: float = 10.0,
+    drain_to: Optional[Tuple[str, int]] = None,
+    address_validation: Optional[AddressValidation] = None,
+    migration_limiter: Optional[MigrationRateLimiter] = None,
+    detector: Optional[MigrationAnomalyDetector] = None,
+    state_dir: Optional[str] = None,
+    h3: bool = False,
+    profiling: Optional[Profiling] = None,
+):
+    """Run the QUIC server until SIGTERM, then drain it"""
+
+    # Configure QUIC with self-signed certificate
+    tuning = get_profile(profile)
+    configuration = tuning.configuration(is_client=False)
+    if h3:
+        configuration.alpn_protocols = H3_ALPN + configuration.alpn_protocols
+    h3_metrics = H3Metrics() if h3 else None
 
     # Generate self-signed certificate
     from aioquic.tls import SessionTicket
@@ -126,27 +789,205 @@ async def run_server(host: str = "127.0.0.1", port: int = 4433):
     # Create self-signed cert for testing
     configuration.load_cert_chain("cert.pem", "key.pem")
 
-    migration_tracker = MigrationTracker()
+    event_log = MigrationEventLog(event_log_dir) if event_log_dir else None
+    address_validation = address_validation or AddressValidation()
+    state = ServerState(state_dir) if state_dir else None
+    if state:
+        if address_validation.tokens is not None:
+            state.load_retry_keys(address_validation.tokens)
+        if detector is not None and detector.restore(state.detector_dir()):
+            logger.info(f"🕵️  Restored migration detector state from {state.detector_dir()}/")
+    migration_tracker = MigrationTracker(event_log=event_log, detector=detector)
+    buffer_metrics = BufferMetrics()
 
     logger.info(f"🚀 Starting QUIC server on {host}:{port}")
     logger.info(f"📋 Server supports connection migration")
     logger.info(f"🔧 ALPN: {configuration.alpn_protocols}")
+    logger.info(f"🎛️  Tuning profile: {tuning.name} ({tuning.description})")
+    if event_log:
+        logger.info(f"💾 Migration events persisted to {event_log_dir}/")
+    if state:
+        logger.info(f"♻️  Session tickets and server state kept in {state_dir}/ (warm restart)")
+    if serve_dir:
+        logger.info(f"📂 Serving files from {serve_dir}/")
+    if h3:
+        logger.info(f"🌐 HTTP/3 endpoints: /json, /stream?bytes=N, /push?count=N, /asset/<i>, /stats")
+    if address_validation and address_validation.retry != "off":
+        logger.info(f"🛡️  Retry: {address_validation.retry} (load threshold "
+                    f"{address_validation.load_threshold:.0f} Initials/s)")
+    timings = profiling.timings if profiling else None
+    lag_monitor = profiling.lag_monitor if profiling else None
+    capture = profiling.capture if profiling else None
+    if timings:
+        instrument_logging(timings)
+        logger.info("⏱️  Event timing on (histograms in STATS, summary at shutdown)")
+    if capture:
+        logger.info(f"🔬 Profiler captures ({capture.profiler}) on SIGUSR1 or PROFILE, written to {capture.directory}/")
+    if detector:
+        logger.info(f"🕵️  Migration anomaly detector: > {detector.max_rate:g}/s or > {detector.max_addresses:g} "
+                    f"addresses ({detector.memory_bytes / 2**20:.1f} MiB)")
 
-    await serve(
+    protocol_class = instrument_protocol(QuicServerProtocol, timings) if timings else QuicServerProtocol
+    server = await start_server(
         host,
         port,
         configuration=configuration,
-        create_protocol=lambda *args, **kwargs: QuicServerProtocol(
-            *args, **kwargs, migration_tracker=migration_tracker
+        address_validation=address_validation,
+        ticket_store=state.tickets if state else None,
+        create_protocol=lambda *args, **kwargs: protocol_class(
+            *args, **kwargs, migration_tracker=migration_tracker, profile=tuning,
+            serve_dir=serve_dir, buffer_metrics=buffer_metrics, write_limits=write_limits,
+            migration_limiter=migration_limiter, h3_metrics=h3_metrics, profiling=profiling,
         ),
     )
 
-    # Keep server running
-    await asyncio.Future()
+    if state:
+        # only once the socket is up, so a big state directory never delays startup
+        state.start_loading(migration_tracker)
+
+    # Keep server running until SIGTERM (SIGINT still stops it immediately)
+    drain_requested = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, drain_requested.set)
+    if capture:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, profiling.start_capture)
+    if lag_monitor:
+        lag_monitor.start()
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(drain_requested.wait(), metrics_interval)
+                break
+            except asyncio.TimeoutError:
+                log_buffer_metrics(buffer_metrics)
+
+        report = await drain_server(server, drain_timeout, drain_to)
+        logger.warning(
+            f"🚰 Drain finished in {report['elapsed']:.2f}s | {report['drained']}/{report['connections']} "
+            f"connections drained, {report['forced']} closed at deadline, {report['refused']} new refused "
+            f"| p99 drain time {report['drain_p99']:.2f}s"
+        )
+        server.close()
+    finally:
+        if lag_monitor:
+            lag_monitor.stop()
+        if capture:
+            capture.stop()
+        if timings:
+            logger.info(f"⏱️  Event timings:\n{timings.report()}")
+        if event_log:
+            event_log.close()
+        if state:
+            state.save_tracker(migration_tracker)
+            if detector is not None:
+                detector.save(state.detector_dir())
+            if address_validation.tokens is not None:
+                state.save_retry_keys(address_validation.tokens)
+            state.close()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="QUIC server with connection migration tracking")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4433)
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=list(PROFILES),
+                        help="QUIC tuning profile (default: %(default)s)")
+    parser.add_argument("--event-log-dir", default="migration_log",
+                        help="directory for the persistent migration log ('' to disable)")
+    parser.add_argument("--state-dir", default="server_state",
+                        help="keep session tickets and migration state here across restarts ('' to disable)")
+    parser.add_argument("--serve-dir", help="serve files from this directory (GET requests)")
+    parser.add_argument("--h3", action="store_true",
+                        help="also offer HTTP/3 (ALPN h3) with synthetic endpoints (see http3.py)")
+    parser.add_argument("--stream-buffer-limit", type=int, default=DEFAULT_STREAM_LIMIT // 1024,
+                        help="KiB of unacknowledged data queued per stream (default: %(default)s)")
+    parser.add_argument("--connection-buffer-limit", type=int, default=DEFAULT_CONNECTION_LIMIT // 1024,
+                        help="KiB of unacknowledged data queued per connection (default: %(default)s)")
+    parser.add_argument("--unsent-buffer-limit", type=int, default=DEFAULT_UNSENT_LIMIT // 1024,
+                        help="KiB queued but not yet sent per connection (default: %(default)s)")
+    parser.add_argument("--metrics-interval", type=float,
+                        help="log send-buffer occupancy every N seconds")
+    parser.add_argument("--drain-timeout", type=float, default=10.0,
+                        help="seconds to finish in-flight streams after SIGTERM (default: %(default)s)")
+    parser.add_argument("--drain-to", metavar="HOST:PORT",
+                        help="successor server that drained clients are sent to")
+    parser.add_argument("--retry", default="off", choices=RETRY_MODES,
+                        help="stateless Retry: never, always, or only above --initial-load-threshold")
+    parser.add_argument("--initial-load-threshold", type=float, default=200.0,
+                        help="new-connection Initials/s above which Retry (auto) and rate limiting apply")
+    parser.add_argument("--initial-rate-per-source", type=float, default=20.0,
+                        help="Initials/s allowed per source address under load (0 disables)")
+    parser.add_argument("--migration-rate", type=float, default=2.0,
+                        help="new client paths/s allowed per connection (0 disables)")
+    parser.add_argument("--migration-burst", type=float, default=5.0)
+    parser.add_argument("--prefix-migration-rate", type=float, default=50.0,
+                        help="new client paths/s allowed per /24 (v4) or /48 (v6) prefix (0 disables)")
+    parser.add_argument("--prefix-migration-burst", type=float, default=100.0)
+    parser.add_argument("--anomaly-max-rate", type=float, default=1.0,
+                        help="flag connections migrating faster than this per second (0 disables)")
+    parser.add_argument("--anomaly-max-addresses", type=float, default=16.0,
+                        help="flag connections seen at more distinct addresses (0 disables)")
+    parser.add_argument("--event-timing", action="store_true",
+                        help="time aioquic processing, event handlers and logging (reported in STATS)")
+    parser.add_argument("--loop-lag-interval", type=float, default=0.0,
+                        help="measure event-loop lag every N seconds (0 disables)")
+    parser.add_argument("--capture-dir",
+                        help="write profiler captures here; enables SIGUSR1 and PROFILE requests")
+    parser.add_argument("--profiler", default="cprofile", choices=PROFILERS,
+                        help="cProfile, or stack sampling for flame graphs (default: %(default)s)")
+    parser.add_argument("--capture-seconds", type=float, default=10.0,
+                        help="length of a profiler capture (default: %(default)s)")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="trace Python allocations (traced bytes and top sites in STATS; slows the server)")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    args = parser.parse_args()
+
+    logger.setLevel(args.log_level)
+    if args.tracemalloc:
+        tracemalloc.start()
+    drain_to = None
+    if args.drain_to:
+        drain_host, _, drain_port = args.drain_to.rpartition(":")
+        drain_to = (drain_host, int(drain_port))
+
     try:
-        asyncio.run(run_server())
+        asyncio.run(run_server(
+            host=args.host,
+            port=args.port,
+            event_log_dir=args.event_log_dir or None,
+            state_dir=args.state_dir or None,
+            profile=args.profile,
+            serve_dir=args.serve_dir,
+            h3=args.h3,
+            metrics_interval=args.metrics_interval,
+            write_limits={
+                "stream_limit": args.stream_buffer_limit * 1024,
+                "connection_limit": args.connection_buffer_limit * 1024,
+                "unsent_limit": args.unsent_buffer_limit * 1024,
+            },
+            drain_timeout=args.drain_timeout,
+            drain_to=drain_to,
+            address_validation=AddressValidation(
+                retry=args.retry,
+                load_threshold=args.initial_load_threshold,
+                source_rate=args.initial_rate_per_source,
+                source_burst=2 * args.initial_rate_per_source,
+            ),
+            migration_limiter=MigrationRateLimiter(
+                rate=args.migration_rate,
+                burst=args.migration_burst,
+                prefix_rate=args.prefix_migration_rate,
+                prefix_burst=args.prefix_migration_burst,
+            ),
+            detector=MigrationAnomalyDetector(
+                max_rate=args.anomaly_max_rate,
+                max_addresses=args.anomaly_max_addresses,
+            ) if args.anomaly_max_rate or args.anomaly_max_addresses else None,
+            profiling=Profiling(
+                timings=EventTimings() if args.event_timing else None,
+                lag_monitor=LoopLagMonitor(args.loop_lag_interval) if args.loop_lag_interval > 0 else None,
+                capture=ProfileCapture(args.capture_dir, args.profiler) if args.capture_dir else None,
+                capture_seconds=args.capture_seconds,
+            ) if args.event_timing or args.loop_lag_interval > 0 or args.capture_dir or args.tracemalloc else None,
+        ))
     except KeyboardInterrupt:
         logger.info("🛑 Server stopped by user")
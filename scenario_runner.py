@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Executable Migration Scenarios
+Runs the scenarios from migration_demo.py as step scripts against a live server
+
+Each scenario instance opens its own QUIC connection to a running
+quic_server.py, performs real socket-level migrations (new source port, new
+loopback IP, backup-path failover) and checks the echo still comes back. Many
+instances run concurrently on one event loop, so the suite doubles as a
+migration performance regression test.
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from aioquic.asyncio import connect
+from aioquic.quic.configuration import QuicConfiguration
+
+from load_test import percentile
+from migration_demo import SCENARIOS
+from quic_client import QuicClientProtocol, open_path, rebind, send_message, use_path
+
+logger = logging.getLogger(__name__)
+
+PASS = "pass"
+FAIL = "fail"
+SKIP = "skip"
+
+
+class StepSkipped(Exception):
+    """Raised by a step that cannot run in this environment"""
+
+
+@dataclass
+class ScenarioContext:
+    """State shared by the steps of one scenario instance"""
+
+    protocol: QuicClientProtocol
+    instance: int
+    transports: List[asyncio.DatagramTransport] = field(default_factory=list)
+    backup: Optional[asyncio.DatagramTransport] = None
+
+    async def echo(self, message: str):
+        response = await send_message(self.protocol, f"[{self.instance}] {message}")
+        if not response or not response.startswith("Echo:"):
+            raise AssertionError(f"unexpected response: {response!r}")
+        return response
+
+    def local_address(self):
+        return self.protocol._transport.get_extra_info("sockname")[:2]
+
+
+@dataclass
+class Step:
+    """One scripted action of a scenario"""
+
+    description: str
+    action: Callable[[ScenarioContext], Awaitable[Optional[str]]]
+
+
+@dataclass
+class StepResult:
+    description: str
+    status: str
+    duration: float
+    detail: str = ""
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    instance: int
+    steps: List[StepResult] = field(default_factory=list)
+
+    @property
+    def failed(self) -> bool:
+        return any(step.status == FAIL for step in self.steps)
+
+    @property
+    def passed(self) -> bool:
+        """Every step ran and passed; a scenario with skipped steps is neither passed nor failed"""
+        return bool(self.steps) and all(step.status == PASS for step in self.steps)
+
+    @property
+    def skipped(self) -> bool:
+        return not self.passed and not self.failed
+
+    @property
+    def duration(self) -> float:
+        return sum(step.duration for step in self.steps)
+
+
+# Step actions
+
+async def _initial_exchange(ctx: ScenarioContext):
+    await ctx.echo("hello")
+    return f"local {ctx.local_address()}"
+
+
+async def _rebind_port(ctx: ScenarioContext):
+    old = ctx.local_address()
+    ctx.transports.append(await rebind(ctx.protocol, local_host=old[0]))
+    return f"{old[1]} -> {ctx.local_address()[1]}"
+
+
+def _change_ip(new_host: str):
+    async def action(ctx: ScenarioContext):
+        old = ctx.local_address()
+        ctx.transports.append(await rebind(ctx.protocol, local_host=new_host))
+        return f"{old[0]} -> {ctx.local_address()[0]}"
+    return action
+
+
+async def _echo_after_migration(ctx: ScenarioContext):
+    response = await ctx.echo("after migration")
+    return response.rsplit("|", 1)[-1].strip()
+
+
+async def _server_preferred_address(ctx: ScenarioContext):
+    # aioquic neither sends nor acts on the preferred_address transport
+    # parameter, so there is no address for the client to follow.
+    raise StepSkipped("aioquic does not implement preferred_address")
+
+
+async def _open_backup_path(ctx: ScenarioContext):
+    primary = ctx.protocol._transport
+    ctx.backup = await open_path(ctx.protocol)
+    ctx.transports.append(ctx.backup)
+    use_path(ctx.protocol, primary)
+    return f"backup {ctx.backup.get_extra_info('sockname')[:2]}"
+
+
+async def _probe_backup_path(ctx: ScenarioContext):
+    # A PING is not a probing frame, so the server briefly moves to the
+    # backup path and back; both moves show up as migrations server-side.
+    primary = ctx.protocol._transport
+    use_path(ctx.protocol, ctx.backup)
+    await ctx.protocol.ping()
+    use_path(ctx.protocol, primary)
+    return "PING acknowledged on backup"
+
+
+async def _fail_primary(ctx: ScenarioContext):
+    ctx.protocol._transport.close()
+    use_path(ctx.protocol, ctx.backup)
+    await ctx.echo("after failover")
+    return f"now on {ctx.local_address()}"
+
+
+SCENARIO_SCRIPTS: Dict[str, List[Step]] = {
+    "NAT Rebinding": [
+        Step("Establish connection and exchange data", _initial_exchange),
+        Step("Rebind to a new source port", _rebind_port),
+        Step("Exchange data on the new path", _echo_after_migration),
+    ],
+    "Network Interface Switch (WiFi to Cellular)": [
+        Step("Establish connection and exchange data", _initial_exchange),
+        Step("Switch to a new source IP (127.0.0.2)", _change_ip("127.0.0.2")),
+        Step("Exchange data on the new path", _echo_after_migration),
+    ],
+    "Client Address Change (ISP Reassignment)": [
+        Step("Establish connection and exchange data", _initial_exchange),
+        Step("Switch to a new source IP (127.0.0.3)", _change_ip("127.0.0.3")),
+        Step("Exchange data on the new path", _echo_after_migration),
+        Step("Switch to another source IP (127.0.0.4)", _change_ip("127.0.0.4")),
+        Step("Exchange data on the new path", _echo_after_migration),
+    ],
+    "Server-Preferred Address Migration": [
+        Step("Establish connection and exchange data", _initial_exchange),
+        Step("Follow server's preferred address", _server_preferred_address),
+    ],
+    "Multi-Path QUIC (Future Extension)": [
+        Step("Establish primary path and exchange data", _initial_exchange),
+        Step("Open backup path", _open_backup_path),
+        Step("Exercise backup path with a PING", _probe_backup_path),
+        Step("Fail primary path and continue on backup", _fail_primary),
+    ],
+}
+
+
+async def _run_steps(ctx: ScenarioContext, steps: List[Step], result: ScenarioResult, step_timeout: float):
+    skipping = False
+    for step in steps:
+        if skipping:
+            result.steps.append(StepResult(step.description, SKIP, 0.0, "previous step did not pass"))
+            continue
+        start = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(step.action(ctx), step_timeout)
+            result.steps.append(StepResult(step.description, PASS, time.perf_counter() - start, detail or ""))
+        except StepSkipped as e:
+            result.steps.append(StepResult(step.description, SKIP, time.perf_counter() - start, str(e)))
+            skipping = True
+        except Exception as e:
+            detail = "timed out" if isinstance(e, asyncio.TimeoutError) else repr(e)
+            result.steps.append(StepResult(step.description, FAIL, time.perf_counter() - start, detail))
+            skipping = True
+
+
+async def run_scenario(
+    name: str,
+    instance: int,
+    host: str = "127.0.0.1",
+    port: int = 4433,
+    step_timeout: float = 5.0,
+) -> ScenarioResult:
+    """Run one instance of a scenario on its own connection"""
+    result = ScenarioResult(name=name, instance=instance)
+    steps = SCENARIO_SCRIPTS[name]
+    configuration = QuicConfiguration(
+        is_client=True,
+        alpn_protocols=["quic-migration-demo"],
+        verify_mode=False,
+    )
+
+    ctx: Optional[ScenarioContext] = None
+    start = time.perf_counter()
+
+    async def body():
+        nonlocal ctx
+        async with connect(host, port, configuration=configuration, create_protocol=QuicClientProtocol) as protocol:
+            result.steps.append(StepResult("Connect", PASS, time.perf_counter() - start))
+            ctx = ScenarioContext(protocol=protocol, instance=instance)
+            await _run_steps(ctx, steps, result, step_timeout)
+
+    try:
+        await asyncio.wait_for(body(), (len(steps) + 2) * step_timeout)
+    except Exception as e:
+        if ctx is None:
+            detail = "timed out" if isinstance(e, asyncio.TimeoutError) else repr(e)
+            result.steps.append(StepResult("Connect", FAIL, time.perf_counter() - start, detail))
+    finally:
+        if ctx is not None:
+            for transport in ctx.transports:
+                transport.close()
+
+    return result
+
+
+async def run_scenarios(
+    names: Optional[List[str]] = None,
+    instances: int = 1,
+    concurrency: int = 50,
+    host: str = "127.0.0.1",
+    port: int = 4433,
+    step_timeout: float = 5.0,
+) -> List[ScenarioResult]:
+    """Run `instances` copies of each scenario concurrently"""
+    names = names or [scenario.name for scenario in SCENARIOS]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(name: str, instance: int) -> ScenarioResult:
+        async with semaphore:
+            return await run_scenario(name, instance, host, port, step_timeout)
+
+    return await asyncio.gather(*(
+        bounded(name, i) for name in names for i in range(instances)
+    ))
+
+
+def print_results(results: List[ScenarioResult], elapsed: float, verbose: bool = False):
+    """Print per-step pass/fail counts and timing for each scenario"""
+    print("\n" + "=" * 70)
+    print("🧪 MIGRATION SCENARIO RESULTS")
+    print("=" * 70)
+
+    by_name: Dict[str, List[ScenarioResult]] = {}
+    for result in results:
+        by_name.setdefault(result.name, []).append(result)
+
+    for name, runs in by_name.items():
+        passed = sum(run.passed for run in runs)
+        skipped = sum(run.skipped for run in runs)
+        icon = "✅" if passed == len(runs) else "❌" if any(run.failed for run in runs) else "⏭️ "
+        print(f"\n{icon} {name}  ({passed}/{len(runs)} passed{f', {skipped} skipped' if skipped else ''})")
+
+        for i, step_desc in enumerate(r.description for r in runs[0].steps):
+            steps = [run.steps[i] for run in runs if i < len(run.steps)]
+            counts = {status: sum(s.status == status for s in steps) for status in (PASS, FAIL, SKIP)}
+            timings = [s.duration * 1000 for s in steps if s.status == PASS]
+            timing = ""
+            if timings:
+                timing = f"p50 {statistics.median(timings):7.1f}ms  p99 {percentile(timings, 0.99):7.1f}ms"
+            print(
+                f"   {i:2}. {step_desc:45} {counts[PASS]:4} pass {counts[FAIL]:3} fail "
+                f"{counts[SKIP]:3} skip  {timing}"
+            )
+            if verbose or counts[FAIL] or (counts[SKIP] and not counts[PASS]):
+                details = {s.detail for s in steps if s.status != PASS and s.detail}
+                for detail in sorted(details)[:3]:
+                    print(f"       → {detail}")
+
+    total = len(results)
+    passed = sum(r.passed for r in results)
+    skipped = sum(r.skipped for r in results)
+    print("\n" + "-" * 70)
+    print(f"Scenario instances: {total} | passed: {passed} | skipped: {skipped} | failed: {total - passed - skipped}")
+    print(f"Wall time: {elapsed:.2f}s | {total / elapsed if elapsed else 0:.1f} scenarios/sec")
+    print("=" * 70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run QUIC migration scenarios against a live quic_server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4433)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIO_SCRIPTS),
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument("--instances", type=int, default=1, help="instances of each scenario")
+    parser.add_argument("--concurrency", type=int, default=50, help="max scenario instances in flight")
+    parser.add_argument("--step-timeout", type=float, default=5.0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    start = time.perf_counter()
+    results = asyncio.run(run_scenarios(
+        names=args.scenario,
+        instances=args.instances,
+        concurrency=args.concurrency,
+        host=args.host,
+        port=args.port,
+        step_timeout=args.step_timeout,
+    ))
+    print_results(results, time.perf_counter() - start, verbose=args.verbose)
+    raise SystemExit(1 if any(r.failed for r in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Persistent Server State for Warm Restarts
+Session tickets, Retry secrets and migration state that survive a restart
+
+aioquic's session tickets are random 64-byte identifiers that the server
+looks up when a client tries to resume, so a restarted server without its
+ticket store sends every client through a full handshake at once. Here:
+
+- TicketStore appends each ticket to a per-run segment file, encrypted with
+  AES-GCM under a key kept in `ticket.key` (mode 0600). Tickets are
+  single-use: a resumption appends a tombstone, so 0-RTT data cannot be
+  replayed with the same ticket, even across restarts. At startup a
+  background thread maps the segments and indexes ticket IDs to offsets;
+  tickets are only decrypted when a client presents them.
+- The Retry token secrets are saved, so tokens issued just before a
+  restart still validate.
+- Each ticket remembers the session (tracker connection ID) it belongs to.
+  A resumed connection keeps that ID, so its migration history from the
+  tracker and its anomaly-detector slot carry over the restart. The
+  detector arrays are memory-mapped copy-on-write at startup.
+
+Nothing here blocks startup: until the index is loaded, unknown tickets
+just miss and those clients do a full handshake.
+"""
+
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aioquic.tls import CipherSuite, SessionTicket
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+logger = logging.getLogger(__name__)
+
+TICKET_KEY_FILE = "ticket.key"
+RETRY_KEYS_FILE = "retry.keys"
+TRACKER_FILE = "tracker.json"
+DETECTOR_DIR = "detector"
+SEGMENT_PREFIX = "tickets-"
+SEGMENT_SUFFIX = ".log"
+
+# Record: kind, ticket id length, expiry (unix time), payload length
+RECORD_HEADER = struct.Struct("<BBdI")
+RECORD_TICKET, RECORD_USED = 1, 2
+NONCE_SIZE = 12
+
+# Ticket body: age_add, cipher suite, not before, not after, max early data (-1 = none)
+TICKET_BODY = struct.Struct("<IHddq")
+NO_SERVER_NAME = 0xFFFF
+
+TICKET_LIFETIME = 86400  # what aioquic puts in every NewSessionTicket
+TRACKER_SESSIONS = 10000
+# Tickets this run keeps in memory; past this the oldest are forgotten (those
+# clients do a full handshake). Expired tickets are dropped anyway.
+MAX_RECENT_TICKETS = 100_000
+SWEEP_INTERVAL = 60.0  # seconds between checks for expired segments on disk
+TRACKER_LOAD_TIMEOUT = 5.0
+
+
+def write_atomic(path: str, data: bytes, mode: int = 0o644):
+    """Replace `path` without readers (or mappings) ever seeing a partial file"""
+    temporary = f"{path}.tmp"
+    fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def load_or_create_key(path: str, size: int = 32) -> bytes:
+    try:
+        with open(path, "rb") as f:
+            key = f.read()
+        if len(key) == size:
+            return key
+        logger.warning(f"⚠️  {path} has the wrong size, generating a new key")
+    except FileNotFoundError:
+        pass
+    key = AESGCM.generate_key(bit_length=size * 8)
+    write_atomic(path, key, mode=0o600)
+    return key
+
+
+def encode_ticket(ticket: SessionTicket, session: str) -> bytes:
+    secret = ticket.resumption_secret
+    name = ticket.server_name.encode("utf-8") if ticket.server_name is not None else None
+    early = -1 if ticket.max_early_data_size is None else ticket.max_early_data_size
+    parts = [
+        TICKET_BODY.pack(ticket.age_add, ticket.cipher_suite, ticket.not_valid_before.timestamp(),
+                         ticket.not_valid_after.timestamp(), early),
+        bytes([len(secret)]), secret,
+        struct.pack("<H", NO_SERVER_NAME if name is None else len(name)), name or b"",
+        struct.pack("<H", len(ticket.other_extensions)),
+    ]
+    for extension_type, value in ticket.other_extensions:
+        parts += [struct.pack("<HH", extension_type, len(value)), value]
+    session_bytes = session.encode("utf-8")
+    parts += [struct.pack("<H", len(session_bytes)), session_bytes]
+    return b"".join(parts)
+
+
+def decode_ticket(ticket_id: bytes, data: bytes) -> Tuple[SessionTicket, str]:
+    age_add, suite, not_before, not_after, early = TICKET_BODY.unpack_from(data)
+    pos = TICKET_BODY.size
+
+    def take(length: int) -> bytes:
+        nonlocal pos
+        value = data[pos:pos + length]
+        pos += length
+        return value
+
+    secret = take(take(1)[0])
+    name_length = struct.unpack("<H", take(2))[0]
+    name = None if name_length == NO_SERVER_NAME else take(name_length).decode("utf-8")
+    extensions = []
+    for _ in range(struct.unpack("<H", take(2))[0]):
+        extension_type, length = struct.unpack("<HH", take(4))
+        extensions.append((extension_type, take(length)))
+    session = take(struct.unpack("<H", take(2))[0]).decode("utf-8")
+    utc = datetime.timezone.utc
+    return SessionTicket(
+        age_add=age_add,
+        cipher_suite=CipherSuite(suite),
+        not_valid_after=datetime.datetime.fromtimestamp(not_after, utc),
+        not_valid_before=datetime.datetime.fromtimestamp(not_before, utc),
+        resumption_secret=secret,
+        server_name=name,
+        ticket=ticket_id,
+        max_early_data_size=None if early < 0 else early,
+        other_extensions=extensions,
+    ), session
+
+
+class TicketStore:
+    """Single-use session tickets, in memory and optionally on disk
+
+    `add` and `fetch` have the shape of aioquic's session ticket handler
+    and fetcher, plus the session each ticket belongs to. With no
+    directory, tickets only live as long as the process.
+    """
+
+    def __init__(self, directory: Optional[str] = None, lifetime: float = TICKET_LIFETIME,
+                 max_recent: int = MAX_RECENT_TICKETS):
+        self.directory = directory
+        self.lifetime = lifetime
+        self.max_recent = max_recent
+        # tickets issued by this run, encoded (a few hundred bytes less than a SessionTicket each),
+        # in issue order, which is also expiry order
+        self._recent: Dict[bytes, bytes] = {}
+        self._index: Dict[bytes, Tuple[mmap.mmap, int, int]] = {}  # id -> (segment, offset, length)
+        self._maps: List[Tuple[float, mmap.mmap]] = []  # (when every ticket in it has expired, segment)
+        self._next_sweep = 0.0
+        self._fd: Optional[int] = None
+        self._aead: Optional[AESGCM] = None
+        self.ready = threading.Event()
+        self.counters = {"tickets_issued": 0, "tickets_loaded": 0, "resumed": 0,
+                         "resumed_from_disk": 0, "ticket_misses": 0}
+        self.load_seconds = 0.0
+
+        if directory is None:
+            self.ready.set()
+            return
+        os.makedirs(directory, exist_ok=True)
+        self._aead = AESGCM(load_or_create_key(os.path.join(directory, TICKET_KEY_FILE)))
+        # each run appends to its own segment, which this run never maps
+        self._segments_on_disk = self._segments()
+        self._segment_path = os.path.join(directory, f"{SEGMENT_PREFIX}{time.time_ns()}{SEGMENT_SUFFIX}")
+        self._fd = os.open(self._segment_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+
+    def start_loading(self):
+        """Index the tickets on disk in the background"""
+        if not self.ready.is_set():
+            threading.Thread(target=self._load, args=(self._segments_on_disk,), name="ticket-index",
+                             daemon=True).start()
+
+    def _segments(self) -> List[str]:
+        names = sorted(
+            (n for n in os.listdir(self.directory) if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX)),
+            key=lambda n: int(n[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]),
+        )
+        return [os.path.join(self.directory, n) for n in names]
+
+    def _load(self, paths: List[str]):
+        """Index every live ticket on disk; runs on a background thread"""
+        started = time.perf_counter()
+        now = time.time()
+        index: Dict[bytes, Tuple[mmap.mmap, int, int]] = {}
+        for path in paths:
+            if os.path.getmtime(path) < now - self.lifetime:
+                os.unlink(path)  # every ticket in it has expired
+                continue
+            with open(path, "rb") as f:
+                if not os.fstat(f.fileno()).st_size:
+                    os.unlink(path)
+                    continue
+                segment = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps.append((os.path.getmtime(path) + self.lifetime, segment))
+            pos, end = 0, len(segment)
+            while pos + RECORD_HEADER.size <= end:
+                kind, id_length, expires, length = RECORD_HEADER.unpack_from(segment, pos)
+                start = pos + RECORD_HEADER.size
+                pos = start + id_length + length
+                if pos > end:
+                    break  # torn write at the tail
+                ticket_id = segment[start:start + id_length]
+                if kind == RECORD_USED:
+                    index.pop(ticket_id, None)
+                elif expires > now:
+                    index[ticket_id] = (segment, start + id_length, length)
+        self._index = index
+        self.counters["tickets_loaded"] = len(index)
+        self.load_seconds = time.perf_counter() - started
+        self.ready.set()
+
+    def _append(self, kind: int, ticket_id: bytes, expires: float, payload: bytes = b""):
+        if self._fd is not None:
+            os.write(self._fd, RECORD_HEADER.pack(kind, len(ticket_id), expires, len(payload)) + ticket_id + payload)
+
+    def _expire(self, now: float):
+        """Forget expired tickets, and the oldest ones to make room under max_recent"""
+        recent = self._recent
+        while recent:
+            oldest = next(iter(recent))
+            if len(recent) < self.max_recent and TICKET_BODY.unpack_from(recent[oldest])[3] > now:
+                break
+            del recent[oldest]
+        if now < self._next_sweep or not self.ready.is_set():
+            return
+        self._next_sweep = now + SWEEP_INTERVAL
+        expired = {id(segment) for expires, segment in self._maps if expires <= now}
+        if expired:
+            self._index = {ticket_id: location for ticket_id, location in self._index.items()
+                           if id(location[0]) not in expired}
+            for _, segment in self._maps:
+                if id(segment) in expired:
+                    segment.close()
+            self._maps = [(expires, segment) for expires, segment in self._maps if id(segment) not in expired]
+
+    def add(self, ticket: SessionTicket, session: str):
+        self.counters["tickets_issued"] += 1
+        self._expire(time.time())
+        encoded = self._recent[ticket.ticket] = encode_ticket(ticket, session)
+        if self._aead is not None:
+            nonce = os.urandom(NONCE_SIZE)
+            sealed = self._aead.encrypt(nonce, encoded, ticket.ticket)
+            self._append(RECORD_TICKET, ticket.ticket, ticket.not_valid_after.timestamp(), nonce + sealed)
+
+    def fetch(self, ticket_id: bytes) -> Optional[Tuple[SessionTicket, str]]:
+        """Return and consume the ticket with this ID, with its session"""
+        encoded = self._recent.pop(ticket_id, None)
+        found = decode_ticket(ticket_id, encoded) if encoded is not None else None
+        location = self._index.pop(ticket_id, None)
+        if found is None and location is not None:
+            segment, offset, length = location
+            sealed = segment[offset:offset + length]
+            try:
+                found = decode_ticket(ticket_id, self._aead.decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], ticket_id))
+                self.counters["resumed_from_disk"] += 1
+            except Exception as e:
+                logger.warning(f"⚠️  Stored session ticket unreadable: {e}")
+        if found is None:
+            self.counters["ticket_misses"] += 1
+            return None
+        self.counters["resumed"] += 1
+        self._append(RECORD_USED, ticket_id, 0.0)
+        return found
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def snapshot(self) -> Dict[str, float]:
+        return {**self.counters, "tickets_index_ready": self.ready.is_set(),
+                "tickets_index_seconds": self.load_seconds, "tickets_in_memory": len(self._recent),
+                "tickets_indexed": len(self._index)}
+
+
+class ServerState:
+    """Everything quic_server.py keeps in its state directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.tickets = TicketStore(directory)
+        self.tracker_loaded = threading.Event()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def load_retry_keys(self, handler):
+        try:
+            with open(self.path(RETRY_KEYS_FILE), "rb") as f:
+                handler.restore_keys(f.read())
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            logger.warning(f"⚠️  Ignoring saved Retry keys: {e}")
+
+    def save_retry_keys(self, handler):
+        write_atomic(self.path(RETRY_KEYS_FILE), handler.dump_keys(), mode=0o600)
+
+    def start_loading(self, tracker):
+        """Load tickets and `tracker`'s saved history in the background"""
+        self.tickets.start_loading()
+
+        def load():
+            try:
+                with open(self.path(TRACKER_FILE)) as f:
+                    saved = json.load(f)
+                tracker.saved = {
+                    session: [{**event, "old_address": tuple(event["old_address"] or ()) or None,
+                               "new_address": tuple(event["new_address"] or ()) or None} for event in events]
+                    for session, events in saved.items()
+                }
+            except (FileNotFoundError, ValueError):
+                pass
+            finally:
+                self.tracker_loaded.set()
+
+        threading.Thread(target=load, name="tracker-state", daemon=True).start()
+
+    def save_tracker(self, tracker):
+        """Save the most recently active sessions that may still resume
+
+        Waits for the saved history to finish loading first; saving without
+        it would replace the file with only this run's sessions.
+        """
+        if not self.tracker_loaded.wait(TRACKER_LOAD_TIMEOUT):
+            logger.warning(f"⚠️  Saved migration history still loading, not overwriting {TRACKER_FILE}")
+            return
+        cutoff = time.time() - TICKET_LIFETIME
+        sessions = {**tracker.saved, **tracker.migrations}
+        recent = sorted(
+            ((events[-1]["timestamp"], session) for session, events in sessions.items()
+             if events and events[-1]["timestamp"] > cutoff),
+            reverse=True,
+        )[:TRACKER_SESSIONS]
+        write_atomic(self.path(TRACKER_FILE), json.dumps({s: sessions[s] for _, s in recent}).encode("utf-8"))
+
+    def detector_dir(self) -> str:
+        return self.path(DETECTOR_DIR)
+
+    def close(self):
+        self.tickets.close()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Stalled Client Benchmark
+Checks that server memory stays flat when many downloading clients stall
+
+Every client connects to quic_server.py, starts several file downloads and
+then stops processing packets, as if its path went dead mid-migration. The
+server keeps retransmitting and queuing until its write limits are hit. The
+server RSS and the send-buffer occupancy reported by a STATS request are
+compared between the default write limits and effectively unbounded ones.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from functools import partial
+from typing import Dict, List
+
+from aioquic.asyncio import connect
+
+from load_test import ServerProcess, server_stats
+from quic_client import QuicClientProtocol
+from tuning_profiles import PROFILES, get_profile
+
+FILE_NAME = "stall.bin"
+UNBOUNDED_KIB = 1024 * 1024  # 1 GiB per stream / connection
+
+
+async def _stall_client(host: str, port: int, profile: str, streams: int, stalled: List):
+    tuning = get_profile(profile)
+    configuration = tuning.configuration(is_client=True, verify_mode=False)
+    async with connect(
+        host,
+        port,
+        configuration=configuration,
+        create_protocol=partial(QuicClientProtocol, profile=tuning),
+        wait_connected=True,
+    ) as protocol:
+        quic = protocol._quic
+        for _ in range(streams):
+            stream_id = quic.get_next_available_stream_id()
+            quic.send_stream_data(stream_id, f"GET {FILE_NAME} 0\n".encode('utf-8'), end_stream=True)
+        protocol.transmit()
+        await asyncio.sleep(0.2)  # let the first window arrive
+
+        # stop acknowledging anything: from now on the server's data piles up
+        protocol.datagram_received = lambda data, addr: None
+        stalled.append(protocol)
+        await asyncio.Future()
+
+
+async def run_stall_test(
+    clients: int,
+    streams: int,
+    file_size: int,
+    limits_kib: Dict[str, int],
+    port: int,
+    profile: str,
+    settle: float,
+    host: str = "127.0.0.1",
+) -> Dict:
+    """Stall `clients` downloads and report server memory and buffer occupancy"""
+    with tempfile.TemporaryDirectory() as serve_dir:
+        with open(os.path.join(serve_dir, FILE_NAME), "wb") as f:
+            f.truncate(file_size)
+
+        extra_args = [
+            "--serve-dir", serve_dir,
+            "--stream-buffer-limit", str(limits_kib["stream"]),
+            "--connection-buffer-limit", str(limits_kib["connection"]),
+            "--unsent-buffer-limit", str(limits_kib["unsent"]),
+        ]
+        async with ServerProcess(port=port, profile=profile, extra_args=extra_args) as server:
+            baseline_rss = server.rss_bytes() or 0
+            stalled: List = []
+            tasks = [
+                asyncio.ensure_future(_stall_client(host, port, profile, streams, stalled))
+                for _ in range(clients)
+            ]
+            started = time.monotonic()
+            while len(stalled) < clients and time.monotonic() - started < 30:
+                await asyncio.sleep(0.1)
+
+            peak_rss = 0
+            deadline = time.monotonic() + settle
+            while time.monotonic() < deadline:
+                peak_rss = max(peak_rss, server.rss_bytes() or 0)
+                await asyncio.sleep(0.1)
+            stats = await server_stats(host, port, profile)
+
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        "clients": len(stalled),
+        "baseline_rss_mb": baseline_rss / 2**20,
+        "peak_rss_mb": peak_rss / 2**20,
+        "rss_per_client_kb": (peak_rss - baseline_rss) / max(len(stalled), 1) / 1024,
+        **stats,
+    }
+
+
+def print_report(results: Dict[str, Dict]):
+    print("\n" + "=" * 70)
+    print("🧊 STALLED CLIENT MEMORY")
+    print("=" * 70)
+    for label, result in results.items():
+        print(f"\n📌 {label}: {result['clients']} stalled clients")
+        print(f"   Server RSS:   {result['baseline_rss_mb']:.1f}MB idle → {result['peak_rss_mb']:.1f}MB peak "
+              f"({result['rss_per_client_kb']:.0f} KiB per client)")
+        print(f"   Send buffers: {result['queued_bytes'] / 2**20:.1f}MB queued, "
+              f"{result['unsent_bytes'] / 2**20:.1f}MB never sent")
+        print(f"   Producers:    {result['waiting_producers']} waiting | {result['waits']} waits "
+              f"({result['credit_waits']} on peer credit)")
+    print("\n" + "=" * 70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure server memory while downloading clients stall")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--streams", type=int, default=4, help="downloads per client")
+    parser.add_argument("--file-size", type=int, default=64, help="MiB served per download")
+    parser.add_argument("--settle", type=float, default=3.0, help="seconds to watch RSS after stalling")
+    parser.add_argument("--profile", default="bulk-throughput", choices=list(PROFILES))
+    parser.add_argument("--port", type=int, default=14633)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    runs = {
+        "default write limits": {"stream": 1024, "connection": 4096, "unsent": 256},
+        "unbounded writes": {"stream": UNBOUNDED_KIB, "connection": UNBOUNDED_KIB, "unsent": UNBOUNDED_KIB},
+    }
+    results = {}
+    for label, limits in runs.items():
+        print(f"   running with {label} ...")
+        results[label] = asyncio.run(run_stall_test(
+            args.clients, args.streams, args.file_size * 2**20, limits,
+            args.port, args.profile, args.settle,
+        ))
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import pytest
+
+import address_validation
+from address_validation import (
+    AddressValidation,
+    MigrationRateLimiter,
+    RetryTokenHandler,
+    TokenBucketTable,
+    source_prefix,
+)
+
+ADDR = ("192.0.2.1", 4433)
+ODCID = bytes(range(8))
+RSCID = bytes(range(8, 16))
+
+
+class Clock:
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(address_validation.time, "time", clock)
+    return clock
+
+
+def test_token_round_trip(clock):
+    handler = RetryTokenHandler()
+    assert handler.validate_token(ADDR, handler.create_token(ADDR, ODCID, RSCID)) == (ODCID, RSCID)
+
+
+def test_token_is_bound_to_the_address(clock):
+    handler = RetryTokenHandler()
+    token = handler.create_token(ADDR, ODCID, RSCID)
+    for other in (("192.0.2.2", 4433), ("192.0.2.1", 4434)):
+        with pytest.raises(ValueError, match="MAC"):
+            handler.validate_token(other, token)
+
+
+def test_tampered_token_is_rejected(clock):
+    handler = RetryTokenHandler()
+    token = handler.create_token(ADDR, ODCID, RSCID)
+    for i in range(len(token)):
+        tampered = token[:i] + bytes([token[i] ^ 1]) + token[i + 1:]
+        with pytest.raises(ValueError):
+            handler.validate_token(ADDR, tampered)
+    with pytest.raises(ValueError, match="short"):
+        handler.validate_token(ADDR, token[:10])
+
+
+def test_token_from_another_server_is_rejected(clock):
+    token = RetryTokenHandler().create_token(ADDR, ODCID, RSCID)
+    with pytest.raises(ValueError):
+        RetryTokenHandler().validate_token(ADDR, token)
+
+
+def test_token_expires(clock):
+    handler = RetryTokenHandler(lifetime=10.0)
+    token = handler.create_token(ADDR, ODCID, RSCID)
+    clock.now += 9.9
+    handler.validate_token(ADDR, token)
+    clock.now += 0.2
+    with pytest.raises(ValueError, match="expired"):
+        handler.validate_token(ADDR, token)
+
+
+def test_previous_secret_survives_one_rotation(clock):
+    handler = RetryTokenHandler(rotation_interval=60.0, lifetime=1000.0)
+    token = handler.create_token(ADDR, ODCID, RSCID)
+    clock.now += 60.0
+    handler.create_token(ADDR, ODCID, RSCID)  # rotates
+    assert handler.validate_token(ADDR, token) == (ODCID, RSCID)
+    clock.now += 60.0
+    handler.create_token(ADDR, ODCID, RSCID)  # rotates again: the first secret is gone
+    with pytest.raises(ValueError, match="MAC"):
+        handler.validate_token(ADDR, token)
+
+
+def test_keys_restore_after_restart(clock):
+    handler = RetryTokenHandler()
+    token = handler.create_token(ADDR, ODCID, RSCID)
+    restarted = RetryTokenHandler()
+    restarted.restore_keys(handler.dump_keys())
+    assert restarted.validate_token(ADDR, token) == (ODCID, RSCID)
+    with pytest.raises(ValueError):
+        restarted.restore_keys(handler.dump_keys()[:-1])
+
+
+def test_retry_modes(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(address_validation.time, "monotonic", lambda: now[0])
+
+    assert AddressValidation(retry="off").check(ADDR, b"", ODCID)[0] == AddressValidation.ACCEPT
+
+    always = AddressValidation(retry="always")
+    assert always.check(ADDR, b"", ODCID)[0] == AddressValidation.RETRY
+    token = always.tokens.create_token(ADDR, ODCID, RSCID)
+    assert always.check(ADDR, token, RSCID) == (AddressValidation.ACCEPT, ODCID, RSCID)
+    assert always.check(ADDR, token[:-1] + b"\0", RSCID)[0] == AddressValidation.INVALID
+
+    auto = AddressValidation(retry="auto", load_threshold=5)
+    decisions = [auto.check(ADDR, b"", ODCID)[0] for _ in range(10)]
+    assert decisions[:5] == [AddressValidation.ACCEPT] * 5
+    assert decisions[-1] == AddressValidation.RETRY
+
+    with pytest.raises(ValueError):
+        AddressValidation(retry="sometimes")
+
+
+def test_bucket_allows_burst_then_refills():
+    table = TokenBucketTable(rate=2.0, burst=3.0)
+    assert [table.allow("a", 0.0) for _ in range(4)] == [True, True, True, False]
+    assert not table.allow("a", 0.4)  # 0.8 tokens
+    assert table.allow("a", 0.5)
+    assert table.allow("b", 0.5)  # keys are independent
+    assert table.bucket("a", 100.0)[0] == 3.0  # refill is capped at burst
+
+
+def test_bucket_eviction_keeps_busy_sources():
+    table = TokenBucketTable(rate=1.0, burst=2.0, max_entries=3)
+    table.allow("idle", 0.0)
+    table.allow("busy", 9.5)
+    table.allow("busier", 9.9)
+    table.allow("new", 10.0)  # full: drops buckets that have refilled (idle for >= burst / rate)
+    assert len(table) == 3
+    assert table.bucket("busy", 10.0)[0] < 2.0
+
+
+def test_bucket_table_starts_over_when_everything_is_busy():
+    table = TokenBucketTable(rate=1.0, burst=2.0, max_entries=2)
+    table.allow("a", 10.0)
+    table.allow("b", 10.0)
+    table.allow("c", 10.0)
+    assert len(table) == 1
+
+
+@pytest.mark.parametrize("host, prefix", [
+    ("192.0.2.77", "192.0.2"),
+    ("::ffff:192.0.2.77", "192.0.2"),
+    ("2001:db8:1:2::5", "2001:db8:1::"),
+])
+def test_source_prefix(host, prefix):
+    assert source_prefix(host) == prefix
+
+
+def test_migration_limiter_per_connection(monkeypatch):
+    monkeypatch.setattr(address_validation.time, "monotonic", lambda: 0.0)
+    limiter = MigrationRateLimiter(rate=1.0, burst=2.0, prefix_rate=0)
+    assert [limiter.allow("conn", ("192.0.2.1", p)) for p in range(3)] == [True, True, False]
+    assert limiter.allow("other", ("192.0.2.1", 9))
+    assert limiter.counters == {"new_paths": 4, "paths_allowed": 3,
+                                "limited_by_connection": 1, "limited_by_prefix": 0}
+
+
+def test_migration_limiter_prefix_refusal_spends_no_connection_token(monkeypatch):
+    monkeypatch.setattr(address_validation.time, "monotonic", lambda: 0.0)
+    limiter = MigrationRateLimiter(rate=1.0, burst=2.0, prefix_rate=1.0, prefix_burst=1.0)
+    assert limiter.allow("conn", ("192.0.2.1", 1))
+    assert not limiter.allow("conn", ("192.0.2.2", 2))  # same /24, prefix bucket empty
+    assert limiter.counters["limited_by_prefix"] == 1
+    assert limiter.allow("conn", ("198.51.100.1", 3))  # the connection still has its second token
@@ -0,0 +1,134 @@
+import asyncio
+import gc
+
+import pytest
+
+from flow_control import StreamWriter
+
+
+class FakeSender:
+    def __init__(self):
+        self._buffer_start = 0
+        self._buffer_stop = 0
+        self.highest_offset = 0
+
+
+class FakeStream:
+    def __init__(self):
+        self.sender = FakeSender()
+        self.max_stream_data_remote = 1 << 30
+
+
+class FakeQuic:
+    """Just the QuicConnection state StreamWriter reads"""
+
+    def __init__(self, streams=(0,)):
+        self._streams = {stream_id: FakeStream() for stream_id in streams}
+        self._remote_max_data = 1 << 30
+        self._remote_max_data_used = 0
+        self.sent = []
+
+    def send_stream_data(self, stream_id, data, end_stream=False):
+        self.sent.append((stream_id, bytes(data), end_stream))
+        self._streams[stream_id].sender._buffer_stop += len(data)
+
+    def ack(self, stream_id):
+        sender = self._streams[stream_id].sender
+        sender._buffer_start = sender.highest_offset = sender._buffer_stop
+
+
+def _writer(quic, **limits):
+    return StreamWriter(quic, lambda: None, **{"stream_limit": 100, "connection_limit": 1000,
+                                                "unsent_limit": 1000, **limits})
+
+
+def test_send_that_fits_is_queued_immediately():
+    async def run():
+        quic = FakeQuic()
+        writer = _writer(quic)
+        assert writer.send(0, b"x" * 100) is None
+        assert quic.sent == [(0, b"x" * 100, False)]
+        assert not writer.has_pending(0)
+
+    asyncio.run(run())
+
+
+def test_room_is_the_tightest_limit():
+    quic = FakeQuic()
+    writer = _writer(quic, connection_limit=60)
+    assert writer.room(0) == 60
+    quic.send_stream_data(0, b"x" * 50)
+    assert writer.room(0) == 10
+    quic._streams[0].max_stream_data_remote = 40
+    assert writer.room(0) == 10  # credit slack still allows 64 KiB past the credit
+    assert writer.room(7) == 0  # unknown stream
+
+
+def test_writes_to_a_stream_stay_in_order():
+    async def run():
+        quic = FakeQuic()
+        writer = _writer(quic)
+        big = writer.send(0, b"a" * 250)  # more than the stream limit: written in pieces
+        small = writer.send(0, b"b", end_stream=True)  # would fit, but must wait behind `big`
+        assert small is not None and writer.has_pending(0)
+        while not small.done():
+            await asyncio.sleep(0)
+            quic.ack(0)
+            writer.resume()
+        await small
+        await asyncio.sleep(0)  # done callbacks
+        assert big.done()
+        assert b"".join(data for _, data, _ in quic.sent) == b"a" * 250 + b"b"
+        assert quic.sent[-1][2] is True
+        assert not writer.has_pending(0)
+
+    asyncio.run(run())
+
+
+def test_other_streams_are_not_held_up():
+    async def run():
+        quic = FakeQuic(streams=(0, 4))
+        writer = _writer(quic)
+        assert writer.send(0, b"a" * 250) is not None
+        assert writer.send(4, b"c") is None
+        assert quic.sent[-1] == (4, b"c", False)
+        writer.close()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+
+
+def test_failed_queued_writes_are_consumed():
+    errors = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        quic = FakeQuic()
+        writer = _writer(quic)
+        tasks = [writer.send(0, b"a" * 250), writer.send(0, b"b")]
+        await asyncio.sleep(0)
+        writer.close()
+        await asyncio.wait(tasks)
+        await asyncio.sleep(0)
+        assert not writer.pending
+        assert writer.metrics.aborted == 2
+        del tasks
+        gc.collect()  # an unretrieved task exception is reported when the task is collected
+
+    asyncio.run(run())
+    assert not errors
+
+
+def test_write_raises_once_the_stream_is_gone():
+    async def run():
+        quic = FakeQuic()
+        writer = _writer(quic)
+        task = asyncio.ensure_future(writer.write(0, b"a" * 250))
+        await asyncio.sleep(0)
+        del quic._streams[0]
+        writer.resume()
+        with pytest.raises(ConnectionError):
+            await task
+        assert writer.metrics.aborted == 1
+
+    asyncio.run(run())
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from migration_detector import RECORD_DTYPE, MigrationAnomalyDetector, SyntheticWorkload
+from migration_log import connection_key
+
+
+def _migrate(detector, conn_id, count, interval, addresses=2, start=0.0):
+    """`count` migrations `interval` seconds apart, cycling through `addresses` addresses"""
+    flags = []
+    for i in range(count):
+        old = (f"10.0.{i % addresses // 256}.{i % addresses % 256}", 443)
+        new = (f"10.0.{(i + 1) % addresses // 256}.{(i + 1) % addresses % 256}", 443)
+        flags += detector.observe(conn_id, old, new, timestamp=start + i * interval)
+    return flags
+
+
+def test_rejects_bad_sizes():
+    with pytest.raises(ValueError):
+        MigrationAnomalyDetector(slots=1000)
+    with pytest.raises(ValueError):
+        MigrationAnomalyDetector(registers=8)
+
+
+def test_fast_connection_is_flagged_once_past_min_migrations():
+    detector = MigrationAnomalyDetector(max_rate=1.0, min_migrations=5, seed=1)
+    flags = _migrate(detector, "fast", 4, 0.05)
+    assert flags == []  # fast, but below min_migrations
+    flags = _migrate(detector, "fast", 10, 0.05, start=0.2)
+    assert len(flags) == 1
+    (flag,) = flags
+    assert flag["connection_key"] == connection_key("fast")
+    assert flag["reasons"] == ["rate"]
+    assert flag["rate"] > 1.0 and flag["migrations"] >= 5
+
+
+def test_slow_connection_with_few_addresses_is_not_flagged():
+    detector = MigrationAnomalyDetector(max_rate=1.0, max_addresses=16, seed=1)
+    assert _migrate(detector, "commuter", 50, 60.0) == []
+
+
+def test_wide_spread_is_flagged_even_when_slow():
+    detector = MigrationAnomalyDetector(max_rate=1.0, max_addresses=16, seed=1)
+    flags = _migrate(detector, "exfil", 40, 60.0, addresses=40)
+    assert [flag["reasons"] for flag in flags] == [["spread"]]
+    assert flags[0]["rate"] < 1.0
+
+
+def test_zero_threshold_disables_that_check():
+    detector = MigrationAnomalyDetector(max_rate=0, max_addresses=16, seed=1)
+    assert _migrate(detector, "fast", 50, 0.01) == []
+
+
+def test_rate_decays_with_time_constant():
+    detector = MigrationAnomalyDetector(tau=10.0, seed=1)
+    _migrate(detector, "conn", 1, 0.0)
+    slot = np.flatnonzero(detector._owner == np.uint64(connection_key("conn")))
+    assert detector._rate[slot][0] == pytest.approx(0.1)
+    _migrate(detector, "conn", 1, 0.0, start=10.0)
+    assert detector._rate[slot][0] == pytest.approx(0.1 * np.exp(-1) + 0.1)
+
+
+@pytest.mark.parametrize("distinct", [5, 50, 500])
+def test_address_estimate_is_close(distinct):
+    detector = MigrationAnomalyDetector(registers=64, max_addresses=0, max_rate=0, seed=1)
+    _migrate(detector, "conn", distinct, 1.0, addresses=distinct)
+    slot = np.flatnonzero(detector._owner == np.uint64(connection_key("conn")))
+    assert detector.address_estimate(slot)[0] == pytest.approx(distinct, rel=0.35)
+
+
+def test_idle_slot_is_reset_for_a_new_connection():
+    detector = MigrationAnomalyDetector(slots=1, min_migrations=1, max_rate=0, max_addresses=3,
+                                        idle_reset=300.0, seed=1)
+    _migrate(detector, "old", 10, 1.0, addresses=10)
+    assert detector._flagged[0]
+    flags = _migrate(detector, "new", 1, 1.0, start=1000.0)
+    assert flags == [] and not detector._flagged[0] and detector._count[0] == 1
+
+
+def test_busy_slot_is_shared_not_reset():
+    detector = MigrationAnomalyDetector(slots=1, max_rate=0, max_addresses=0, seed=1)
+    _migrate(detector, "a", 3, 1.0)
+    _migrate(detector, "b", 3, 1.0, start=3.0)
+    assert detector._count[0] == 6
+
+
+def test_save_and_restore(tmp_path):
+    detector = MigrationAnomalyDetector(slots=256, seed=7)
+    detector.observe_records(SyntheticWorkload(normal=100, anomalous=5).batch(5000))
+    detector.save(str(tmp_path))
+
+    restored = MigrationAnomalyDetector(slots=256, seed=1)
+    assert restored.restore(str(tmp_path))
+    assert restored._seed == detector._seed
+    np.testing.assert_array_equal(restored._hll, detector._hll)
+    np.testing.assert_array_equal(restored.flagged_keys(), detector.flagged_keys())
+    assert not MigrationAnomalyDetector(slots=512).restore(str(tmp_path))
+
+
+def test_synthetic_exfiltration_is_caught_without_false_positives():
+    detector = MigrationAnomalyDetector(seed=1)
+    workload = SyntheticWorkload(normal=2000, anomalous=20)
+    flags = []
+    for _ in range(20):
+        flags += detector.observe_records(workload.batch(10_000))
+    flagged = {flag["connection_key"] for flag in flags}
+    assert flagged == set(range(20))
+
+
+def test_empty_batch():
+    assert MigrationAnomalyDetector().observe_records(np.zeros(0, dtype=RECORD_DTYPE)) == []
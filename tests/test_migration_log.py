@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+from migration_log import (
+    CONNECTIONS_FILE,
+    HEADER_SIZE,
+    RECORD_SIZE,
+    MigrationEventLog,
+    MigrationLogReader,
+    connection_key,
+    decode_record,
+    encode_record,
+)
+
+
+def _write(directory, events, **kwargs):
+    with MigrationEventLog(str(directory), **kwargs) as log:
+        for timestamp, conn_id, number in events:
+            log.append(conn_id, ("192.0.2.1", 4000 + number), ("2001:db8::1", 5000 + number), number,
+                       timestamp=timestamp)
+    return log
+
+
+def test_record_round_trip():
+    record = decode_record(encode_record(1700000000.25, "abc-01", ("192.0.2.1", 443), ("2001:db8::7", 8443), 3))
+    assert record.timestamp == 1700000000.25
+    assert record.connection_key == connection_key("abc-01")
+    assert record.old_address == ("192.0.2.1", 443)
+    assert record.new_address == ("2001:db8::7", 8443)
+    assert record.migration_number == 3
+
+
+def test_record_without_addresses():
+    record = decode_record(encode_record(1.0, "abc-01", None, None, 0))
+    assert record.old_address is None and record.new_address is None
+
+
+def test_records_are_fixed_width():
+    assert len(encode_record(1.0, "a-" * 100, ("10.0.0.1", 1), ("10.0.0.2", 2), 1)) == RECORD_SIZE
+
+
+def test_rotation_and_scan(tmp_path):
+    _write(tmp_path, [(100.0 + i, f"conn-{i % 3}", i) for i in range(10)], segment_records=4)
+    segments = sorted(n for n in os.listdir(tmp_path) if n.endswith(".mlog"))
+    assert len(segments) == 3
+    assert os.path.getsize(tmp_path / segments[0]) == HEADER_SIZE + 4 * RECORD_SIZE
+
+    with MigrationLogReader(str(tmp_path)) as reader:
+        assert len(reader) == 10
+        assert [r.migration_number for r in reader] == list(range(10))
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    (103.0, 107.0, [3, 4, 5, 6]),  # crosses a segment boundary
+    (103.5, None, [4, 5, 6, 7, 8, 9]),
+    (None, 102.0, [0, 1]),
+    (50.0, 100.5, [0]),  # before the first record
+    (200.0, None, []),  # after the last record
+])
+def test_scan_time_range(tmp_path, start, end, expected):
+    _write(tmp_path, [(100.0 + i, "conn", i) for i in range(10)], segment_records=4)
+    with MigrationLogReader(str(tmp_path)) as reader:
+        assert [r.migration_number for r in reader.scan(start=start, end=end)] == expected
+
+
+def test_first_after(tmp_path):
+    _write(tmp_path, [(100.0 + i, "conn", i) for i in range(10)], segment_records=4)
+    with MigrationLogReader(str(tmp_path)) as reader:
+        assert reader.first_after(107.5).migration_number == 8
+        assert reader.first_after(110.0) is None
+
+
+def test_scan_by_connection_and_id_table(tmp_path):
+    _write(tmp_path, [(100.0 + i, f"conn-{i % 3}", i) for i in range(9)], segment_records=4)
+    with MigrationLogReader(str(tmp_path)) as reader:
+        key = connection_key("conn-1")
+        assert [r.migration_number for r in reader.scan(connection_key=key)] == [1, 4, 7]
+        assert reader.connection_id(key) == "conn-1"
+        assert reader.connection_id(12345) == "12345"
+
+
+def test_reopen_resumes_tail_segment_and_keeps_ids_unique(tmp_path):
+    _write(tmp_path, [(100.0, "conn-a", 1)], segment_records=4)
+    _write(tmp_path, [(101.0, "conn-a", 2), (102.0, "conn-b", 3)], segment_records=4)
+    assert len([n for n in os.listdir(tmp_path) if n.endswith(".mlog")]) == 1
+    with open(tmp_path / CONNECTIONS_FILE) as f:
+        assert [line.split(" ", 1)[1].strip() for line in f] == ["conn-a", "conn-b"]
+    with MigrationLogReader(str(tmp_path)) as reader:
+        assert [r.migration_number for r in reader] == [1, 2, 3]
+
+
+def test_torn_record_is_dropped_on_reopen(tmp_path):
+    _write(tmp_path, [(100.0, "conn", 1)])
+    (segment,) = [tmp_path / n for n in os.listdir(tmp_path) if n.endswith(".mlog")]
+    with open(segment, "ab") as f:
+        f.write(b"\x00" * (RECORD_SIZE // 2))
+    _write(tmp_path, [(101.0, "conn", 2)])
+    assert os.path.getsize(segment) == HEADER_SIZE + 2 * RECORD_SIZE
+    with MigrationLogReader(str(tmp_path)) as reader:
+        assert [r.migration_number for r in reader] == [1, 2]
+
+
+def test_unencodable_event_is_dropped_not_fatal(tmp_path):
+    with MigrationEventLog(str(tmp_path)) as log:
+        log.append("conn", ("not an address", 1), None, 1, timestamp=100.0)
+        log.append("conn", ("192.0.2.1", 1), None, 2, timestamp=101.0)
+    assert log.records_dropped == 1 and log.records_written == 1
+    with MigrationLogReader(str(tmp_path)) as reader:
+        assert [r.migration_number for r in reader] == [2]
@@ -0,0 +1,140 @@
+import datetime
+import os
+import time
+
+import pytest
+from aioquic.tls import CipherSuite, SessionTicket
+
+from session_state import TICKET_KEY_FILE, TicketStore, decode_ticket, encode_ticket
+
+UTC = datetime.timezone.utc
+
+
+def _ticket(ticket_id: bytes = b"t" * 64, lifetime: float = 3600.0, **fields) -> SessionTicket:
+    now = datetime.datetime.now(UTC).replace(microsecond=0)
+    return SessionTicket(**{
+        "age_add": 12345,
+        "cipher_suite": CipherSuite.AES_128_GCM_SHA256,
+        "not_valid_after": now + datetime.timedelta(seconds=lifetime),
+        "not_valid_before": now,
+        "resumption_secret": os.urandom(32),
+        "server_name": "localhost",
+        "ticket": ticket_id,
+        "max_early_data_size": 0xFFFFFFFF,
+        "other_extensions": [],
+        **fields,
+    })
+
+
+def _reopen(directory) -> TicketStore:
+    store = TicketStore(str(directory))
+    store.start_loading()
+    assert store.ready.wait(5)
+    return store
+
+
+@pytest.mark.parametrize("fields", [
+    {},
+    {"server_name": None, "max_early_data_size": None},
+    {"server_name": "ü.example", "other_extensions": [(0x1234, b"abc"), (7, b"")]},
+])
+def test_ticket_round_trip(fields):
+    ticket = _ticket(**fields)
+    decoded, session = decode_ticket(ticket.ticket, encode_ticket(ticket, "7f8a1c2b3d40-9e1f04c2"))
+    assert decoded == ticket
+    assert session == "7f8a1c2b3d40-9e1f04c2"
+
+
+def test_in_memory_tickets_are_single_use():
+    store = TicketStore()
+    ticket = _ticket()
+    store.add(ticket, "session")
+    assert store.fetch(ticket.ticket) == (ticket, "session")
+    assert store.fetch(ticket.ticket) is None
+    assert store.counters["resumed"] == 1 and store.counters["ticket_misses"] == 1
+
+
+def test_tickets_survive_a_restart(tmp_path):
+    store = TicketStore(str(tmp_path))
+    ticket = _ticket()
+    store.add(ticket, "session")
+    store.close()
+    assert os.stat(tmp_path / TICKET_KEY_FILE).st_mode & 0o777 == 0o600
+
+    restarted = _reopen(tmp_path)
+    assert restarted.counters["tickets_loaded"] == 1
+    assert restarted.fetch(ticket.ticket) == (ticket, "session")
+    assert restarted.counters["resumed_from_disk"] == 1
+    restarted.close()
+
+
+def test_tombstone_stops_reuse_across_restarts(tmp_path):
+    store = TicketStore(str(tmp_path))
+    used, unused = _ticket(b"u" * 64), _ticket(b"n" * 64)
+    store.add(used, "a")
+    store.add(unused, "b")
+    assert store.fetch(used.ticket) is not None
+    store.close()
+
+    restarted = _reopen(tmp_path)
+    assert restarted.fetch(used.ticket) is None
+    assert restarted.fetch(unused.ticket) == (unused, "b")
+    restarted.close()
+
+    # and the second resumption's tombstone is honoured by the next run too
+    third = _reopen(tmp_path)
+    assert third.counters["tickets_loaded"] == 0
+    third.close()
+
+
+def test_expired_tickets_are_not_indexed(tmp_path):
+    store = TicketStore(str(tmp_path))
+    store.add(_ticket(b"e" * 64, lifetime=-1.0), "expired")
+    store.add(_ticket(b"v" * 64), "valid")
+    store.close()
+    restarted = _reopen(tmp_path)
+    assert restarted.fetch(b"e" * 64) is None
+    assert restarted.fetch(b"v" * 64) is not None
+    restarted.close()
+
+
+def test_tickets_under_another_key_are_unreadable(tmp_path):
+    store = TicketStore(str(tmp_path))
+    ticket = _ticket()
+    store.add(ticket, "session")
+    store.close()
+    os.unlink(tmp_path / TICKET_KEY_FILE)
+    restarted = _reopen(tmp_path)
+    assert restarted.fetch(ticket.ticket) is None
+    restarted.close()
+
+
+def test_expired_segments_are_deleted_at_load(tmp_path):
+    store = TicketStore(str(tmp_path), lifetime=60.0)
+    store.add(_ticket(), "session")
+    store.close()
+    (segment,) = [n for n in os.listdir(tmp_path) if n.startswith("tickets-")]
+    old = time.time() - 120
+    os.utime(tmp_path / segment, (old, old))
+    restarted = TicketStore(str(tmp_path), lifetime=60.0)
+    restarted.start_loading()
+    assert restarted.ready.wait(5)
+    assert segment not in os.listdir(tmp_path)
+    restarted.close()
+
+
+def test_expired_in_memory_tickets_are_dropped_on_add():
+    store = TicketStore()
+    store.add(_ticket(b"e" * 64, lifetime=-1.0), "expired")
+    store.add(_ticket(b"v" * 64), "valid")
+    assert store.snapshot()["tickets_in_memory"] == 1
+    assert store.fetch(b"e" * 64) is None
+
+
+def test_recent_tickets_are_capped_oldest_first():
+    store = TicketStore(max_recent=3)
+    for i in range(5):
+        store.add(_ticket(bytes([i]) * 64), f"s{i}")
+    assert store.snapshot()["tickets_in_memory"] == 3
+    assert store.fetch(bytes([0]) * 64) is None and store.fetch(bytes([1]) * 64) is None
+    assert store.fetch(bytes([4]) * 64) is not None
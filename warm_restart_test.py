@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Warm Restart Benchmark
+Reconnect storm after a server restart, with and without persisted tickets
+
+Clients connect once and keep the session ticket the server gives them.
+The server is then restarted and every client reconnects at the same
+moment, presenting its ticket and sending its first request as 0-RTT data.
+A cold restart has lost its ticket store, so every client falls back to a
+full handshake (RSA signature included); a warm restart (`--state-dir`)
+resumes them.
+
+Reported per mode: time until the restarted server accepts handshakes,
+time until its ticket index is loaded, the server CPU spent on the storm,
+time to first response, and how many clients resumed or got 0-RTT
+accepted. `--stored-tickets` pads the state directory with extra tickets
+to show that a large store does not delay startup.
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from functools import partial
+from typing import Dict, List, Optional
+
+from aioquic.asyncio import connect
+from aioquic.tls import CipherSuite, SessionTicket
+
+from load_test import ServerProcess, percentile, server_stats
+from quic_client import QuicClientProtocol, send_message
+from session_state import TicketStore
+from tuning_profiles import DEFAULT_PROFILE, PROFILES, get_profile
+
+
+class Client:
+    def __init__(self):
+        self.ticket: Optional[SessionTicket] = None
+        self.first_response: Optional[float] = None
+        self.resumed = False
+        self.early_data = False
+
+
+async def _session(client: Client, host: str, port: int, profile: str, timeout: float, keep_ticket: bool):
+    """One connection: present the saved ticket (if any), send a request right away"""
+    tuning = get_profile(profile)
+    configuration = tuning.configuration(is_client=True, verify_mode=False)
+    configuration.session_ticket = client.ticket
+
+    def store(ticket: SessionTicket):
+        client.ticket = ticket
+
+    started = time.perf_counter()
+    async with connect(host, port, configuration=configuration, session_ticket_handler=store,
+                       create_protocol=partial(QuicClientProtocol, profile=tuning),
+                       wait_connected=False) as protocol:
+        await asyncio.wait_for(send_message(protocol, "hello"), timeout)
+        client.first_response = time.perf_counter() - started
+        tls = protocol._quic.tls
+        client.resumed = tls.session_resumed
+        client.early_data = tls.early_data_accepted
+        # the ticket arrives right after the handshake; give it a moment
+        deadline = time.monotonic() + timeout
+        while keep_ticket and client.ticket is configuration.session_ticket and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+
+async def _run_all(clients: List[Client], host: str, port: int, profile: str, timeout: float,
+                   concurrency: int, keep_ticket: bool = False) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(client: Client):
+        async with semaphore:
+            await _session(client, host, port, profile, timeout, keep_ticket)
+
+    outcomes = await asyncio.gather(*(bounded(c) for c in clients), return_exceptions=True)
+    return sum(isinstance(o, Exception) for o in outcomes)
+
+
+def pad_ticket_store(directory: str, count: int):
+    """Append `count` extra (never presented) tickets to a state directory"""
+    store = TicketStore(directory)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for _ in range(count):
+        store.add(SessionTicket(
+            age_add=0, cipher_suite=CipherSuite.AES_128_GCM_SHA256,
+            not_valid_after=now + datetime.timedelta(days=1), not_valid_before=now,
+            resumption_secret=os.urandom(32), server_name="localhost", ticket=os.urandom(64),
+        ), "padding")
+    store.close()
+
+
+async def run_restart(
+    mode: str,
+    clients: int,
+    stored_tickets: int,
+    concurrency: int,
+    timeout: float,
+    port: int,
+    profile: str,
+    host: str = "127.0.0.1",
+) -> Dict:
+    """Connect, restart the server (`mode` "cold" or "warm"), then reconnect all at once"""
+    state_dir = tempfile.mkdtemp(prefix="quic-state-")
+    server_args = ["--state-dir", state_dir] if mode == "warm" else []
+    population = [Client() for _ in range(clients)]
+    try:
+        async with ServerProcess(port=port, profile=profile, extra_args=server_args):
+            errors = await _run_all(population, host, port, profile, timeout, concurrency, keep_ticket=True)
+        if errors:
+            raise RuntimeError(f"{errors} clients failed before the restart")
+        if stored_tickets and mode == "warm":
+            pad_ticket_store(state_dir, stored_tickets)
+
+        server = ServerProcess(port=port, profile=profile, extra_args=server_args, probe_timeout=0.05)
+        started = time.monotonic()
+        await server.start()
+        ready = time.monotonic() - started
+        try:
+            cpu_before = server.cpu_seconds() or 0.0
+            storm_started = time.monotonic()
+            errors = await _run_all(population, host, port, profile, timeout, clients)
+            storm = time.monotonic() - storm_started
+            cpu = (server.cpu_seconds() or 0.0) - cpu_before
+            stats = await server_stats(host, port, profile)
+        finally:
+            await server.stop()
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    responses = [c.first_response for c in population if c.first_response is not None]
+    return {
+        "mode": mode,
+        "clients": clients,
+        "ready_seconds": ready,
+        "index_seconds": stats.get("tickets_index_seconds", 0.0),
+        "tickets_loaded": stats.get("tickets_loaded", 0),
+        "storm_seconds": storm,
+        "storm_cpu_seconds": cpu,
+        "errors": errors,
+        "resumed": sum(c.resumed for c in population),
+        "early_data": sum(c.early_data for c in population),
+        "first_response_p50": statistics.median(responses) if responses else float("nan"),
+        "first_response_p99": percentile(responses, 0.99),
+    }
+
+
+def print_report(results: List[Dict]):
+    print("\n" + "=" * 70)
+    print("♻️  RESTART RECONNECT STORM: COLD vs WARM")
+    print("=" * 70)
+    for r in results:
+        print(f"\n📌 {r['mode']} restart ({r['clients']} clients)")
+        print(f"   Ready:          accepting handshakes after {r['ready_seconds'] * 1000:.0f}ms "
+              f"| ticket index {r['index_seconds'] * 1000:.0f}ms ({r['tickets_loaded']:,} tickets)")
+        print(f"   Storm:          {r['storm_cpu_seconds']:.2f}s server CPU over {r['storm_seconds']:.2f}s "
+              f"| errors {r['errors']}")
+        print(f"   Resumed:        {r['resumed']}/{r['clients']} | 0-RTT accepted {r['early_data']}")
+        print(f"   First response: p50 {r['first_response_p50'] * 1000:.0f}ms "
+              f"| p99 {r['first_response_p99'] * 1000:.0f}ms")
+    print("\n" + "=" * 70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare reconnect storms after cold and warm server restarts")
+    parser.add_argument("--mode", action="append", choices=["cold", "warm"],
+                        help="restart style (repeatable, default: both)")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--stored-tickets", type=int, default=100_000,
+                        help="extra tickets in the warm server's store")
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent clients before the restart")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=list(PROFILES))
+    parser.add_argument("--port", type=int, default=15033)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    results = []
+    for mode in args.mode or ["cold", "warm"]:
+        print(f"   restarting {mode} ...")
+        results.append(asyncio.run(run_restart(
+            mode, args.clients, args.stored_tickets, args.concurrency, args.timeout, args.port, args.profile,
+        )))
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()